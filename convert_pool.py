@@ -0,0 +1,104 @@
+"""
+Конвертация экспортов, скачанных Excel-парсерами в память, без отдельного запуска python
+на каждый файл. Конвертер (export_converter и pandas) импортируется один раз: processes = 1 —
+экспорты конвертируются по мере скачивания в этом же процессе, больше 1 — в пуле процессов.
+Ошибка или падение конвертации одного экспорта не прерывает остальные; вывод конвертера
+собирается по экспорту и печатается целиком, в порядке скачивания. XLSX и JSON части на диск
+не пишутся: результат конвертации сразу добавляется в объединение (merge_*.py), а на диск
+попадают только итоговые файлы объединения и, по желанию, архив исходных XLSX.
+"""
+
+import contextlib
+import io
+import os
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from export_converter import convert_data
+
+
+def report_file(filename: str, ok: bool, output: str) -> None:
+    print(f"\n[>>] Конвертирую: {filename}")
+    print(output, end="")
+    if ok:
+        print(f"[OK] Конвертация завершена")
+    else:
+        print(f"[ERROR] Конвертация завершилась с ошибкой")
+
+
+def convert_bytes(dataset: str, filename: str, data: bytes) -> Tuple[Optional[Dict[str, Any]], str]:
+    """(результат или None, вывод конвертера) для экспорта в памяти"""
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            result = convert_data(dataset, io.BytesIO(data), filename)
+    except Exception:
+        output.write(traceback.format_exc())
+        return None, output.getvalue()
+    return result, output.getvalue()
+
+
+def archive_export(archive_dir: str, filename: str, data: bytes) -> None:
+    try:
+        with open(os.path.join(archive_dir, filename), "wb") as f:
+            f.write(data)
+    except OSError as e:
+        print(f"[WARNING] Не удалось сохранить {filename} в архив: {e}")
+
+
+class ExportCollector:
+    """Экспорты набора dataset, скачанные в память: конвертация (в пуле процессов при
+    processes > 1) и добавление в merge (объект *Merge из merge_*.py) в порядке скачивания"""
+
+    def __init__(self, dataset: str, merge: Any, processes: int = 1, archive_dir: Optional[str] = None) -> None:
+        self.dataset = dataset
+        self.merge = merge
+        self.archive_dir = archive_dir
+        self.executor = ProcessPoolExecutor(max_workers=processes) if processes > 1 else None
+        self.pending: List[Tuple[str, Future]] = []
+        self.downloaded = 0
+        self.converted = 0
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+
+    def add(self, filename: str, data: bytes) -> None:
+        """filename — имя, под которым экспорт раньше сохранялся на диск (по нему merge
+        определяет город и тип)"""
+        self.downloaded += 1
+        if self.archive_dir:
+            archive_export(self.archive_dir, filename, data)
+        if self.executor is None:
+            self.merge_result(filename, *convert_bytes(self.dataset, filename, data))
+        else:
+            self.pending.append((filename, self.executor.submit(convert_bytes, self.dataset, filename, data)))
+
+    def merge_result(self, filename: str, result: Optional[Dict[str, Any]], output: str) -> None:
+        report_file(filename, result is not None, output)
+        if result is None:
+            return
+        self.converted += 1
+        # Имя JSON части, которую раньше объединял merge_*.py
+        self.merge.add_part(os.path.splitext(filename)[0] + ".json", result)
+
+    def finish(self, completed: bool = True) -> int:
+        """Дожидается конвертаций и сохраняет объединение, возвращает число сконвертированных
+        экспортов. Итоговые файлы заменяются только после полного обхода (completed=True);
+        прерванный обход пишется в *.partial.json, а без сконвертированных экспортов не пишется ничего"""
+        for filename, future in self.pending:
+            try:
+                result, output = future.result()
+            except Exception as e:
+                # Процесс пула упал (не исключение конвертера): экспорт считается неудачным
+                result, output = None, f"[ERROR] Процесс конвертации завершился аварийно: {e}\n"
+            self.merge_result(filename, result, output)
+        self.pending = []
+        if self.executor is not None:
+            self.executor.shutdown()
+        if self.converted == 0:
+            print("[WARNING] Нет файлов для объединения, итоговые файлы не изменены")
+            return 0
+        self.merge.save(partial=not completed)
+        if not completed:
+            print("[WARNING] Обход прерван: объединение сохранено в *.partial.json, итоговые файлы не изменены")
+        return self.converted
@@ -1,96 +1,11 @@
-import pandas as pd
-import json
-import os
-import sys
+"""Конвертация XLSX экспорта Property Data (Dashboard 996) в JSON, см. export_converter.py"""
 
-def convert_xlsx_to_json(xlsx_file):
+from export_converter import convert_export, main
 
-    print(f"\n[START] Конвертация: {os.path.basename(xlsx_file)}")
 
-    df = pd.read_excel(xlsx_file, skiprows=2)
+def convert_xlsx_to_json(xlsx_file, output_file=None):
+    return convert_export("property_data", xlsx_file, output_file)
 
-    print(f"[INFO] Прочитано строк: {len(df)}")
-    print(f"[INFO] Колонки: {df.columns.tolist()}")
-
-    if 'Average Sales Price' in df.columns:
-        price_column = 'Average Sales Price'
-        price_key = 'average_sales_price'
-        print(f"[INFO] Тип данных: Sales")
-    elif 'Average Rent Price' in df.columns:
-        price_column = 'Average Rent Price'
-        price_key = 'average_rent_price'
-        print(f"[INFO] Тип данных: Rent")
-    else:
-        print(f"[ERROR] Не найдена колонка с ценой")
-        return None
-
-    df = df.dropna(subset=['Date', price_column, 'Property'])
-
-    print(f"[INFO] После очистки: {len(df)} строк")
-
-    if len(df) == 0:
-        print(f"[WARNING] Нет данных для конвертации")
-
-        json_file = xlsx_file.replace('.xlsx', '.json')
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump({}, f, ensure_ascii=False, indent=2)
-        print(f"[OK] Создан пустой JSON: {os.path.basename(json_file)}")
-        return json_file
-
-    df['Date'] = pd.to_datetime(df['Date']).dt.strftime('%d.%m.%Y')
-
-    result = {}
-
-    for _, row in df.iterrows():
-        date = row['Date']
-        property_name = row['Property']
-        price = round(float(row[price_column]), 2)
-
-        if date not in result:
-            result[date] = {}
-
-        result[date][property_name] = {
-            price_key: price
-        }
-
-    json_file = xlsx_file.replace('.xlsx', '.json')
-
-    with open(json_file, 'w', encoding='utf-8') as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
-
-    total_records = sum(len(props) for props in result.values())
-
-    print(f"[OK] Конвертация завершена")
-    print(f"[INFO] Уникальных дат: {len(result)}")
-    print(f"[INFO] Всего записей: {total_records}")
-    print(f"[INFO] Сохранено в: {os.path.basename(json_file)}")
-
-    try:
-        os.remove(xlsx_file)
-        print(f"[OK] Удален исходный файл: {os.path.basename(xlsx_file)}")
-    except Exception as e:
-        print(f"[WARNING] Не удалось удалить файл {xlsx_file}: {e}")
-
-    return json_file
 
 if __name__ == "__main__":
-
-    xlsx_file = os.environ.get('XLSX_FILE') or (sys.argv[1] if len(sys.argv) > 1 else None)
-
-    if not xlsx_file:
-        print("[ERROR] Не указан файл для конвертации")
-        print("[INFO] Использование: XLSX_FILE=path/to/file.xlsx python convert_property_data.py")
-        print("[INFO] Или: python convert_property_data.py path/to/file.xlsx")
-        sys.exit(1)
-
-    if not os.path.exists(xlsx_file):
-        print(f"[ERROR] Файл не найден: {xlsx_file}")
-        sys.exit(1)
-
-    result = convert_xlsx_to_json(xlsx_file)
-
-    if result:
-        print(f"\n[SUCCESS] Файл успешно сконвертирован")
-    else:
-        print(f"\n[ERROR] Ошибка конвертации")
-        sys.exit(1)
+    main("property_data")
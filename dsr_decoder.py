@@ -0,0 +1,171 @@
+"""
+Декодер DSR (data shape result) ответов Power BI /query.
+Один проход по строкам DM превращает сжатый формат в колонки:
+- S — схема колонок строки (имя N, словарь значений DN), действует до следующей S;
+- C — значения колонок подряд, без повторённых и пустых;
+- R — битовая маска колонок, повторяющих значение предыдущей строки;
+- Ø — битовая маска пустых (null) колонок;
+- DN — значение колонки хранится индексом в ds.ValueDicts[DN] (D0, D1, ...);
+- X — ячейки вторичной оси (колонки матрицы); I — индекс ячейки на оси, без I — следующий
+  за предыдущим, подписи оси берутся из SH.
+Строки всех PH набора данных идут подряд (окна данных с токенами RT склеиваются).
+IC (IsComplete) набора данных: false — Power BI вернул только окно строк (дальше нужен запрос
+с токеном RT), такие таблицы помечаются complete=False. Без IC набор неполный, если есть RT.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+CONTROL_KEYS = {"S", "C", "R", "Ø", "X", "I", "RT", "IC"}
+
+Schema = List[Tuple[str, Optional[str]]]
+
+
+class DsrTable:
+    """Декодированный DM: колонки строк и ячейки вторичной оси (длинный формат: row, I, меры).
+    Колонки — списки Python: таблицы DM короткие, извлекатели берут отдельные значения и
+    проверяют None; массивы NumPy здесь только добавили бы преобразование. Для векторной
+    обработки — to_frame() / cells_frame()"""
+
+    __slots__ = ("columns", "cells", "rows_count", "complete")
+
+    def __init__(self, columns: Dict[str, List[Any]], cells: Optional[Dict[str, List[Any]]] = None, rows_count: int = 0, complete: bool = True) -> None:
+        self.columns = columns
+        self.cells: Dict[str, List[Any]] = cells or {"row": [], "I": []}
+        self.rows_count = rows_count
+        # False — в ответе только часть строк (IC набора данных false)
+        self.complete = complete
+
+    def column_names(self, prefix: str) -> List[str]:
+        return [name for name in self.columns if name.startswith(prefix)]
+
+    def to_frame(self) -> Any:
+        """Колонки строк как pandas.DataFrame"""
+        import pandas as pd
+        return pd.DataFrame(self.columns)
+
+    def cells_frame(self) -> Any:
+        """Ячейки вторичной оси как pandas.DataFrame (row, I, меры)"""
+        import pandas as pd
+        return pd.DataFrame(self.cells)
+
+
+def to_columns(records: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Записи -> колонки; колонки, которых нет в записи, получают None"""
+    if len(records) == 1:
+        return {name: [value] for name, value in records[0].items()}
+    names = records[0].keys() if records else {}.keys()
+    if all(record.keys() == names for record in records):
+        return {name: [record[name] for record in records] for name in names}
+    all_names: Dict[str, None] = {}
+    for record in records:
+        all_names.update(dict.fromkeys(record))
+    return {name: [record.get(name) for record in records] for name in all_names}
+
+
+def read_schema(entry: Dict[str, Any]) -> Schema:
+    return [(item.get("N", ""), item.get("DN")) for item in entry["S"]]
+
+
+def decode_entry(entry: Dict[str, Any], schema: Schema, previous: Dict[str, Any], value_dicts: Dict[str, List[Any]]) -> Dict[str, Any]:
+    """Значения колонок одной строки (или ячейки X) с учётом C, R, Ø и словарей DN"""
+    repeat = entry.get("R", 0)
+    nulls = entry.get("Ø", 0)
+    values: Dict[str, Any] = {}
+    if not schema:
+        # Без схемы (урезанные ответы): именованные ключи как есть, C — позиционные колонки
+        values = {key: value for key, value in entry.items() if key not in CONTROL_KEYS}
+        if "C" in entry:
+            values.update((f"C{index}", value) for index, value in enumerate(entry["C"]))
+        return values
+
+    compressed_list = entry.get("C")
+    if not (repeat or nulls) and compressed_list is not None and len(compressed_list) == len(schema):
+        # Частый случай: все колонки строки переданы в C подряд
+        for (name, dict_name), value in zip(schema, compressed_list):
+            if dict_name and type(value) is int:
+                dictionary = value_dicts.get(dict_name, [])
+                value = dictionary[value] if 0 <= value < len(dictionary) else value
+            values[name] = value
+        return values
+
+    compressed = iter(compressed_list) if compressed_list is not None else None
+    for bit, (name, dict_name) in enumerate(schema):
+        if repeat >> bit & 1:
+            values[name] = previous.get(name)
+            continue
+        if nulls >> bit & 1:
+            value = None
+        elif compressed is not None:
+            value = next(compressed, None)
+        else:
+            value = entry.get(name)
+        if dict_name and isinstance(value, int) and not isinstance(value, bool):
+            dictionary = value_dicts.get(dict_name, [])
+            value = dictionary[value] if 0 <= value < len(dictionary) else value
+        values[name] = value
+    return values
+
+
+def decode_rows(rows: List[Dict[str, Any]], value_dicts: Dict[str, List[Any]]) -> DsrTable:
+    """Декодирует строки одного DM в DsrTable"""
+    schema: Schema = []
+    cell_schema: Schema = []
+    records: List[Dict[str, Any]] = []
+    cell_records: List[Dict[str, Any]] = []
+    previous: Dict[str, Any] = {}
+    previous_cell: Dict[str, Any] = {}
+    for row, entry in enumerate(rows):
+        if "S" in entry:
+            schema = read_schema(entry)
+        previous = decode_entry(entry, schema, previous, value_dicts)
+        records.append(previous)
+
+        cells = entry.get("X")
+        if not cells:
+            continue
+        index = -1
+        for cell in cells:
+            if "S" in cell:
+                cell_schema = read_schema(cell)
+            index = cell.get("I", index + 1)
+            previous_cell = decode_entry(cell, cell_schema, previous_cell, value_dicts)
+            cell_records.append({"row": row, "I": index, **previous_cell})
+    return DsrTable(to_columns(records), to_columns(cell_records) if cell_records else None, len(records))
+
+
+def is_dataset_complete(ds: Dict[str, Any]) -> bool:
+    """IC набора данных; без IC набор неполный, только если есть токен продолжения RT"""
+    return bool(ds.get("IC", "RT" not in ds))
+
+
+def decode_dataset(ds: Dict[str, Any]) -> Dict[str, DsrTable]:
+    """{DM0: DsrTable, DM1: ...} по всем PH набора данных"""
+    value_dicts = ds.get("ValueDicts", {})
+    complete = is_dataset_complete(ds)
+    rows_by_key: Dict[str, List[Dict[str, Any]]] = {}
+    for ph in ds.get("PH", []):
+        for dm_key, rows in ph.items():
+            if dm_key.startswith("DM"):
+                rows_by_key[dm_key] = rows_by_key[dm_key] + rows if dm_key in rows_by_key else rows
+    tables = {dm_key: decode_rows(rows, value_dicts) for dm_key, rows in rows_by_key.items()}
+    for table in tables.values():
+        table.complete = complete
+    return tables
+
+
+def decode_secondary_labels(ds: Dict[str, Any]) -> List[Any]:
+    """Подписи вторичной оси (колонки матрицы: спальни, типы объектов, статусы) из SH[0]"""
+    sh_list = ds.get("SH", [])
+    if not sh_list:
+        return []
+    value_dicts = ds.get("ValueDicts", {})
+    for dm_key, rows in sh_list[0].items():
+        if dm_key.startswith("DM"):
+            table = decode_rows(rows, value_dicts)
+            group_names = table.column_names("G")
+            if "G1" in table.columns:
+                group_names = ["G1"]
+            if not group_names:
+                return [""] * table.rows_count
+            return ["" if label is None else label for label in table.columns[group_names[-1]]]
+    return []
@@ -0,0 +1,241 @@
+"""
+Конвертация XLSX экспортов дашбордов в JSON {дата: {объект: {значения}}} по описанию набора.
+Экспорты отличаются только колонками: колонка объекта (Property / Location), колонки значений
+и их ключи в JSON. Всё остальное — чтение (xlsx_reader), очистка, типы и группировка — общее:
+- строки без даты, объекта или обязательного значения отбрасываются;
+- строка с неразбираемой датой или нечисловым значением пропускается с предупреждением;
+- значения округляются до 2 знаков встроенным round (Series.round округляет половинные
+  значения иначе), необязательные пустые значения — null;
+- повтор пары (дата, объект) заменяет значения, порядок — первого появления.
+convert_data даёт результат в памяти (экспорт может быть потоком байтов), convert_export
+пишет его в JSON рядом с XLSX.
+Новый экспорт — новая запись в SPECS и файл-обёртка convert_<набор>.py для запуска вручную.
+"""
+
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from xlsx_reader import Source, read_export
+
+DATE_COLUMN = "Date"
+DATE_FORMAT = "%d.%m.%Y"
+
+
+class ValueSpec:
+    """Колонка значения: первая найденная из columns (колонка -> ключ в JSON) или,
+    если ни одной нет, первая колонка с price_fallback в названии (без 'Change')"""
+
+    __slots__ = ("columns", "price_fallback", "scale", "required")
+
+    def __init__(
+        self,
+        columns: Dict[str, str],
+        price_fallback: Optional[Tuple[str, str]] = None,
+        scale: float = 1,
+        required: bool = True,
+    ) -> None:
+        self.columns = columns
+        self.price_fallback = price_fallback
+        self.scale = scale
+        self.required = required
+
+    def resolve(self, df_columns: List[Any]) -> Optional[Tuple[str, str]]:
+        """(колонка файла, ключ в JSON) или None, если колонки нет"""
+        for column, key in self.columns.items():
+            if column in df_columns:
+                return column, key
+        if self.price_fallback is not None:
+            substring, key = self.price_fallback
+            for column in df_columns:
+                if isinstance(column, str) and substring in column and 'Change' not in column:
+                    return column, key
+        return None
+
+
+class ExportSpec:
+    """Набор данных экспорта: колонка объекта, значения и судьба исходного XLSX"""
+
+    __slots__ = ("entity_column", "values", "keep_xlsx", "latest_prefix")
+
+    def __init__(
+        self,
+        entity_column: str,
+        values: List[ValueSpec],
+        keep_xlsx: bool = False,
+        latest_prefix: Optional[str] = None,
+    ) -> None:
+        self.entity_column = entity_column
+        self.values = values
+        self.keep_xlsx = keep_xlsx
+        # Без указанного файла ручной запуск берёт последний XLSX с этим префиксом
+        self.latest_prefix = latest_prefix
+
+    def read_columns(self) -> Optional[List[str]]:
+        """Колонки для чтения; None — все (колонку значения ищут по названию)"""
+        if any(value.price_fallback is not None for value in self.values):
+            return None
+        return [DATE_COLUMN, self.entity_column] + [column for value in self.values for column in value.columns]
+
+
+SPECS: Dict[str, ExportSpec] = {
+    "yields": ExportSpec("Property", [ValueSpec({"Gross Yield (%)": "gross_yield_percent"})]),
+    "rental_yields": ExportSpec(
+        "Location", [ValueSpec({"Rental Yields (%)": "rental_yields_percent"})], keep_xlsx=True,
+    ),
+    "property_data": ExportSpec("Property", [ValueSpec({
+        "Average Sales Price": "average_sales_price",
+        "Average Rent Price": "average_rent_price",
+    })]),
+    "price_trends": ExportSpec(
+        "Location",
+        [
+            ValueSpec(
+                {
+                    "Average Sales Price (AED/Sqf)": "average_sales_price",
+                    "Average Rent Price (AED/Sqf/Annum)": "average_rent_price",
+                },
+                price_fallback=("Price", "average_price"),
+                required=False,
+            ),
+            ValueSpec({"M-o-m Change (%)": "mom_change_percent"}, scale=100, required=False),
+            ValueSpec({"Q-o-q Change (%)": "qoq_change_percent"}, scale=100, required=False),
+            ValueSpec({"Y-o-y Change (%)": "yoy_change_percent"}, scale=100, required=False),
+        ],
+        latest_prefix="sales_price_trend_",
+    ),
+}
+
+
+def round_values(series: pd.Series, scale: float) -> List[Optional[float]]:
+    if scale != 1:
+        series = series * scale
+    return [None if value != value else round(value, 2) for value in series.astype(float).tolist()]
+
+
+def build_result(spec: ExportSpec, df: pd.DataFrame) -> Optional[Dict[str, Dict[Any, Dict[str, Any]]]]:
+    """{дата: {объект: {ключ: значение}}} или None, если нет обязательной колонки"""
+    resolved = []
+    for value in spec.values:
+        found = value.resolve(df.columns.tolist())
+        if found is None and value.price_fallback is not None:
+            print(f"[ERROR] Не найдена колонка с ценой")
+            return None
+        if found is None and value.required:
+            print(f"[ERROR] Не найдена колонка '{next(iter(value.columns))}'")
+            return None
+        resolved.append((value, found))
+    for column in (DATE_COLUMN, spec.entity_column):
+        if column not in df.columns:
+            print(f"[ERROR] Не найдена колонка '{column}'")
+            return None
+
+    required_columns = [DATE_COLUMN, spec.entity_column] + [found[0] for value, found in resolved if found and value.required]
+    df = df.dropna(subset=required_columns)
+    print(f"[INFO] После очистки: {len(df)} строк")
+
+    dates = pd.to_datetime(df[DATE_COLUMN], errors='coerce')
+    invalid = dates.isna()
+    numbers = {}
+    for value, found in resolved:
+        if found is not None:
+            numbers[found[0]] = pd.to_numeric(df[found[0]], errors='coerce')
+            invalid |= numbers[found[0]].isna() & df[found[0]].notna()
+    for idx in df.index[invalid]:
+        print(f"[WARNING] Ошибка в строке {idx}: некорректная дата или число")
+
+    valid = ~invalid
+    date_keys = dates[valid].dt.strftime(DATE_FORMAT).tolist()
+    entities = df.loc[valid, spec.entity_column].tolist()
+    keys = []
+    columns = []
+    for value, found in resolved:
+        keys.append(found[1] if found is not None else next(iter(value.columns.values())))
+        columns.append(round_values(numbers[found[0]][valid], value.scale) if found is not None else [None] * len(date_keys))
+
+    result: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+    for date_key, entity, *row in zip(date_keys, entities, *columns):
+        result.setdefault(date_key, {})[entity] = dict(zip(keys, row))
+    return result
+
+
+def remove_xlsx(xlsx_file: str) -> None:
+    try:
+        os.remove(xlsx_file)
+        print(f"[OK] Удален исходный файл: {os.path.basename(xlsx_file)}")
+    except Exception as e:
+        print(f"[WARNING] Не удалось удалить файл {xlsx_file}: {e}")
+
+
+def convert_data(dataset: str, source: Source, name: str) -> Optional[Dict[str, Dict[Any, Dict[str, Any]]]]:
+    """{дата: {объект: {значения}}} экспорта набора dataset (путь или поток байтов) без записи
+    на диск; None при ошибке (нет нужной колонки). name — имя экспорта для вывода"""
+    spec = SPECS[dataset]
+    print(f"\n[START] Конвертация: {name}")
+
+    df = read_export(source, spec.read_columns())
+    print(f"[INFO] Прочитано строк: {len(df)}")
+    print(f"[INFO] Колонки: {df.columns.tolist()}")
+
+    result = build_result(spec, df)
+    if result is None:
+        return None
+
+    if result:
+        print(f"[OK] Конвертация завершена")
+        print(f"[INFO] Уникальных дат: {len(result)}")
+        print(f"[INFO] Всего записей: {sum(len(entities) for entities in result.values())}")
+    else:
+        print(f"[WARNING] Нет данных для конвертации")
+    return result
+
+
+def convert_export(dataset: str, xlsx_file: str, output_file: Optional[str] = None) -> Optional[str]:
+    """Конвертирует XLSX экспорт набора dataset в JSON рядом с ним, возвращает путь JSON
+    или None при ошибке (нет нужной колонки)"""
+    result = convert_data(dataset, xlsx_file, os.path.basename(xlsx_file))
+    if result is None:
+        return None
+
+    if output_file is None:
+        output_file = os.path.splitext(xlsx_file)[0] + '.json'
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if result:
+        print(f"[INFO] Сохранено в: {os.path.basename(output_file)}")
+    else:
+        print(f"[OK] Создан пустой JSON: {os.path.basename(output_file)}")
+
+    if not SPECS[dataset].keep_xlsx:
+        remove_xlsx(xlsx_file)
+    return output_file
+
+
+def main(dataset: str) -> None:
+    """Ручной запуск convert_<набор>.py: файл из XLSX_FILE или первого аргумента"""
+    spec = SPECS[dataset]
+    xlsx_file = os.environ.get('XLSX_FILE') or (sys.argv[1] if len(sys.argv) > 1 else None)
+
+    if not xlsx_file and spec.latest_prefix:
+        files = [f for f in os.listdir('.') if f.startswith(spec.latest_prefix) and f.endswith('.xlsx')]
+        xlsx_file = max(files, key=os.path.getmtime) if files else None
+
+    if not xlsx_file:
+        print("[ERROR] Не указан файл для конвертации")
+        print(f"[INFO] Использование: XLSX_FILE=path/to/file.xlsx python convert_{dataset}.py")
+        print(f"[INFO] Или: python convert_{dataset}.py path/to/file.xlsx")
+        sys.exit(1)
+
+    if not os.path.exists(xlsx_file):
+        print(f"[ERROR] Файл не найден: {xlsx_file}")
+        sys.exit(1)
+
+    if convert_export(dataset, xlsx_file):
+        print(f"\n[SUCCESS] Файл успешно сконвертирован")
+    else:
+        print(f"\n[ERROR] Ошибка конвертации")
+        sys.exit(1)
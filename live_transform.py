@@ -0,0 +1,243 @@
+"""
+Трансформация во время парсинга.
+Отдельный процесс следит за raw файлами (снимок + журнал каждого воркера) и переводит каждую
+новую или изменившуюся пару (дата, район) в метрики transform_to_structure.transform_area сразу
+после её записи в журнал. Процесс, а не поток: в режиме in_process парсинг идёт в процессе
+runner.py, и трансформация в потоке делила бы с ним GIL. Частичный результат периодически
+публикуется в итоговый файл. Пара, записанная в несколько raw файлов, берётся из того же
+файла, что и при объединении (merge_raw_streams: более поздний в списке). После объединения
+raw файлов результат упорядочивается как объединённый файл и пишется окончательно, без
+повторной трансформации всего raw.
+"""
+
+import json
+import multiprocessing
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from log_levels import quiet_log
+from raw_journal import get_journal_path, get_prev_journal_path, iter_raw_lines, write_json_atomic
+from tidy_output import write_tidy_outputs
+from transform_to_structure import transform_area
+
+POLL_INTERVAL_S = 2.0
+PUBLISH_INTERVAL_S = 30.0
+
+
+def stat_or_none(path: str) -> Optional[os.stat_result]:
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def file_stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    stat = stat_or_none(path)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size) if stat else None
+
+
+class RawTail:
+    """Отдаёт пары raw файла, записанные с прошлого вызова poll. Журнал читается с последней
+    целой строки. Любая компакция переписывает снимок: если отложенный ею .jsonl.prev — тот
+    самый журнал, что читался (тот же journal_id), он дочитывается, иначе перечитывается
+    снимок. Затем новый журнал читается с начала"""
+
+    def __init__(self, raw_file: str) -> None:
+        self.raw_file = raw_file
+        self.journal_file = get_journal_path(raw_file)
+        self.prev_journal_file = get_prev_journal_path(raw_file)
+        self.snapshot_stamp: Optional[Tuple[int, int, int]] = (-1, -1, -1)
+        self.journal_offset = 0
+        self.journal_id: Optional[str] = None
+
+    def read_snapshot(self) -> Iterator[Tuple[str, str, str]]:
+        if not os.path.exists(self.raw_file):
+            return
+        try:
+            for date_key, area_key, _, requests_json in iter_raw_lines(self.raw_file):
+                if area_key is not None:
+                    yield date_key, area_key, requests_json
+        except ValueError:
+            with open(self.raw_file, "r", encoding="utf-8") as f:
+                raw_data = json.load(f)
+            for date_key, areas_data in raw_data.items():
+                for area_key, requests in areas_data.items():
+                    yield date_key, area_key, json.dumps(requests, ensure_ascii=False)
+
+    def read_journal_tail(self, journal_file: str) -> bytes:
+        """Целые строки журнала после уже прочитанной части"""
+        try:
+            with open(journal_file, "rb") as f:
+                f.seek(self.journal_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return b""
+        return data[:data.rfind(b"\n") + 1]
+
+    def is_prev_journal_ours(self) -> bool:
+        """Отложенный компакцией журнал — тот, что читался до неё"""
+        if self.journal_id is None:
+            return False
+        try:
+            with open(self.prev_journal_file, "rb") as f:
+                header = json.loads(f.readline())
+        except (FileNotFoundError, ValueError):
+            return False
+        return isinstance(header, dict) and header.get("journal_id") == self.journal_id
+
+    def consume(self, data: bytes) -> Iterator[Tuple[str, str, str]]:
+        self.journal_offset += len(data)
+        for raw_line in data.splitlines():
+            if not raw_line.strip():
+                continue
+            try:
+                entry = json.loads(raw_line)
+            except json.JSONDecodeError:
+                continue
+            if "journal_id" in entry:
+                self.journal_id = entry["journal_id"]
+            elif "date" in entry:
+                yield entry["date"], entry["area"], json.dumps(entry["requests"], ensure_ascii=False)
+
+    def poll(self) -> Iterator[Tuple[str, str, str]]:
+        """(дата, район, JSON запросов) в порядке записи: поздняя запись пары идёт позже"""
+        snapshot_stamp = file_stamp(self.raw_file)
+        journal_stat = stat_or_none(self.journal_file)
+        shrunk = journal_stat is None or journal_stat.st_size < self.journal_offset
+        if snapshot_stamp != self.snapshot_stamp or (self.journal_offset and shrunk):
+            if self.is_prev_journal_ours():
+                # Новый снимок = старый снимок + этот журнал, достаточно его дочитать
+                yield from self.consume(self.read_journal_tail(self.prev_journal_file))
+            else:
+                yield from self.read_snapshot()
+            self.snapshot_stamp = snapshot_stamp
+            self.journal_offset = 0
+            self.journal_id = None
+        data = self.read_journal_tail(self.journal_file)
+        if file_stamp(self.raw_file) != self.snapshot_stamp:
+            # Компакция прошла во время чтения: прочитанное могло быть уже из нового журнала
+            return
+        yield from self.consume(data)
+
+
+class LiveTransform:
+    """Трансформация raw файлов, пока идёт парсинг (работает в процессе LiveTransformProcess)"""
+
+    def __init__(self, raw_files: List[str], output_file: str, tidy_formats: Optional[List[str]] = None) -> None:
+        self.tails = [RawTail(raw_file) for raw_file in raw_files]
+        self.output_file = output_file
+        self.tidy_formats = tidy_formats or []
+        self.result: Dict[str, Dict[str, Any]] = {}
+        self.hashes: Dict[Tuple[int, str, str], int] = {}
+        # Пара -> номер raw файла, из которого взят её результат
+        self.sources: Dict[Tuple[str, str], int] = {}
+        self.transformed = 0
+        self.errors = 0
+
+    def poll(self) -> int:
+        """Трансформирует новые и изменившиеся пары, возвращает их число"""
+        count = 0
+        for source_num, tail in enumerate(self.tails):
+            for date_key, area_key, requests_json in tail.poll():
+                digest = hash(requests_json)
+                if self.hashes.get((source_num, date_key, area_key)) == digest:
+                    continue
+                self.hashes[(source_num, date_key, area_key)] = digest
+                # Как в merge_raw_streams: пару из более позднего raw файла ранний не заменяет
+                if self.sources.get((date_key, area_key), -1) > source_num:
+                    continue
+                self.sources[(date_key, area_key)] = source_num
+                areas = self.result.setdefault(date_key, {})
+                try:
+                    area_data = transform_area(area_key, json.loads(requests_json), log=quiet_log)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"[ERROR] [LIVE] {date_key} {area_key}: {e}")
+                    continue
+                if area_data is None:
+                    areas.pop(area_key, None)
+                else:
+                    areas[area_key] = area_data
+                count += 1
+        self.transformed += count
+        return count
+
+    def publish(self) -> None:
+        write_json_atomic(self.result, self.output_file)
+        total_areas = sum(len(areas) for areas in self.result.values())
+        print(f"[LIVE] Частичный результат: {total_areas} пар (дата, район) -> {os.path.basename(self.output_file)}")
+
+    def run(self, stop_event: Any) -> None:
+        since_publish = 0.0
+        changed = False
+        while not stop_event.wait(POLL_INTERVAL_S):
+            since_publish += POLL_INTERVAL_S
+            try:
+                changed = self.poll() > 0 or changed
+                if changed and since_publish >= PUBLISH_INTERVAL_S:
+                    self.publish()
+                    since_publish = 0.0
+                    changed = False
+            except Exception as e:
+                print(f"[WARNING] [LIVE] Ошибка трансформации: {e}")
+
+    def finish(self, merged_index: Dict[str, List[str]]) -> bool:
+        """Дочитывает хвосты и пишет итог в порядке объединённого файла.
+        False — были ошибки трансформации, итог нужно построить заново из объединённого файла"""
+        self.poll()
+        if self.errors:
+            print(f"[WARNING] [LIVE] Ошибок трансформации: {self.errors}")
+            return False
+        final_result = {
+            date_key: {
+                area_key: self.result[date_key][area_key]
+                for area_key in areas if area_key in self.result.get(date_key, {})
+            }
+            for date_key, areas in merged_index.items()
+        }
+        write_json_atomic(final_result, self.output_file)
+        write_tidy_outputs(self.output_file, self.tidy_formats, final_result)
+        print(f"\n{'='*80}")
+        print(f"[OK] {self.output_file} создан (live трансформация, всего трансформировано пар: {self.transformed})")
+        print(f"[OK] Дат: {len(final_result)}, Районов всего: {sum(len(areas) for areas in final_result.values())}")
+        print(f"{'='*80}\n")
+        return True
+
+
+def run_live_transform(raw_files: List[str], output_file: str, tidy_formats: List[str], stop_event: Any, merged_queue: Any) -> None:
+    """Тело процесса: трансформирует имеющиеся данные (resume), следит за raw файлами до stop_event,
+    затем получает индекс объединённого файла и пишет итог. Код выхода 0 — итог записан"""
+    live = LiveTransform(raw_files, output_file, tidy_formats)
+    live.poll()
+    print(f"[LIVE] Трансформация во время парсинга запущена ({live.transformed} пар уже готово)")
+    live.run(stop_event)
+    merged_index = merged_queue.get()
+    if merged_index is None:
+        sys.exit(1)
+    sys.exit(0 if live.finish(merged_index) else 1)
+
+
+class LiveTransformProcess:
+    """LiveTransform в отдельном процессе"""
+
+    def __init__(self, raw_files: List[str], output_file: str, tidy_formats: Optional[List[str]] = None) -> None:
+        self.stop_event = multiprocessing.Event()
+        self.merged_queue: Any = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=run_live_transform,
+            args=(raw_files, output_file, tidy_formats or [], self.stop_event, self.merged_queue),
+            daemon=True,
+        )
+
+    def start(self) -> None:
+        self.process.start()
+
+    def finish(self, merged_index: Optional[Dict[str, List[str]]]) -> bool:
+        """Передаёт процессу индекс объединённого файла и ждёт итог.
+        None — объединение не удалось: процесс останавливается без записи итога.
+        False — итог не записан, его нужно построить заново из объединённого файла"""
+        self.merged_queue.put(merged_index)
+        self.stop_event.set()
+        self.process.join()
+        return self.process.exitcode == 0
@@ -0,0 +1,95 @@
+"""
+Уровни подробности вывода парсера и трансформации.
+summary — только итоги запуска, батчей, ошибки и предупреждения (по умолчанию);
+area — плюс строка со временем обработки каждого района; debug — весь подробный вывод,
+как раньше. debug_areas включает debug только для перечисленных районов (и их подрайонов),
+чтобы отладить один район без вывода остальных.
+Строки копятся в буфере и пишутся в stdout одним вызовом: при строке уровня area или
+выше, при заполнении буфера, по flush_log и при выходе.
+"""
+
+import atexit
+import json
+import os
+import sys
+from typing import Any, Callable, Dict, List, Optional, Set
+
+LEVELS = {"summary": 0, "area": 1, "debug": 2}
+BUFFER_LINES = 200
+
+_level = LEVELS["summary"]
+_debug_areas: Set[str] = set()
+_buffer: List[str] = []
+
+
+def configure_logging(log_config: Optional[Dict[str, Any]] = None) -> None:
+    """Уровень из LOG_LEVEL / LOG_DEBUG_AREAS (их передаёт runner.py) либо из секции log конфига"""
+    global _level, _debug_areas
+    log_config = log_config or {}
+    level = os.environ.get("LOG_LEVEL") or log_config.get("level", "summary")
+    if level not in LEVELS:
+        print(f"[WARNING] Неизвестный уровень логирования {level!r}, использую summary")
+        level = "summary"
+    _level = LEVELS[level]
+    env_debug_areas = os.environ.get("LOG_DEBUG_AREAS")
+    _debug_areas = set(json.loads(env_debug_areas) if env_debug_areas else log_config.get("debug_areas", []))
+
+
+def get_log_env(log_config: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """Переменные окружения, передающие уровень логирования дочернему процессу"""
+    log_config = log_config or {}
+    return {
+        "LOG_LEVEL": str(log_config.get("level", "summary")),
+        "LOG_DEBUG_AREAS": json.dumps(log_config.get("debug_areas", []), ensure_ascii=False),
+    }
+
+
+def is_debug(area: Optional[str] = None) -> bool:
+    """Подробный вывод включён (для района area: глобально или через debug_areas)"""
+    if _level >= LEVELS["debug"]:
+        return True
+    return area is not None and (area in _debug_areas or area.split(" - ", 1)[0] in _debug_areas)
+
+
+def flush_log() -> None:
+    if _buffer:
+        sys.stdout.write("\n".join(_buffer) + "\n")
+        sys.stdout.flush()
+        _buffer.clear()
+
+
+def buffer_line(*args: Any) -> None:
+    """Добавляет строку в буфер без проверки уровня (вызывающий уже проверил is_debug)"""
+    _buffer.append(" ".join(str(arg) for arg in args))
+    if len(_buffer) >= BUFFER_LINES:
+        flush_log()
+
+
+def quiet_log(*args: Any, **kwargs: Any) -> None:
+    """Выключенный подробный вывод"""
+
+
+def get_area_log(area: Optional[str] = None) -> Callable[..., None]:
+    """Функция подробного вывода для района: в буфер при debug, иначе ничего"""
+    return buffer_line if is_debug(area) else quiet_log
+
+
+def log_debug(message: str, area: Optional[str] = None) -> None:
+    if is_debug(area):
+        buffer_line(message)
+
+
+def log_area(message: str, area: Optional[str] = None) -> None:
+    if _level >= LEVELS["area"] or is_debug(area):
+        _buffer.append(message)
+        flush_log()
+
+
+def log_line(message: str) -> None:
+    """Строка, которая печатается всегда (ошибки и предупреждения внутри подробного вывода),
+    после накопленных перед ней строк"""
+    _buffer.append(message)
+    flush_log()
+
+
+atexit.register(flush_log)
@@ -2,24 +2,18 @@ import json
 import os
 from collections import defaultdict
 
-def merge_price_trends():
-
-    sales_data = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
-    rent_data = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
 
-    json_files = []
-    for f in os.listdir('.'):
-        if f.endswith('.json') and 'price_trend' in f:
+class PriceTrendsMerge:
+    """Копит части (результат конвертации одного экспорта) в sales и rent
+    {город: {тип: {дата: {локация: метрики}}}}. Город, тип и sales/rent берутся из имени части:
+    City_Type_sales_price_trend_timestamp"""
 
-            if f not in ['sales_price_trend.json', 'rent_price_trend.json']:
-
-                if '_sales_price_trend_' in f or '_rent_price_trend_' in f:
-                    json_files.append(f)
-
-    print(f"[INFO] Найдено {len(json_files)} файлов для объединения")
-
-    for filename in json_files:
+    def __init__(self):
+        self.sales_data = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
+        self.rent_data = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
 
+    def parse_name(self, filename):
+        """(город, тип, sales/rent) или None, если имя не разобрано"""
         parts = filename.replace('.json', '').split('_')
 
         city_parts = []
@@ -37,31 +31,138 @@ def merge_price_trends():
             idx += 1
         else:
             print(f"[WARNING] Не удалось определить тип для {filename}")
-            continue
+            return None
 
         if idx < len(parts) and parts[idx] in ['sales', 'rent']:
             data_type = parts[idx]
         else:
             print(f"[WARNING] Не удалось определить тип данных для {filename}")
-            continue
+            return None
 
         print(f"[>>] Обрабатываю: {city} - {prop_type} - {data_type}")
+        return city, prop_type, data_type
+
+    def add(self, key, file_data):
+        city, prop_type, data_type = key
+        target = self.sales_data if data_type == 'sales' else self.rent_data
+        for date, locations in file_data.items():
+            for location, metrics in locations.items():
+                target[city][prop_type][date][location] = metrics
+
+        records_count = sum(len(locs) for locs in file_data.values())
+        print(f"    [OK] Добавлено записей: {records_count}")
+        return records_count
+
+    def add_part(self, filename, file_data):
+        """Часть из памяти; None — имя не разобрано"""
+        key = self.parse_name(filename)
+        if key is None:
+            return None
+        return self.add(key, file_data)
+
+    def save(self, partial=False):
+        """partial=True — обход прерван: результат пишется в *.partial.json,
+        итоговые sales/rent файлы не трогаются"""
+        suffix = '.partial.json' if partial else '.json'
+        sales_file = 'sales_price_trend' + suffix
+        rent_file = 'rent_price_trend' + suffix
+
+        sales_final = {
+            city: {
+                prop_type: {
+                    date: dict(locations)
+                    for date, locations in dates.items()
+                }
+                for prop_type, dates in types.items()
+            }
+            for city, types in self.sales_data.items()
+        }
+
+        rent_final = {
+            city: {
+                prop_type: {
+                    date: dict(locations)
+                    for date, locations in dates.items()
+                }
+                for prop_type, dates in types.items()
+            }
+            for city, types in self.rent_data.items()
+        }
+
+        print("\n" + "="*70)
+        print("[SAVE] Сохранение итоговых файлов...")
+        print("="*70)
+
+        with open(sales_file, 'w', encoding='utf-8') as f:
+            json.dump(sales_final, f, ensure_ascii=False, indent=2)
+
+        sales_total = sum(
+            sum(
+                sum(len(locs) for locs in dates.values())
+                for dates in types.values()
+            )
+            for types in self.sales_data.values()
+        )
+        print(f"[OK] {sales_file} создан")
+        print(f"    Городов: {len(sales_final)}")
+        print(f"    Всего записей: {sales_total}")
+
+        with open(rent_file, 'w', encoding='utf-8') as f:
+            json.dump(rent_final, f, ensure_ascii=False, indent=2)
+
+        rent_total = sum(
+            sum(
+                sum(len(locs) for locs in dates.values())
+                for dates in types.values()
+            )
+            for types in self.rent_data.values()
+        )
+        print(f"[OK] {rent_file} создан")
+        print(f"    Городов: {len(rent_final)}")
+        print(f"    Всего записей: {rent_total}")
+
+        print("\n" + "="*70)
+        print("[EXAMPLE] Структура данных:")
+        print("="*70)
+
+        if sales_final:
+            first_city = list(sales_final.keys())[0]
+            first_type = list(sales_final[first_city].keys())[0]
+            first_date = list(sales_final[first_city][first_type].keys())[0]
+            first_location = list(sales_final[first_city][first_type][first_date].keys())[0]
+
+            print(f"{first_city} -> {first_type} -> {first_date} -> {first_location}:")
+            print(f"  {json.dumps(sales_final[first_city][first_type][first_date][first_location], indent=2, ensure_ascii=False)}")
+
+        print("\n[FINISH] Объединение завершено успешно")
+
+
+def merge_price_trends():
+
+    merge = PriceTrendsMerge()
+
+    json_files = []
+    for f in os.listdir('.'):
+        if f.endswith('.json') and 'price_trend' in f:
+
+            if f not in ['sales_price_trend.json', 'rent_price_trend.json']:
+
+                if '_sales_price_trend_' in f or '_rent_price_trend_' in f:
+                    json_files.append(f)
+
+    print(f"[INFO] Найдено {len(json_files)} файлов для объединения")
+
+    for filename in json_files:
+
+        key = merge.parse_name(filename)
+        if key is None:
+            continue
 
         try:
             with open(filename, 'r', encoding='utf-8') as f:
                 file_data = json.load(f)
 
-            if data_type == 'sales':
-                for date, locations in file_data.items():
-                    for location, metrics in locations.items():
-                        sales_data[city][prop_type][date][location] = metrics
-            else:
-                for date, locations in file_data.items():
-                    for location, metrics in locations.items():
-                        rent_data[city][prop_type][date][location] = metrics
-
-            records_count = sum(len(locs) for locs in file_data.values())
-            print(f"    [OK] Добавлено записей: {records_count}")
+            merge.add(key, file_data)
 
             try:
                 os.remove(filename)
@@ -73,74 +174,7 @@ def merge_price_trends():
             print(f"[ERROR] Ошибка при обработке {filename}: {e}")
             continue
 
-    sales_final = {
-        city: {
-            prop_type: {
-                date: dict(locations)
-                for date, locations in dates.items()
-            }
-            for prop_type, dates in types.items()
-        }
-        for city, types in sales_data.items()
-    }
-
-    rent_final = {
-        city: {
-            prop_type: {
-                date: dict(locations)
-                for date, locations in dates.items()
-            }
-            for prop_type, dates in types.items()
-        }
-        for city, types in rent_data.items()
-    }
-
-    print("\n" + "="*70)
-    print("[SAVE] Сохранение итоговых файлов...")
-    print("="*70)
-
-    with open('sales_price_trend.json', 'w', encoding='utf-8') as f:
-        json.dump(sales_final, f, ensure_ascii=False, indent=2)
-
-    sales_total = sum(
-        sum(
-            sum(len(locs) for locs in dates.values())
-            for dates in types.values()
-        )
-        for types in sales_data.values()
-    )
-    print(f"[OK] sales_price_trend.json создан")
-    print(f"    Городов: {len(sales_final)}")
-    print(f"    Всего записей: {sales_total}")
-
-    with open('rent_price_trend.json', 'w', encoding='utf-8') as f:
-        json.dump(rent_final, f, ensure_ascii=False, indent=2)
-
-    rent_total = sum(
-        sum(
-            sum(len(locs) for locs in dates.values())
-            for dates in types.values()
-        )
-        for types in rent_data.values()
-    )
-    print(f"[OK] rent_price_trend.json создан")
-    print(f"    Городов: {len(rent_final)}")
-    print(f"    Всего записей: {rent_total}")
-
-    print("\n" + "="*70)
-    print("[EXAMPLE] Структура данных:")
-    print("="*70)
-
-    if sales_final:
-        first_city = list(sales_final.keys())[0]
-        first_type = list(sales_final[first_city].keys())[0]
-        first_date = list(sales_final[first_city][first_type].keys())[0]
-        first_location = list(sales_final[first_city][first_type][first_date].keys())[0]
-
-        print(f"{first_city} -> {first_type} -> {first_date} -> {first_location}:")
-        print(f"  {json.dumps(sales_final[first_city][first_type][first_date][first_location], indent=2, ensure_ascii=False)}")
-
-    print("\n[FINISH] Объединение завершено успешно")
+    merge.save()
 
 if __name__ == "__main__":
     merge_price_trends()
@@ -2,179 +2,173 @@ import json
 import os
 from collections import defaultdict
 
-def merge_property_data_jsons():
+KNOWN_CITIES = ['Abu_Dhabi', 'Ajman', 'Dubai', 'Ras_Al_Khaimah', 'Sharjah', 'Umm_Al_Quwain', 'Fujairah']
 
-    print("[START] Объединение JSON файлов property data")
 
-    all_files = [f for f in os.listdir('.') if f.endswith('.json')]
+def parse_city_and_type(city_and_type):
+    city = None
+    property_type = None
 
-    property_files = [
-        f for f in all_files
-        if '_property_data_' in f
-        and f not in ['sales_property_data.json', 'rent_property_data.json']
-    ]
+    for known_city in KNOWN_CITIES:
+        if city_and_type.startswith(known_city + '_'):
+            city = known_city.replace('_', ' ')
+            property_type = city_and_type[len(known_city) + 1:].replace('_', ' ')
+            break
+        elif city_and_type == known_city:
+            city = known_city.replace('_', ' ')
+            property_type = ''
+            break
 
-    print(f"[INFO] Найдено файлов для объединения: {len(property_files)}")
+    return city, property_type
 
-    if len(property_files) == 0:
-        print("[WARNING] Нет файлов для объединения")
-        return
-
-    sales_data = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
-    rent_data = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
 
-    sales_count = 0
-    rent_count = 0
+class PropertyDataMerge:
+    """Копит части (результат конвертации одного экспорта) в sales и rent
+    {город: {тип: {дата: {объект: метрики}}}}. Город, тип и sales/rent берутся из имени части:
+    City_Type_sales_property_data_timestamp"""
 
-    for filename in property_files:
-        print(f"\n[>>] Обработка: {filename}")
+    def __init__(self):
+        self.sales_data = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
+        self.rent_data = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
+        self.sales_count = 0
+        self.rent_count = 0
 
+    def parse_name(self, filename):
+        """(город, тип, sales/rent) или None, если имя не разобрано"""
         parts = filename.replace('.json', '').split('_')
 
         if '_sales_property_data_' in filename:
             data_type = 'sales'
 
-            sales_idx = None
-            for i, part in enumerate(parts):
-                if part == 'sales':
-                    sales_idx = i
-                    break
-
-            if sales_idx is None:
+            if 'sales' not in parts:
                 print(f"[ERROR] Не удалось определить структуру имени: {filename}")
-                continue
-
-            city_parts = parts[:sales_idx]
+                return None
 
             temp = filename.replace('_sales_property_data_', '|')
-            city_and_type = temp.split('|')[0]
-
-            known_cities = ['Abu_Dhabi', 'Ajman', 'Dubai', 'Ras_Al_Khaimah', 'Sharjah', 'Umm_Al_Quwain', 'Fujairah']
-
-            city = None
-            property_type = None
-
-            for known_city in known_cities:
-                if city_and_type.startswith(known_city + '_'):
-                    city = known_city.replace('_', ' ')
-                    property_type = city_and_type[len(known_city) + 1:].replace('_', ' ')
-                    break
-                elif city_and_type == known_city:
-                    city = known_city.replace('_', ' ')
-                    property_type = ''
-                    break
-
-            if not city:
-                print(f"[ERROR] Не удалось определить город из: {city_and_type}")
-                continue
-
         elif '_rent_property_data_' in filename:
             data_type = 'rent'
             temp = filename.replace('_rent_property_data_', '|')
-            city_and_type = temp.split('|')[0]
-
-            known_cities = ['Abu_Dhabi', 'Ajman', 'Dubai', 'Ras_Al_Khaimah', 'Sharjah', 'Umm_Al_Quwain', 'Fujairah']
-
-            city = None
-            property_type = None
-
-            for known_city in known_cities:
-                if city_and_type.startswith(known_city + '_'):
-                    city = known_city.replace('_', ' ')
-                    property_type = city_and_type[len(known_city) + 1:].replace('_', ' ')
-                    break
-                elif city_and_type == known_city:
-                    city = known_city.replace('_', ' ')
-                    property_type = ''
-                    break
-
-            if not city:
-                print(f"[ERROR] Не удалось определить город из: {city_and_type}")
-                continue
         else:
             print(f"[WARNING] Пропускаю файл (не sales/rent): {filename}")
-            continue
+            return None
 
-        print(f"[INFO] Город: {city}, Тип: {property_type}, Данные: {data_type}")
+        city_and_type = temp.split('|')[0]
+        city, property_type = parse_city_and_type(city_and_type)
+        if not city:
+            print(f"[ERROR] Не удалось определить город из: {city_and_type}")
+            return None
 
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                file_data = json.load(f)
-        except Exception as e:
-            print(f"[ERROR] Ошибка чтения файла: {e}")
-            continue
+        print(f"[INFO] Город: {city}, Тип: {property_type}, Данные: {data_type}")
+        return city, property_type, data_type
 
+    def add(self, key, file_data):
         if not file_data:
             print(f"[WARNING] Файл пустой, пропускаю")
-            continue
+            return 0
 
+        city, property_type, data_type = key
+        target = self.sales_data if data_type == 'sales' else self.rent_data
         record_count = 0
         for date, properties in file_data.items():
             for property_name, metrics in properties.items():
-                if data_type == 'sales':
-                    sales_data[city][property_type][date][property_name] = metrics
-                else:
-                    rent_data[city][property_type][date][property_name] = metrics
+                target[city][property_type][date][property_name] = metrics
                 record_count += 1
 
         print(f"[OK] Добавлено записей: {record_count}")
 
         if data_type == 'sales':
-            sales_count += record_count
+            self.sales_count += record_count
         else:
-            rent_count += record_count
+            self.rent_count += record_count
+        return record_count
+
+    def add_part(self, filename, file_data):
+        """Часть из памяти; None — имя не разобрано"""
+        key = self.parse_name(filename)
+        if key is None:
+            return None
+        return self.add(key, file_data)
+
+    def save_one(self, output_file, data, count):
+        print("\n" + "="*70)
+        print(f"[>>] Сохранение {output_file}...")
+
+        final = {
+            city: {
+                prop_type: dict(dates)
+                for prop_type, dates in types.items()
+            }
+            for city, types in data.items()
+        }
 
-        try:
-            os.remove(filename)
-            print(f"[OK] Удален исходный файл: {filename}")
-        except Exception as e:
-            print(f"[WARNING] Не удалось удалить файл {filename}: {e}")
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(final, f, ensure_ascii=False, indent=2)
 
-    print("\n" + "="*70)
-    print("[>>] Сохранение sales_property_data.json...")
+        print(f"[OK] Сохранено городов: {len(final)}")
+        print(f"[OK] Всего записей: {count}")
 
-    sales_final = {
-        city: {
-            prop_type: dict(dates)
-            for prop_type, dates in types.items()
-        }
-        for city, types in sales_data.items()
-    }
+        for city, types in final.items():
+            type_counts = {prop_type: sum(len(props) for props in dates.values()) for prop_type, dates in types.items()}
+            print(f"  - {city}: {type_counts}")
 
-    with open('sales_property_data.json', 'w', encoding='utf-8') as f:
-        json.dump(sales_final, f, ensure_ascii=False, indent=2)
+    def save(self, partial=False):
+        """partial=True — обход прерван: результат пишется в *.partial.json,
+        итоговые sales/rent файлы не трогаются"""
+        suffix = '.partial.json' if partial else '.json'
+        sales_file = 'sales_property_data' + suffix
+        rent_file = 'rent_property_data' + suffix
+        self.save_one(sales_file, self.sales_data, self.sales_count)
+        self.save_one(rent_file, self.rent_data, self.rent_count)
 
-    print(f"[OK] Сохранено городов: {len(sales_final)}")
-    print(f"[OK] Всего записей: {sales_count}")
+        print("\n" + "="*70)
+        print("[SUCCESS] Объединение завершено успешно")
+        print(f"[INFO] Создано файлов: {sales_file}, {rent_file}")
 
-    for city, types in sales_final.items():
-        type_counts = {prop_type: sum(len(props) for props in dates.values()) for prop_type, dates in types.items()}
-        print(f"  - {city}: {type_counts}")
 
-    print("\n" + "="*70)
-    print("[>>] Сохранение rent_property_data.json...")
+def merge_property_data_jsons():
 
-    rent_final = {
-        city: {
-            prop_type: dict(dates)
-            for prop_type, dates in types.items()
-        }
-        for city, types in rent_data.items()
-    }
+    print("[START] Объединение JSON файлов property data")
 
-    with open('rent_property_data.json', 'w', encoding='utf-8') as f:
-        json.dump(rent_final, f, ensure_ascii=False, indent=2)
+    all_files = [f for f in os.listdir('.') if f.endswith('.json')]
 
-    print(f"[OK] Сохранено городов: {len(rent_final)}")
-    print(f"[OK] Всего записей: {rent_count}")
+    property_files = [
+        f for f in all_files
+        if '_property_data_' in f
+        and f not in ['sales_property_data.json', 'rent_property_data.json']
+    ]
+
+    print(f"[INFO] Найдено файлов для объединения: {len(property_files)}")
 
-    for city, types in rent_final.items():
-        type_counts = {prop_type: sum(len(props) for props in dates.values()) for prop_type, dates in types.items()}
-        print(f"  - {city}: {type_counts}")
+    if len(property_files) == 0:
+        print("[WARNING] Нет файлов для объединения")
+        return
+
+    merge = PropertyDataMerge()
+
+    for filename in property_files:
+        print(f"\n[>>] Обработка: {filename}")
+
+        key = merge.parse_name(filename)
+        if key is None:
+            continue
+
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                file_data = json.load(f)
+        except Exception as e:
+            print(f"[ERROR] Ошибка чтения файла: {e}")
+            continue
+
+        if not merge.add(key, file_data):
+            continue
+
+        try:
+            os.remove(filename)
+            print(f"[OK] Удален исходный файл: {filename}")
+        except Exception as e:
+            print(f"[WARNING] Не удалось удалить файл {filename}: {e}")
 
-    print("\n" + "="*70)
-    print("[SUCCESS] Объединение завершено успешно")
-    print(f"[INFO] Создано файлов: sales_property_data.json, rent_property_data.json")
+    merge.save()
 
 if __name__ == "__main__":
     merge_property_data_jsons()
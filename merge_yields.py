@@ -2,40 +2,26 @@ import json
 import os
 from collections import defaultdict
 
-def merge_yields_jsons():
+KNOWN_CITIES = ['Abu_Dhabi', 'Ajman', 'Dubai', 'Ras_Al_Khaimah', 'Sharjah', 'Umm_Al_Quwain', 'Fujairah']
 
-    print("[START] Объединение JSON файлов yields")
 
-    all_files = [f for f in os.listdir('.') if f.endswith('.json')]
-
-    yields_files = [
-        f for f in all_files
-        if '_yields_data_' in f
-        and f != 'yields_data.json'
-    ]
+class YieldsMerge:
+    """Копит части (результат конвертации одного экспорта) в {город: {тип: {дата: {объект: метрики}}}}.
+    Город и тип берутся из имени части: City_Type_yields_data_timestamp"""
 
-    print(f"[INFO] Найдено файлов для объединения: {len(yields_files)}")
-
-    if len(yields_files) == 0:
-        print("[WARNING] Нет файлов для объединения")
-        return
-
-    yields_data = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
-
-    yields_count = 0
-
-    for filename in yields_files:
-        print(f"\n[>>] Обработка: {filename}")
+    def __init__(self):
+        self.yields_data = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
+        self.yields_count = 0
 
+    def parse_name(self, filename):
+        """(город, тип) или None, если город не определен"""
         temp = filename.replace('_yields_data_', '|')
         city_and_type = temp.split('|')[0]
 
-        known_cities = ['Abu_Dhabi', 'Ajman', 'Dubai', 'Ras_Al_Khaimah', 'Sharjah', 'Umm_Al_Quwain', 'Fujairah']
-
         city = None
         property_type = None
 
-        for known_city in known_cities:
+        for known_city in KNOWN_CITIES:
             if city_and_type.startswith(known_city + '_'):
                 city = known_city.replace('_', ' ')
                 property_type = city_and_type[len(known_city) + 1:].replace('_', ' ')
@@ -47,66 +33,107 @@ def merge_yields_jsons():
 
         if not city:
             print(f"[ERROR] Не удалось определить город из: {city_and_type}")
-            continue
+            return None
 
         print(f"[INFO] Город: {city}, Тип: {property_type}")
+        return city, property_type
 
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                file_data = json.load(f)
-        except Exception as e:
-            print(f"[ERROR] Ошибка чтения файла: {e}")
-            continue
-
+    def add(self, key, file_data):
         if not file_data:
             print(f"[WARNING] Файл пустой, пропускаю")
+            return 0
 
-            try:
-                os.remove(filename)
-                print(f"[OK] Удален пустой файл: {filename}")
-            except Exception as e:
-                print(f"[WARNING] Не удалось удалить файл {filename}: {e}")
-            continue
-
+        city, property_type = key
         record_count = 0
         for date, properties in file_data.items():
             for property_name, metrics in properties.items():
-                yields_data[city][property_type][date][property_name] = metrics
+                self.yields_data[city][property_type][date][property_name] = metrics
                 record_count += 1
 
         print(f"[OK] Добавлено записей: {record_count}")
-        yields_count += record_count
+        self.yields_count += record_count
+        return record_count
+
+    def add_part(self, filename, file_data):
+        """Часть из памяти; None — имя не разобрано"""
+        key = self.parse_name(filename)
+        if key is None:
+            return None
+        return self.add(key, file_data)
+
+    def save(self, partial=False):
+        """partial=True — обход прерван: результат пишется в yields_data.partial.json,
+        итоговый yields_data.json не трогается"""
+        output_file = 'yields_data.partial.json' if partial else 'yields_data.json'
+        print("\n" + "="*70)
+        print(f"[>>] Сохранение {output_file}...")
+
+        yields_final = {
+            city: {
+                prop_type: dict(dates)
+                for prop_type, dates in types.items()
+            }
+            for city, types in self.yields_data.items()
+        }
 
-        try:
-            os.remove(filename)
-            print(f"[OK] Удален исходный файл: {filename}")
-        except Exception as e:
-            print(f"[WARNING] Не удалось удалить файл {filename}: {e}")
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(yields_final, f, ensure_ascii=False, indent=2)
 
-    print("\n" + "="*70)
-    print("[>>] Сохранение yields_data.json...")
+        print(f"[OK] Сохранено городов: {len(yields_final)}")
+        print(f"[OK] Всего записей: {self.yields_count}")
 
-    yields_final = {
-        city: {
-            prop_type: dict(dates)
-            for prop_type, dates in types.items()
-        }
-        for city, types in yields_data.items()
-    }
+        for city, types in yields_final.items():
+            type_counts = {prop_type: sum(len(props) for props in dates.values()) for prop_type, dates in types.items()}
+            print(f"  - {city}: {type_counts}")
 
-    with open('yields_data.json', 'w', encoding='utf-8') as f:
-        json.dump(yields_final, f, ensure_ascii=False, indent=2)
+        print("\n" + "="*70)
+        print("[SUCCESS] Объединение завершено успешно")
+        print(f"[INFO] Создан файл: {output_file}")
 
-    print(f"[OK] Сохранено городов: {len(yields_final)}")
-    print(f"[OK] Всего записей: {yields_count}")
 
-    for city, types in yields_final.items():
-        type_counts = {prop_type: sum(len(props) for props in dates.values()) for prop_type, dates in types.items()}
-        print(f"  - {city}: {type_counts}")
+def merge_yields_jsons():
+
+    print("[START] Объединение JSON файлов yields")
+
+    all_files = [f for f in os.listdir('.') if f.endswith('.json')]
+
+    yields_files = [
+        f for f in all_files
+        if '_yields_data_' in f
+        and f != 'yields_data.json'
+    ]
+
+    print(f"[INFO] Найдено файлов для объединения: {len(yields_files)}")
+
+    if len(yields_files) == 0:
+        print("[WARNING] Нет файлов для объединения")
+        return
+
+    merge = YieldsMerge()
+
+    for filename in yields_files:
+        print(f"\n[>>] Обработка: {filename}")
+
+        key = merge.parse_name(filename)
+        if key is None:
+            continue
+
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                file_data = json.load(f)
+        except Exception as e:
+            print(f"[ERROR] Ошибка чтения файла: {e}")
+            continue
+
+        merge.add(key, file_data)
+
+        try:
+            os.remove(filename)
+            print(f"[OK] Удален исходный файл: {filename}")
+        except Exception as e:
+            print(f"[WARNING] Не удалось удалить файл {filename}: {e}")
 
-    print("\n" + "="*70)
-    print("[SUCCESS] Объединение завершено успешно")
-    print(f"[INFO] Создан файл: yields_data.json")
+    merge.save()
 
 if __name__ == "__main__":
     merge_yields_jsons()
@@ -0,0 +1,288 @@
+"""
+Реестр извлекателей метрик из ответов Power BI /query.
+Извлекатель выбирается по сигнатуре запроса (имена Select) один раз на сигнатуру и
+кешируется; порядок регистрации — порядок проверки, срабатывает первый подходящий.
+Новая визуализация дашборда = новая функция с декоратором @register_extractor.
+Извлекатель получает контекст результата и одну декодированную таблицу DM (DM0, DM1, ...,
+см. dsr_decoder) и пишет метрики в ctx.area_data.
+"""
+
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dsr_decoder import DsrTable, decode_secondary_labels
+
+Log = Callable[..., None]
+
+
+class MetricContext:
+    """Один результат ответа /query: куда писать метрики, набор данных DS, фильтры и Select запроса"""
+
+    __slots__ = ("area_data", "ds", "where", "select_names", "req_idx", "result_idx", "job_id", "log", "_labels")
+
+    def __init__(self, area_data: Dict[str, Any], ds: Dict[str, Any], where: Dict[str, Any], select_names: List[str], req_idx: int, result_idx: int, job_id: Any, log: Log) -> None:
+        self.area_data = area_data
+        self.ds = ds
+        self.where = where
+        self.select_names = select_names
+        self.req_idx = req_idx
+        self.result_idx = result_idx
+        self.job_id = job_id
+        self.log = log
+        self._labels: Optional[List[Any]] = None
+
+    def first_where(self, prop: str) -> Any:
+        return self.where.get(prop, [''])[0]
+
+    @property
+    def labels(self) -> List[Any]:
+        """Подписи вторичной оси (спальни, типы объектов, статусы), декодируются один раз"""
+        if self._labels is None:
+            self._labels = decode_secondary_labels(self.ds)
+        return self._labels
+
+
+Extractor = Callable[[MetricContext, DsrTable], None]
+Matcher = Callable[[List[str]], bool]
+
+EXTRACTORS: List[Tuple[Matcher, Extractor]] = []
+_resolved: Dict[Tuple[str, ...], Optional[Extractor]] = {}
+
+
+def register_extractor(matcher: Matcher) -> Callable[[Extractor], Extractor]:
+    """Регистрирует извлекатель для запросов, чьи имена Select подходят под matcher"""
+    def decorator(extractor: Extractor) -> Extractor:
+        EXTRACTORS.append((matcher, extractor))
+        _resolved.clear()
+        return extractor
+    return decorator
+
+
+def resolve_extractor(select_names: List[str]) -> Optional[Extractor]:
+    """Извлекатель для сигнатуры запроса (None — запрос не содержит известных метрик)"""
+    signature = tuple(select_names)
+    if signature not in _resolved:
+        _resolved[signature] = next((extractor for matcher, extractor in EXTRACTORS if matcher(select_names)), None)
+    return _resolved[signature]
+
+
+def first_measure(table: DsrTable) -> Any:
+    """Первая мера (M*) последней строки, где она есть"""
+    names = table.column_names('M')
+    value = None
+    for row in range(table.rows_count):
+        for name in names:
+            if table.columns[name][row] is not None:
+                value = table.columns[name][row]
+                break
+    return value
+
+
+def cast_value(value: Any, cast: Callable[[Any], Any]) -> Any:
+    return cast(value) if isinstance(value, (int, float, str)) else value
+
+
+def get_series(
+    table: DsrTable,
+    labels: List[Any],
+    period_key: Callable[[Any], Optional[str]],
+    cast: Callable[[Any], Any],
+) -> Dict[str, Dict[str, Any]]:
+    """{период: {подпись серии: значение}} для матрицы: период в G0, серии — ячейки X по оси I"""
+    periods = table.columns.get('G0', [None] * table.rows_count)
+    measure_names = [name for name in table.cells if name.startswith('M')]
+    by_row: Dict[int, Dict[str, Any]] = {}
+    for position, row in enumerate(table.cells['row']):
+        value = next((table.cells[name][position] for name in measure_names if table.cells[name][position] is not None), None)
+        if value is None:
+            continue
+        label_idx = table.cells['I'][position]
+        label = labels[label_idx] if labels and label_idx < len(labels) else str(label_idx)
+        by_row.setdefault(row, {})[label] = cast_value(value, cast)
+
+    series: Dict[str, Dict[str, Any]] = {}
+    for row, values in by_row.items():
+        period = period_key(periods[row]) if periods[row] is not None else None
+        if period is not None:
+            series[period] = values
+    return series
+
+
+def category_rows(table: DsrTable) -> List[Tuple[Any, Any]]:
+    """(категория, значение) таблицы без вторичной оси: первая группа G* (без схемы — C0)
+    и первая мера M* (без схемы — C1)"""
+    if table.cells['row']:
+        return []
+    category_name = next(iter(table.column_names('G')), 'C0')
+    value_name = next(iter(table.column_names('M')), 'C1')
+    if category_name not in table.columns or value_name not in table.columns:
+        return []
+    return [
+        (category, value)
+        for category, value in zip(table.columns[category_name], table.columns[value_name])
+        if category is not None
+    ]
+
+
+def month_key(timestamp: Any) -> Optional[str]:
+    if timestamp > 1000000000000:
+        return datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m')
+    return None
+
+
+@register_extractor(lambda names: '##Transaction Volume' in names[0])
+def extract_transaction_volume(ctx: MetricContext, table: DsrTable) -> None:
+    transaction_type = ctx.first_where('Transaction Type')
+    version = ctx.first_where('Version') if 'Version' in ctx.where else None
+    if transaction_type == 'Rent':
+        ctx.log(f'  [REQ #{ctx.req_idx}, RES #{ctx.result_idx}] TRX VOL Rent: version={version}, jobId={ctx.job_id}')
+    value = first_measure(table)
+    if value is None:
+        return
+    if transaction_type == 'Sales - Ready':
+        ctx.area_data['sales_volume']['ready_properties'] = float(value)
+        ctx.log(f'  [{ctx.req_idx}] sales_volume.ready_properties = {value}')
+    elif transaction_type == 'Sales - Off-Plan':
+        ctx.area_data['sales_volume']['off_plan_properties'] = float(value)
+        ctx.log(f'  [{ctx.req_idx}] sales_volume.off_plan_properties = {value}')
+    elif transaction_type == 'Rent':
+        if version == 'New':
+            ctx.area_data['rent_volume']['new_rentals'] = float(value)
+            ctx.log(f'  [{ctx.req_idx}] rent_volume.new_rentals = {value}')
+        elif version == 'Renewed':
+            ctx.area_data['rent_volume']['renewed_rentals'] = float(value)
+            ctx.log(f'  [{ctx.req_idx}] rent_volume.renewed_rentals = {value}')
+
+
+@register_extractor(lambda names: '##Transaction Avg Price' in names[0])
+def extract_transaction_avg_price(ctx: MetricContext, table: DsrTable) -> None:
+    transaction_type = ctx.first_where('Transaction Type')
+    version = ctx.first_where('Version') if 'Version' in ctx.where else None
+    value = first_measure(table)
+    if value is None:
+        return
+    if transaction_type == 'Sales - Ready':
+        ctx.area_data['sales_avg_price']['ready_properties'] = float(value)
+        ctx.log(f'  [{ctx.req_idx}] sales_avg_price.ready_properties = {value}')
+    elif transaction_type == 'Sales - Off-Plan':
+        ctx.area_data['sales_avg_price']['off_plan_properties'] = float(value)
+        ctx.log(f'  [{ctx.req_idx}] sales_avg_price.off_plan_properties = {value}')
+    elif transaction_type == 'Rent':
+        if version == 'New':
+            ctx.area_data['rent_avg_price']['new_rentals'] = float(value)
+            ctx.log(f'  [{ctx.req_idx}] rent_avg_price.new_rentals = {value} (version={version}, jobId={ctx.job_id})')
+        elif version == 'Renewed':
+            ctx.area_data['rent_avg_price']['renewed_rentals'] = float(value)
+            ctx.log(f'  [{ctx.req_idx}] rent_avg_price.renewed_rentals = {value} (version={version}, jobId={ctx.job_id})')
+
+
+@register_extractor(lambda names: '#Listing Volume' in names[0])
+def extract_listing_volume(ctx: MetricContext, table: DsrTable) -> None:
+    listing_type = ctx.first_where('Listing Type')
+    value = first_measure(table)
+    if value is None:
+        return
+    if listing_type == 'Sale':
+        ctx.area_data['sales_listing_volume'] = float(value)
+        ctx.log(f'  [{ctx.req_idx}] sales_listing_volume = {value}')
+    elif listing_type == 'Rent':
+        ctx.area_data['rent_listing_volume'] = float(value)
+        ctx.log(f'  [{ctx.req_idx}] rent_listing_volume = {value}')
+
+
+@register_extractor(lambda names: '#Listing Avg Price' in names[0])
+def extract_listing_avg_price(ctx: MetricContext, table: DsrTable) -> None:
+    listing_type = ctx.first_where('Listing Type')
+    value = first_measure(table)
+    if value is None:
+        return
+    if listing_type == 'Sale':
+        ctx.area_data['sales_listing_avg_price'] = float(value)
+        ctx.log(f'  [{ctx.req_idx}] sales_listing_avg_price = {value}')
+    elif listing_type == 'Rent':
+        ctx.area_data['rent_listing_avg_price'] = float(value)
+        ctx.log(f'  [{ctx.req_idx}] rent_listing_avg_price = {value}')
+
+
+INDICATOR_TRENDS = {
+    'Sales Prices': 'sales_price_trend',
+    'Rent Values': 'rent_price_trend',
+    'Yield Rates': 'gross_rental_yield',
+    'Price-to-Rent Ratios': 'price_to_rent_ratio',
+}
+
+
+@register_extractor(lambda names: 'Avg(pbi_ae_indicators_mv.Value)' in names[0])
+def extract_indicator_trend(ctx: MetricContext, table: DsrTable) -> None:
+    """Помесячные индикаторы по спальням"""
+    metric = INDICATOR_TRENDS.get(ctx.first_where('Data Type'))
+    if 'G0' not in table.columns:
+        return
+    monthly_data_by_bedroom = get_series(table, ctx.labels, month_key, float)
+    if monthly_data_by_bedroom and metric:
+        ctx.area_data[metric] = monthly_data_by_bedroom
+        ctx.log(f'  [{ctx.req_idx}] {metric}: {len(monthly_data_by_bedroom)} месяцев')
+
+
+YEARLY_INDICATORS = {
+    'Occupancy Rate': 'occupancy_rate',
+    'Service Charges': 'average_service_charges',
+}
+
+
+@register_extractor(lambda names: 'Sum(pbi_ae_indicators_mv.value)' in names[0] and 'Calendar.Year' in names)
+def extract_yearly_indicator(ctx: MetricContext, table: DsrTable) -> None:
+    """Годовые индикаторы по типам объектов"""
+    metric = YEARLY_INDICATORS.get(ctx.first_where('Data Type'))
+    if not (metric and 'G0' in table.columns):
+        return
+    yearly_data_by_property = get_series(table, ctx.labels, str, float)
+    if yearly_data_by_property:
+        ctx.area_data[metric] = yearly_data_by_property
+        ctx.log(f'  [{ctx.req_idx}] {metric}: {len(yearly_data_by_property)} лет')
+
+
+SUPPLY_BY_BEDROOM = {
+    'Existing': 'ready_supply_by_bedroom',
+    'Under Construction': 'upcoming_supply_by_bedroom',
+}
+
+
+@register_extractor(lambda names: 'Sum(pbi_ae_supply_mv.number_of_unit)' in names[0])
+def extract_supply(ctx: MetricContext, table: DsrTable) -> None:
+    """Предложение по статусам либо по спальням (статус из фильтра)"""
+    status = ctx.where.get('Status', [''])[0] if isinstance(ctx.where.get('Status', ['']), list) else ctx.where.get('Status', '')
+    rows = category_rows(table)
+    if not rows:
+        return
+
+    if 'pbi_ae_supply_mv.property_status' in ctx.select_names:
+        supply_by_status = dict(rows)
+        if supply_by_status:
+            ctx.area_data['residential_supply'] = supply_by_status
+            ctx.log(f'  [{ctx.req_idx}] residential_supply: {len(supply_by_status)} статусов')
+        return
+
+    # Без схемы S категория остаётся индексом в ValueDicts.D0
+    bedroom_labels = ctx.ds.get('ValueDicts', {}).get('D0', [])
+    categories_data = {}
+    for category, category_value in rows:
+        if isinstance(category, int) and bedroom_labels and category < len(bedroom_labels):
+            categories_data[bedroom_labels[category]] = category_value
+        else:
+            categories_data[str(category)] = category_value
+    metric = SUPPLY_BY_BEDROOM.get(status)
+    if categories_data and metric:
+        ctx.area_data[metric] = categories_data
+        ctx.log(f'  [{ctx.req_idx}] {metric}: {len(categories_data)} категорий')
+
+
+@register_extractor(lambda names: 'Sum(pbi_ae_supply_mv.Units)' in names and 'pbi_ae_supply_mv.property_status' in names)
+def extract_supply_trend(ctx: MetricContext, table: DsrTable) -> None:
+    """Предложение по годам и статусам"""
+    if 'G0' not in table.columns:
+        return
+    yearly_supply_by_status = get_series(table, ctx.labels, str, int)
+    if yearly_supply_by_status:
+        ctx.area_data['residential_supply_trend_by_year'] = yearly_supply_by_status
+        ctx.log(f'  [{ctx.req_idx}] residential_supply_trend_by_year: {len(yearly_supply_by_status)} лет')
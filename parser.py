@@ -1,19 +1,16 @@
-from playwright.sync_api import sync_playwright
-import json
+from playwright.async_api import async_playwright
+import asyncio
 from datetime import datetime, timedelta
-from collections import defaultdict
 import os
-import subprocess
-from typing import Any, Dict, List, Optional, Tuple
-
-def load_config() -> Dict[str, Any]:
-    config_file = os.path.join(os.getcwd(), "config.json")
-    if not os.path.exists(config_file):
-        print("[ERROR] config.json не найден")
-        return {}
-    with open(config_file, "r", encoding="utf-8") as f:
-        config: Dict[str, Any] = json.load(f)
-    return config
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from log_levels import configure_logging, flush_log, log_area, log_debug, log_line
+from powerbi_replay import create_template_handler, replay_area_day
+from query_spec import compile_request
+from query_waiter import QueryExpectations, QueryWaiter, get_expectation_key, request_signature
+from raw_journal import append_entry, compact_journal, get_journal_path, get_queries_path, load_raw_result, save_failed_units, write_raw_result
+from scheduler import claim_batches, estimate_costs, load_area_hierarchy, load_area_timings, record_area_timing
+from scraper_core import find_locator, load_config, open_session, wait_for_locator
 
 config = load_config()
 auth_config = config["auth"]
@@ -21,6 +18,12 @@ DEVICE_ID = auth_config["device_id"]
 USERNAME = auth_config["username"]
 PASSWORD = auth_config["password"]
 
+DASHBOARD_URL = "https://insight.reidin.com/home/dashboard/754"
+
+def select_main_areas(areas: List[str]) -> List[str]:
+    """Только главные районы: подрайоны обрабатываются вместе со своим районом"""
+    return [area for area in areas if " - " not in area]
+
 def load_areas() -> List[str]:
     if not os.path.exists("areas.txt"):
         print("[ERROR] Файл areas.txt не найден")
@@ -28,7 +31,7 @@ def load_areas() -> List[str]:
     with open("areas.txt", "r", encoding="utf-8") as f:
         areas = [line.strip() for line in f if line.strip()]
     
-    main_areas = [area for area in areas if " - " not in area]
+    main_areas = select_main_areas(areas)
     
     skipped = len(areas) - len(main_areas)
     if skipped > 0:
@@ -43,23 +46,7 @@ def parse_areas_with_subareas() -> Dict[str, List[str]]:
         print("[ERROR] Файл all_areas.txt не найден")
         return {}
     
-    areas_structure: Dict[str, List[str]] = {}
-    current_area = None
-    
-    with open("all_areas.txt", "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            
-            if " - " in line:
-                area_part, subarea_part = line.split(" - ", 1)
-                if current_area and area_part == current_area:
-                    areas_structure[current_area].append(subarea_part)
-            else:
-                current_area = line
-                if current_area not in areas_structure:
-                    areas_structure[current_area] = []
+    areas_structure = load_area_hierarchy("all_areas.txt")
     
     total_subareas = sum(len(subareas) for subareas in areas_structure.values())
     print(f"[OK] Загружено {len(areas_structure)} районов и {total_subareas} подрайонов")
@@ -67,537 +54,764 @@ def parse_areas_with_subareas() -> Dict[str, List[str]]:
 
 def get_default_area() -> str:
     """Получает дефолтный район из конфига или возвращает Business Bay"""
-    return config.get("default_area", "Business Bay")
+    return str(config.get("default_area", "Business Bay"))
 
-def create_handle_response(area_name: str, captured_requests: List[Dict[str, Any]], page: Any) -> Any:
-    """Фабрика для создания обработчика ответов для конкретного района"""
-    def handle_response(response: Any) -> None:
-        url = response.url
-        if "/query" in url:
-            try:
-                request_data = response.request.post_data
-                response_data = response.json()
-                if not request_data:
-                    return
-                
-                request_json = json.loads(request_data)
-                
-                captured_requests.append({
-                    "request": request_json,
-                    "response": response_data
-                })
-                
-                print(f"[API {area_name}] Запрос перехвачен (всего: {len(captured_requests)})")
-            except Exception as e:
-                print(f"[ERROR] {url}: {e}")
-    return handle_response
+def get_replay_config() -> Dict[str, Any]:
+    """Настройки replay режима (прямые POST /query вместо кликов по слайсерам)"""
+    replay_config: Dict[str, Any] = config.get("replay", {})
+    return replay_config
 
-def main() -> None:
-    areas = load_areas()
-    if not areas:
-        return
-    
-    areas_structure = parse_areas_with_subareas()
-    
-    with sync_playwright() as pw:
-        browser = pw.chromium.launch(headless=True)
-        context = browser.new_context()
+def get_query_wait_config() -> Dict[str, Any]:
+    """Настройки ожидания ответов /query (таймаут шага, тишина, ожидание первого запроса)"""
+    wait_config: Dict[str, Any] = config.get("query_wait", {})
+    return wait_config
 
-        page = context.new_page()
+def get_recycle_config() -> Dict[str, Any]:
+    """Пороги пересоздания страницы дашборда (размер JS-кучи, ошибки подряд)"""
+    recycle_config: Dict[str, Any] = config.get("recycle", {})
+    return recycle_config
 
-        page.goto("https://insight.reidin.com/", wait_until="load", timeout=60000)
+def get_retry_config() -> Dict[str, Any]:
+    """Настройки повтора несобранных пар (дата, район) в конце сессии (попытки, пауза)"""
+    retry_config: Dict[str, Any] = config.get("retry", {})
+    return retry_config
 
-        page.evaluate(f"localStorage.setItem('deviceId', '{DEVICE_ID}');")
-        print("[OK] device_id установлен")
+def is_resume_enabled() -> bool:
+    """Режим продолжения: пропускать пары (дата, район), уже полностью собранные в raw"""
+    return bool(config.get("resume", False))
 
-        page.goto("https://insight.reidin.com/auth/login", wait_until="load", timeout=60000)
-        print("[OK] Страница логина открыта")
+def get_pair_signatures(requests: List[Dict[str, Any]]) -> Set[str]:
+    """Сигнатуры запросов, собранных для пары (дата, район)"""
+    signatures: Set[str] = set()
+    for req in requests:
+        signature = request_signature(req.get('request'))
+        if signature is not None:
+            signatures.add(signature)
+    return signatures
 
-        page.fill('#input-emaillogin-desktop', USERNAME)
-        page.fill('#input-passwordlogin-desktop', PASSWORD)
+def get_expected_signatures(expectations: QueryExpectations, area_key: str, is_first_date: bool) -> Set[str]:
+    """Сигнатуры, которые должны быть у пары: шаг захвата даты, а у первой даты ещё и клик по району
+    (базовые метрики сохраняются под первой датой)"""
+    steps = ("select_area", "date_end_capture") if is_first_date else ("date_start_capture",)
+    expected: Set[str] = set()
+    for step in steps:
+        expected |= expectations.get(get_expectation_key(step, area_key))
+    return expected
 
-        page.locator('xpath=//input[@id="input-emaillogin-desktop"]/ancestor::form[1]//button[@type="submit"]').click()
+def get_complete_pairs(all_dates_result: Dict[str, Dict[str, Any]], dates_to_process: List[Any], expectations: QueryExpectations) -> Set[Tuple[str, str]]:
+    """Пары (дата, район), где есть ответ на каждую ожидаемую сигнатуру /query (выученную QueryWaiter).
+    Пока сигнатуры для шага не выучены (replay или raw без <имя>.queries.json), ожидаемыми считаются
+    все сигнатуры, собранные в raw для пар того же вида: первая/остальные даты, район/подрайон"""
+    pair_signatures: Dict[Tuple[str, str], Set[str]] = {}
+    observed: Dict[Tuple[bool, bool], Set[str]] = {}
+    for day_index, date_item in enumerate(dates_to_process):
+        date_key = get_date_key(date_item)
+        for area_key, requests in all_dates_result.get(date_key, {}).items():
+            if not requests:
+                continue
+            signatures = get_pair_signatures(requests)
+            pair_signatures[(date_key, area_key)] = signatures
+            observed.setdefault((day_index == 0, " - " in area_key), set()).update(signatures)
 
-        page.wait_for_load_state("networkidle", timeout=60000)
+    first_date_key = get_date_key(dates_to_process[0]) if dates_to_process else None
+    complete_pairs: Set[Tuple[str, str]] = set()
+    for (date_key, area_key), signatures in pair_signatures.items():
+        is_first_date = date_key == first_date_key
+        expected = get_expected_signatures(expectations, area_key, is_first_date) or observed[(is_first_date, " - " in area_key)]
+        if expected <= signatures:
+            complete_pairs.add((date_key, area_key))
+    return complete_pairs
 
-        context.storage_state(path="state.json")
-        print("[OK] Авторизация успешна. state.json сохранён.")
+def get_area_keys(areas: List[str], areas_structure: Dict[str, List[str]]) -> List[str]:
+    """Ключи районов в raw: район и все его подрайоны ('Район - Подрайон')"""
+    area_keys = []
+    for area in areas:
+        area_keys.append(area)
+        area_keys.extend(f"{area} - {subarea}" for subarea in areas_structure.get(area, []))
+    return area_keys
 
-        page.goto("https://insight.reidin.com/home/dashboard/754", wait_until="load", timeout=60000)
-        print("[OK] Dashboard открыт")
+def get_failed_units(all_dates_result: Dict[str, Dict[str, Any]], dates_to_process: List[Any], area_keys: List[str], expectations: QueryExpectations) -> List[Tuple[str, str]]:
+    """Пары (дата, район) из area_keys, которые не собраны или собраны не полностью"""
+    complete_pairs = get_complete_pairs(all_dates_result, dates_to_process, expectations)
+    return [
+        (get_date_key(date_item), area_key)
+        for area_key in area_keys
+        for date_item in dates_to_process
+        if (get_date_key(date_item), area_key) not in complete_pairs
+    ]
 
-        default_area = get_default_area()
-        print(f"[INFO] Перехватываю данные дефолтного района: {default_area}")
-        
-        default_base_requests = []
-        default_handler = create_handle_response(default_area, default_base_requests, page)
-        page.on("response", default_handler)
-        
-        try:
-            page.wait_for_load_state("networkidle", timeout=10000)
-        except:
-            pass
-        print(f"[OK] Dashboard загружен. Перехвачено {len(default_base_requests)} запросов для {default_area}")
+def get_retry_delays() -> List[float]:
+    """Паузы перед попытками повтора: base_delay_s, затем вдвое больше каждый раз"""
+    retry_config = get_retry_config()
+    attempts = int(retry_config.get("attempts", 3))
+    base_delay = float(retry_config.get("base_delay_s", 5))
+    return [base_delay * 2 ** attempt for attempt in range(attempts)]
 
-        page.remove_listener("response", default_handler)
-        
-        print("[INFO] Ожидание полной загрузки страницы (10 сек)...")
-        page.wait_for_timeout(10000)
-
-        start_date_str = os.environ.get("PARSER_START_DATE")
-        end_date_str = os.environ.get("PARSER_END_DATE")
-        everyday_str = os.environ.get("PARSER_EVERYDAY").lower()
-        everyday = everyday_str == "true"
-        if start_date_str and end_date_str:
-            print(f"[INFO] Даты из конфига: {start_date_str} - {end_date_str} (everyday: {everyday})")
-            start_date = datetime.strptime(start_date_str, "%d.%m.%Y")
-            end_date = datetime.strptime(end_date_str, "%d.%m.%Y")
-        else:
-            print(f"[INFO] Даты из окружения не найдены, использую default: -10 до -4 дней")
-            start_date = datetime.now() - timedelta(days=10)
-            end_date = datetime.now() - timedelta(days=4)
-            everyday = True
-        dates_to_process = []
-        if everyday:
-            current_date = start_date
-            while current_date <= end_date:
-                dates_to_process.append(current_date.strftime("%d.%m.%Y"))
-                current_date += timedelta(days=1)
-            print(f"[INFO] Режим EVERYDAY: буду обрабатывать {len(dates_to_process)} дат")
-        else:
-            dates_to_process = [
-                (start_date.strftime("%d.%m.%Y"), end_date.strftime("%d.%m.%Y"))
-            ]
-            print(f"[INFO] Режим RANGE: один снимок от {start_date_str} до {end_date_str}")
-        print(f"[INFO] Даты обработки: {dates_to_process}")
-        output_raw_file = os.environ.get("PARSER_OUTPUT_RAW_FILE")
-        output_file = os.path.join(os.getcwd(), output_raw_file)
-        if os.path.exists(output_file):
-            print(f"[INFO] Загружаю существующие данные из {output_file}...")
-            with open(output_file, "r", encoding="utf-8") as f:
-                all_dates_result = json.load(f)
-            print(f"[OK] Загружено {sum(len(areas) for areas in all_dates_result.values())} районов")
-        else:
-            print(f"[INFO] Создаю новый файл {output_file}...")
-            all_dates_result = {}
-        if everyday:
-            for date_key in dates_to_process:
-                if date_key not in all_dates_result:
-                    all_dates_result[date_key] = {}
+def is_area_complete(area_key: str, dates_to_process: List[Any], complete_pairs: Set[Tuple[str, str]]) -> bool:
+    return all((get_date_key(date_item), area_key) in complete_pairs for date_item in dates_to_process)
+
+def get_workers_count() -> int:
+    """Количество параллельных страниц дашборда из конфига (по умолчанию 1)"""
+    return max(1, int(config.get("workers", 1)))
+
+def get_date_key(date_pair: Any) -> str:
+    """Ключ даты в результате: 'DD.MM.YYYY' или 'DD.MM.YYYY-DD.MM.YYYY' для диапазона"""
+    if isinstance(date_pair, tuple):
+        return f"{date_pair[0]}-{date_pair[1]}"
+    return str(date_pair)
+
+def split_date_pair(date_pair: Any) -> Tuple[str, str]:
+    """(дата начала, дата окончания) для дня или диапазона"""
+    if isinstance(date_pair, tuple):
+        return date_pair[0], date_pair[1]
+    return str(date_pair), str(date_pair)
+
+def get_request_key(req: Dict[str, Any]) -> Optional[str]:
+    """Создаёт уникальный ключ для запроса из SELECT + WHERE условий"""
+    return compile_request(req.get('request', {})).key
+
+def store_base_requests(all_dates_result: Dict[str, Dict[str, Any]], dates_to_process: List[Any], area_key: str, requests: List[Dict[str, Any]]) -> None:
+    """Сохраняет базовые метрики района под ключом первой даты"""
+    if not dates_to_process:
+        return
+    date_key = get_date_key(dates_to_process[0])
+    if date_key not in all_dates_result:
+        all_dates_result[date_key] = {}
+    all_dates_result[date_key][area_key] = requests.copy()
+
+async def open_dashboard_page(context: Any, expectations: QueryExpectations) -> Tuple[Any, QueryWaiter]:
+    """Открывает дашборд 754 в новой странице контекста и ждёт, пока визуализации загрузят данные"""
+    page = await context.new_page()
+    waiter = QueryWaiter(page, get_query_wait_config(), expectations)
+    await waiter.perform(
+        "dashboard",
+        lambda: page.goto(DASHBOARD_URL, wait_until="load", timeout=60000),
+        timeout_ms=60000,
+        start_ms=20000,
+    )
+    return page, waiter
+
+async def fill_date_input(date_input: Optional[Any], value: str) -> bool:
+    """Очищает поле даты и вводит новое значение"""
+    if date_input is None:
+        return False
+    await date_input.first.clear()
+    await date_input.first.fill(value)
+    return True
+
+async def process_area_day(waiter: QueryWaiter, all_dates_result: Dict[str, Dict[str, Any]], area_name: str, date_pair: Any, is_first_day: bool) -> List[Dict[str, Any]]:
+    """Обрабатывает один день (или диапазон) для одного района"""
+    page = waiter.page
+    date_start_str, date_end_str = split_date_pair(date_pair)
+    if isinstance(date_pair, tuple):
+        date_display = f"{date_start_str} - {date_end_str}"
+    else:
+        date_display = date_pair
+
+    log_debug(f"\n    [DATE] {area_name}: {date_display} (день {'1' if is_first_day else '2+'})", area_name)
+
+    captured_requests: List[Dict[str, Any]] = []
+
+    try:
+        date_start_input = await find_locator(page, 'input[aria-label^="Дата начала"]')
+        date_end_input = await find_locator(page, 'input[aria-label^="Дата окончания"]')
+        # Порядок полей такой, чтобы дата начала не оказалась позже даты окончания; перехватываются ответы на второе
+        if is_first_day:
+            first_step = ("date_start", date_start_input, date_start_str, "Дата начала")
+            second_step = ("date_end", date_end_input, date_end_str, "Дата окончания")
         else:
-            date_range_key = f"{dates_to_process[0][0]}-{dates_to_process[0][1]}"
-            if date_range_key not in all_dates_result:
-                all_dates_result[date_range_key] = {}
-        def process_area_day(area_name, date_pair, is_first_day, base_captured_requests):
-            """Обрабатывает один день (или диапазон) для одного района"""
-            if isinstance(date_pair, tuple):
-                date_start_str, date_end_str = date_pair
-                date_display = f"{date_start_str} - {date_end_str}"
-            else:
-                date_start_str = date_end_str = date_pair
-                date_display = date_pair
-            
-            print(f"\n    [DATE] {area_name}: {date_display} (день {'1' if is_first_day else '2+'})")
-            
-            captured_requests = []
-            response_handler = None
-            
-            try:
-                date_start_input = page.locator('input[aria-label^="Дата начала"]')
-                if date_start_input.count() == 0:
-                    for frame in page.frames:
-                        date_start_input = frame.locator('input[aria-label^="Дата начала"]')
-                        if date_start_input.count() > 0:
-                            break
-                date_end_input = page.locator('input[aria-label^="Дата окончания"]')
-                if date_end_input.count() == 0:
-                    for frame in page.frames:
-                        date_end_input = frame.locator('input[aria-label^="Дата окончания"]')
-                        if date_end_input.count() > 0:
-                            break
-                if is_first_day:
-                    if date_start_input.count() > 0:
-                        date_start_input.first.clear()
-                        date_start_input.first.fill(date_start_str)
-                        page.wait_for_timeout(500)
-                        print(f"      [OK] Дата начала: {date_start_str}")
-                    try:
-                        page.wait_for_load_state("networkidle", timeout=2000)
-                    except:
-                        pass
-                    
-                    print(f"      [INFO] Подключаю обработчик для перехвата запросов...")
-                    response_handler = create_handle_response(area_name, captured_requests, page)
-                    page.on("response", response_handler)
-                    
-                    if date_end_input.count() > 0:
-                        date_end_input.first.clear()
-                        date_end_input.first.fill(date_end_str)
-                        page.wait_for_timeout(500)
-                        print(f"      [OK] Дата окончания: {date_end_str}")
+            first_step = ("date_end", date_end_input, date_end_str, "Дата окончания")
+            second_step = ("date_start", date_start_input, date_start_str, "Дата начала")
+
+        step, date_input, value, label = first_step
+        await waiter.perform(f"{step}_prepare", lambda: fill_date_input(date_input, value))
+        if date_input is not None:
+            log_debug(f"      [OK] {label}: {value}", area_name)
+
+        log_debug(f"      [INFO] Подключаю обработчик для перехвата запросов...", area_name)
+        step, date_input, value, label = second_step
+        captured_requests = await waiter.perform(f"{step}_capture", lambda: fill_date_input(date_input, value), area_name)
+        if date_input is not None:
+            log_debug(f"      [OK] {label}: {value}", area_name)
+    except Exception as e:
+        log_line(f"      [ERROR] Ошибка при установке дат: {e}")
+
+    date_key = get_date_key(date_pair)
+    new_requests = captured_requests.copy()
+
+    if date_key in all_dates_result and area_name in all_dates_result[date_key]:
+        existing_requests = all_dates_result[date_key][area_name]
+
+        existing_by_key = {}
+        for req in existing_requests:
+            key = get_request_key(req)
+            if key:
+                existing_by_key[key] = req
+
+        updated_count = 0
+        added_count = 0
+        for new_req in new_requests:
+            key = get_request_key(new_req)
+            if key:
+                if key in existing_by_key:
+                    existing_by_key[key] = new_req
+                    updated_count += 1
                 else:
-                    if date_end_input.count() > 0:
-                        date_end_input.first.clear()
-                        date_end_input.first.fill(date_end_str)
-                        page.wait_for_timeout(500)
-                        print(f"      [OK] Дата окончания: {date_end_str}")
+                    existing_by_key[key] = new_req
+                    added_count += 1
+
+        all_requests = list(existing_by_key.values())
+        log_debug(f"      [OK] {area_name} завершен (обновлено: {updated_count}, добавлено: {added_count}, итого: {len(all_requests)})", area_name)
+    else:
+        all_requests = new_requests
+        log_debug(f"      [OK] {area_name} завершен (новых: {len(all_requests)})", area_name)
+
+    if date_key not in all_dates_result:
+        all_dates_result[date_key] = {}
+    all_dates_result[date_key][area_name] = all_requests
+
+    return all_requests
+
+async def set_date_to_today(waiter: QueryWaiter) -> None:
+    page = waiter.page
+    year_ago = (datetime.now() - timedelta(days=365)).strftime("%d.%m.%Y")
+    today_str = datetime.now().strftime("%d.%m.%Y")
+    print(f"  [INFO] Устанавливаю диапазон дат: {year_ago} - {today_str}")
+    try:
+        date_start_input = await find_locator(page, 'input[aria-label^="Дата начала"]')
+        date_end_input = await find_locator(page, 'input[aria-label^="Дата окончания"]')
+
+        async def fill_range() -> None:
+            await fill_date_input(date_start_input, year_ago)
+            await fill_date_input(date_end_input, today_str)
+
+        await waiter.perform("reset_dates", fill_range)
+    except Exception as e:
+        print(f"  [ERROR] Ошибка при установке диапазона дат: {e}")
+
+async def search_in_dropdown(waiter: QueryWaiter, dropdown_menu: Any, text: str) -> bool:
+    """Открывает слайсер районов и посимвольно вводит текст в поиск"""
+    page = waiter.page
+    await dropdown_menu.first.click()
+    search_header = await wait_for_locator(page, 'div.searchHeader.show')
+    if search_header is None:
+        return False
+    search_input = search_header.locator('input.searchInput')
+    if await search_input.count() == 0:
+        return False
+    await search_input.first.clear()
+    await waiter.perform("search", lambda: search_input.first.type(text, delay=80))
+    return True
+
+async def capture_click(waiter: QueryWaiter, element: Any, area_key: str) -> List[Dict[str, Any]]:
+    """Кликает по элементу слайсера и перехватывает /query ответы на клик"""
+    return await waiter.perform("select_area", element.click, area_key)
+
+async def process_dates(waiter: QueryWaiter, area_key: str, dates_to_process: List[Any], all_dates_result: Dict[str, Dict[str, Any]], journal_file: str, complete_pairs: Set[Tuple[str, str]]) -> None:
+    """Обрабатывает все даты района, каждый снимок (дата, район) дописывается в журнал"""
+    for day_index, date_str in enumerate(dates_to_process):
+        is_first_day = (day_index == 0)
+        if (get_date_key(date_str), area_key) in complete_pairs:
+            log_debug(f"    [RESUME] {area_key}: {get_date_key(date_str)} уже собран, пропускаю", area_key)
+            continue
+        all_requests = await process_area_day(waiter, all_dates_result, area_key, date_str, is_first_day)
+        append_entry(journal_file, get_date_key(date_str), area_key, all_requests)
+    await set_date_to_today(waiter)
+    flush_log()
+
+async def process_area(waiter: QueryWaiter, area: str, areas_structure: Dict[str, List[str]], dates_to_process: List[Any], all_dates_result: Dict[str, Dict[str, Any]], journal_file: str, complete_pairs: Set[Tuple[str, str]]) -> bool:
+    """Обрабатывает район и все его подрайоны на указанной странице. False — район пропущен или не найден"""
+    page = waiter.page
+    subareas = areas_structure.get(area, [])
+    area_complete = is_area_complete(area, dates_to_process, complete_pairs)
+    pending_subareas = [
+        subarea for subarea in subareas
+        if not is_area_complete(f"{area} - {subarea}", dates_to_process, complete_pairs)
+    ]
+    if area_complete and not pending_subareas:
+        log_area(f"\n[RESUME] {area} и все подрайоны уже собраны, пропускаю", area)
+        return False
+    log_debug(f"\n{'='*60}\n[PROCESSING] {area}\n{'='*60}", area)
+    dropdown_menu = await find_locator(page, 'div.slicer-dropdown-menu[aria-label*="Area, Community"]')
+    if dropdown_menu is None:
+        log_line(f"[ERROR] Не найден dropdown для района: {area}")
+        return False
+    if not await search_in_dropdown(waiter, dropdown_menu, area):
+        log_line(f"[WARNING] Не найден инпут поиска для района: {area}")
+        return False
+    scroll_region = await find_locator(page, 'div.scrollRegion')
+    if scroll_region is None:
+        log_line(f"[WARNING] Не найден элемент для района: {area}")
+        return False
+    all_rows = scroll_region.locator('div.row')
+    rows_count = await all_rows.count()
+    target_element = None
+    for i in range(rows_count):
+        row = all_rows.nth(i)
+        element_with_title = row.locator(f'[title="{area}"]')
+        if await element_with_title.count() > 0:
+            target_element = element_with_title.first
+            break
+        all_elements = row.locator('*')
+        for j in range(await all_elements.count()):
+            elem = all_elements.nth(j)
+            try:
+                if area in (await elem.text_content() or ""):
+                    target_element = elem
+                    break
+            except:
+                pass
+        if target_element:
+            break
+    if not target_element and rows_count > 0:
+        first_row = all_rows.first
+        first_elem = first_row.locator('*').first
+        if await first_elem.count() > 0:
+            target_element = first_elem
+    if not target_element:
+        log_line(f"[WARNING] Не найден элемент для района: {area}")
+        return False
+
+    expand_button = target_element.locator('div.expandButton')
+    if await expand_button.count() > 0:
+        log_debug(f"  [INFO] Раскрываю подрайоны...", area)
+        await waiter.perform("expand", expand_button.first.click)
+
+    log_debug(f"  [INFO] Подрайонов для обработки: {len(subareas)} ({', '.join(subareas[:5])}{'...' if len(subareas) > 5 else ''})", area)
+
+    log_debug(f"  [INFO] Подключен обработчик для перехвата базовых метрик главного района...", area)
+    base_captured_requests = await capture_click(waiter, target_element, area)
+    log_debug(f"  [OK] Базовые метрики главного района перехвачены: {len(base_captured_requests)} запросов", area)
+
+    if area_complete:
+        log_debug(f"  [RESUME] Даты главного района уже собраны", area)
+    else:
+        if dates_to_process and (get_date_key(dates_to_process[0]), area) not in complete_pairs:
+            store_base_requests(all_dates_result, dates_to_process, area, base_captured_requests)
+        await process_dates(waiter, area, dates_to_process, all_dates_result, journal_file, complete_pairs)
+
+    for subarea in subareas:
+        if subarea not in pending_subareas:
+            log_debug(f"\n  [RESUME] {area} -> {subarea} уже собран, пропускаю", area)
+            continue
+        log_debug(f"\n  {'='*50}\n  [SUBAREA] {area} -> {subarea}\n  {'='*50}", area)
+
+        log_debug(f"    [INFO] Поиск подрайона: {subarea}", area)
+        await search_in_dropdown(waiter, dropdown_menu, subarea)
+
+        scroll_region_sub = await find_locator(page, 'div.scrollRegion')
+        subarea_element = None
+
+        if scroll_region_sub is not None:
+            all_rows_sub = scroll_region_sub.locator('div.row')
+            for i in range(await all_rows_sub.count()):
+                row = all_rows_sub.nth(i)
+                slicer_items = row.locator('div.slicerItemContainer')
+                for j in range(await slicer_items.count()):
+                    slicer_item = slicer_items.nth(j)
                     try:
-                        page.wait_for_load_state("networkidle", timeout=2000)
+                        aria_level = await slicer_item.get_attribute('aria-level')
+                        item_title = await slicer_item.get_attribute('title')
+                        if aria_level == '2' and item_title and subarea in item_title:
+                            subarea_element = slicer_item
+                            log_debug(f"    [OK] Найден подрайон: {item_title}", area)
+                            break
                     except:
                         pass
-                    
-                    print(f"      [INFO] Подключаю обработчик для перехвата запросов...")
-                    response_handler = create_handle_response(area_name, captured_requests, page)
-                    page.on("response", response_handler)
-                    
-                    if date_start_input.count() > 0:
-                        date_start_input.first.clear()
-                        date_start_input.first.fill(date_start_str)
-                        page.wait_for_timeout(500)
-                        print(f"      [OK] Дата начала: {date_start_str}")
-                try:
-                    page.wait_for_load_state("networkidle", timeout=3000)
-                except:
-                    pass
-                page.wait_for_timeout(2000)
-            except Exception as e:
-                print(f"      [ERROR] Ошибка при установке дат: {e}")
-            if response_handler:
-                page.remove_listener("response", response_handler)
-            
-            if isinstance(date_pair, tuple):
-                date_key = f"{date_pair[0]}-{date_pair[1]}"
-            else:
-                date_key = date_pair
-            
-            new_requests = captured_requests.copy()
-            
-            def get_request_key(req):
-                """Создаёт уникальный ключ для запроса из SELECT + WHERE условий"""
-                queries = req.get('request', {}).get('queries', [])
-                if not queries:
-                    return None
-                
-                query = queries[0]
-                cmd = query.get('Query', {}).get('Commands', [{}])[0]
-                sq = cmd.get('SemanticQueryDataShapeCommand', {}).get('Query', {})
-                
-                select_list = sq.get('Select', [])
-                select_name = select_list[0].get('Name', '') if select_list else ''
-                
-                where_parts = []
-                for where in sq.get('Where', []):
-                    cond = where.get('Condition', {})
-                    if 'In' in cond:
-                        prop = cond['In']['Expressions'][0].get('Column', {}).get('Property', '')
-                        vals = cond['In'].get('Values', [])
-                        clean_vals = []
-                        for val_group in vals:
-                            for val_item in val_group:
-                                if 'Literal' in val_item:
-                                    clean_vals.append(val_item['Literal']['Value'].strip("'"))
-                        where_parts.append(f"{prop}={'|'.join(sorted(clean_vals))}")
-                
-                key = select_name + '::' + '::'.join(sorted(where_parts))
-                return key
-            
-            if date_key in all_dates_result and area_name in all_dates_result[date_key]:
-                existing_requests = all_dates_result[date_key][area_name]
-                
-                existing_by_key = {}
-                for req in existing_requests:
-                    key = get_request_key(req)
-                    if key:
-                        existing_by_key[key] = req
-                
-                updated_count = 0
-                added_count = 0
-                for new_req in new_requests:
-                    key = get_request_key(new_req)
-                    if key:
-                        if key in existing_by_key:
-                            existing_by_key[key] = new_req
-                            updated_count += 1
-                        else:
-                            existing_by_key[key] = new_req
-                            added_count += 1
-                
-                all_requests = list(existing_by_key.values())
-                print(f"      [OK] {area_name} завершен (обновлено: {updated_count}, добавлено: {added_count}, итого: {len(all_requests)})")
-            else:
-                all_requests = new_requests
-                print(f"      [OK] {area_name} завершен (новых: {len(all_requests)})")
-            
-            all_dates_result[date_key][area_name] = all_requests
-            
-            return all_requests
-        def set_date_to_today():
-            year_ago = (datetime.now() - timedelta(days=365)).strftime("%d.%m.%Y")
-            today_str = datetime.now().strftime("%d.%m.%Y")
-            print(f"  [INFO] Устанавливаю диапазон дат: {year_ago} - {today_str}")
+                if subarea_element:
+                    break
+
+        if not subarea_element:
+            log_line(f"    [WARNING] Не найден элемент для подрайона: {subarea}")
+            continue
+
+        subarea_key = f"{area} - {subarea}"
+        log_debug(f"    [INFO] Подключен обработчик для подрайона...", area)
+        subarea_captured_requests = await capture_click(waiter, subarea_element, subarea_key)
+        log_debug(f"    [OK] Данные подрайона перехвачены: {len(subarea_captured_requests)} запросов", area)
+
+        if dates_to_process and (get_date_key(dates_to_process[0]), subarea_key) not in complete_pairs:
+            store_base_requests(all_dates_result, dates_to_process, subarea_key, subarea_captured_requests)
+        await process_dates(waiter, subarea_key, dates_to_process, all_dates_result, journal_file, complete_pairs)
+    return True
+
+class DashboardPage:
+    """Страница дашборда 754 одного воркера. Пересоздаётся, когда JS-куча превышает лимит
+    или подряд идёт несколько ошибок (настройки recycle в конфиге)"""
+
+    def __init__(self, context: Any, label: str, page: Any = None, waiter: Optional[QueryWaiter] = None, expectations: Optional[QueryExpectations] = None) -> None:
+        recycle_config = get_recycle_config()
+        self.context = context
+        self.label = label
+        self.page = page
+        self.waiter = waiter
+        # Выученные сигнатуры /query общие для всех страниц и переживают пересоздание страницы
+        self.expectations = expectations or (waiter.expectations if waiter is not None else QueryExpectations())
+        self.errors = 0
+        self.max_errors = int(recycle_config.get("max_errors", 3))
+        self.max_heap_mb = int(recycle_config.get("max_heap_mb", 1024))
+
+    async def open(self) -> None:
+        self.page, self.waiter = await open_dashboard_page(self.context, self.expectations)
+        self.errors = 0
+        print(f"[OK] [{self.label}] Dashboard загружен")
+        await set_date_to_today(self.waiter)
+
+    def get_waiter(self) -> QueryWaiter:
+        """Waiter открытой страницы"""
+        if self.waiter is None:
+            raise RuntimeError(f"[{self.label}] Страница дашборда не открыта")
+        return self.waiter
+
+    async def heap_mb(self) -> float:
+        """Наибольший размер JS-кучи среди фреймов страницы (Power BI живёт во фрейме)"""
+        sizes = await asyncio.gather(
+            *(frame.evaluate("() => performance.memory ? performance.memory.usedJSHeapSize : 0") for frame in self.page.frames),
+            return_exceptions=True,
+        )
+        return max([size for size in sizes if isinstance(size, (int, float))] or [0]) / (1024 * 1024)
+
+    async def recycle_if_needed(self) -> None:
+        reason = None
+        if self.max_errors and self.errors >= self.max_errors:
+            reason = f"ошибок подряд: {self.errors}"
+        elif self.max_heap_mb:
+            heap = await self.heap_mb()
+            if heap > self.max_heap_mb:
+                reason = f"JS heap {heap:.0f} МБ"
+        if reason is None:
+            return
+        print(f"[RECYCLE] [{self.label}] Пересоздаю страницу дашборда ({reason})")
+        await self.reopen()
+
+    async def reopen(self) -> None:
+        if self.page is not None:
             try:
-                date_start_input = page.locator('input[aria-label^="Дата начала"]')
-                if date_start_input.count() == 0:
-                    for frame in page.frames:
-                        date_start_input = frame.locator('input[aria-label^="Дата начала"]')
-                        if date_start_input.count() > 0:
-                            break
-                date_end_input = page.locator('input[aria-label^="Дата окончания"]')
-                if date_end_input.count() == 0:
-                    for frame in page.frames:
-                        date_end_input = frame.locator('input[aria-label^="Дата окончания"]')
-                        if date_end_input.count() > 0:
-                            break
+                await self.page.close()
+            except Exception:
+                pass
+        await self.open()
 
-                if date_start_input.count() > 0:
-                    date_start_input.first.clear()
-                    date_start_input.first.fill(year_ago)
-                    page.wait_for_timeout(300)
-
-                if date_end_input.count() > 0:
-                    date_end_input.first.clear()
-                    date_end_input.first.fill(today_str)
-                    page.wait_for_timeout(300)
-                try:
-                    page.wait_for_load_state("networkidle", timeout=2000)
-                except:
-                    pass
+async def process_area_queue(dashboard: DashboardPage, area_queue: "asyncio.Queue[str]", areas_structure: Dict[str, List[str]], dates_to_process: List[Any], all_dates_result: Dict[str, Dict[str, Any]], journal_file: str, complete_pairs: Set[Tuple[str, str]]) -> int:
+    """Забирает районы из общей очереди, пока она не опустеет. Возвращает число обработанных районов"""
+    processed = 0
+    while True:
+        try:
+            area = area_queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return processed
+        log_debug(f"\n[{dashboard.label}] Беру район: {area} (осталось в очереди: {area_queue.qsize()})", area)
+        try:
+            started = time.monotonic()
+            if await process_area(dashboard.get_waiter(), area, areas_structure, dates_to_process, all_dates_result, journal_file, complete_pairs):
+                elapsed = time.monotonic() - started
+                record_area_timing(area, elapsed, len(dates_to_process))
+                log_area(f"[AREA] [{dashboard.label}] {area}: {1 + len(areas_structure.get(area, []))} районов/подрайонов x {len(dates_to_process)} дат, {elapsed:.1f} с", area)
+            processed += 1
+            dashboard.errors = 0
+        except Exception as e:
+            dashboard.errors += 1
+            log_line(f"[ERROR] [{dashboard.label}] Ошибка при обработке района {area}: {e}")
+        await dashboard.recycle_if_needed()
+
+async def run_worker(dashboard: DashboardPage, area_queue: "asyncio.Queue[str]", areas_structure: Dict[str, List[str]], dates_to_process: List[Any], all_dates_result: Dict[str, Dict[str, Any]], journal_file: str, complete_pairs: Set[Tuple[str, str]]) -> None:
+    """Воркер-задача: своя страница дашборда в общем авторизованном контексте, открывается один раз за сессию"""
+    try:
+        if dashboard.page is None:
+            await dashboard.open()
+        processed = await process_area_queue(dashboard, area_queue, areas_structure, dates_to_process, all_dates_result, journal_file, complete_pairs)
+        print(f"[OK] [{dashboard.label}] Батч завершен, обработано районов: {processed}")
+    except Exception as e:
+        print(f"[ERROR] [{dashboard.label}] Воркер остановлен: {e}")
+
+async def retry_failed_units(dashboard: DashboardPage, failed_units: List[Tuple[str, str]], default_area: str, areas_structure: Dict[str, List[str]], dates_to_process: List[Any], all_dates_result: Dict[str, Dict[str, Any]], journal_file: str) -> List[Tuple[str, str]]:
+    """Повторяет несобранные пары на заново открытой странице дашборда, с растущей паузой.
+    Уже собранные пары пропускаются. Возвращает пары, которые так и не удалось собрать"""
+    for attempt, delay in enumerate(get_retry_delays(), 1):
+        if not failed_units:
+            break
+        failed_keys = list(dict.fromkeys(area_key for _, area_key in failed_units))
+        print(f"\n[RETRY] Попытка {attempt}: {len(failed_units)} пар (дата, район) в {len(failed_keys)} районах, пауза {delay:.0f} с")
+        await asyncio.sleep(delay)
+        try:
+            await dashboard.reopen()
+        except Exception as e:
+            print(f"[ERROR] [RETRY] Не удалось открыть дашборд: {e}")
+            continue
+        complete_pairs = get_complete_pairs(all_dates_result, dates_to_process, dashboard.expectations)
+        if default_area in failed_keys:
+            # На свежей странице дефолтный район уже выбран, клик по нему ответы не вызовет
+            try:
+                await process_dates(dashboard.get_waiter(), default_area, dates_to_process, all_dates_result, journal_file, complete_pairs)
+            except Exception as e:
+                print(f"[ERROR] [RETRY] Ошибка при обработке района {default_area}: {e}")
+        retry_areas = dict.fromkeys(area_key.split(" - ", 1)[0] for area_key in failed_keys if area_key != default_area)
+        for area in retry_areas:
+            try:
+                await process_area(dashboard.get_waiter(), area, areas_structure, dates_to_process, all_dates_result, journal_file, complete_pairs)
             except Exception as e:
-                print(f"  [ERROR] Ошибка при установке диапазона дат: {e}")
-        
-        if dates_to_process:
-            first_date = dates_to_process[0]
-            if isinstance(first_date, tuple):
-                date_key = f"{first_date[0]}-{first_date[1]}"
-            else:
-                date_key = first_date
-            
-            if date_key not in all_dates_result:
-                all_dates_result[date_key] = {}
-            all_dates_result[date_key][default_area] = default_base_requests.copy()
-            print(f"[OK] Данные дефолтного района {default_area} сохранены")
-        
-        print(f"\n[INFO] Обработка различных дат для {default_area}...")
-        for day_index, date_str in enumerate(dates_to_process):
-            is_first_day = (day_index == 0)
-            process_area_day(default_area, date_str, is_first_day, default_base_requests)
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump(all_dates_result, f, ensure_ascii=False, indent=2)
-        
-        set_date_to_today()
-        
-        print(f"\n[INFO] Начинаю обработку остальных районов...")
-        areas_to_process = [a for a in areas if a != default_area]
-        
-        if not areas_to_process:
-            print(f"[INFO] Все районы обработаны (только дефолтный район в списке)")
-        
-        for area in areas_to_process:
-            print(f"\n{'='*60}")
-            print(f"[PROCESSING] {area}")
-            print(f"{'='*60}")
-            dropdown_menu = page.locator('div.slicer-dropdown-menu[aria-label*="Area, Community"]')
-            if dropdown_menu.count() == 0:
-                for frame in page.frames:
-                    dropdown_menu = frame.locator('div.slicer-dropdown-menu[aria-label*="Area, Community"]')
-                    if dropdown_menu.count() > 0:
-                        break
-            if dropdown_menu.count() == 0:
-                print(f"[ERROR] Не найден dropdown для района: {area}")
+                print(f"[ERROR] [RETRY] Ошибка при обработке района {area}: {e}")
+        failed_units = get_failed_units(all_dates_result, dates_to_process, failed_keys, dashboard.expectations)
+    return failed_units
+
+async def retry_replay_units(request_api: Any, templates: List[Dict[str, Any]], failed_units: List[Tuple[str, str]], dates_to_process: List[Any], all_dates_result: Dict[str, Dict[str, Any]], journal_file: str, replay_config: Dict[str, Any], semaphore: asyncio.Semaphore) -> List[Tuple[str, str]]:
+    """Повторяет replay несобранных пар с растущей паузой. Возвращает пары, которые так и не удалось собрать"""
+    date_items = {get_date_key(date_item): date_item for date_item in dates_to_process}
+    for attempt, delay in enumerate(get_retry_delays(), 1):
+        if not failed_units:
+            break
+        print(f"\n[RETRY] Попытка {attempt}: {len(failed_units)} пар (дата, район), пауза {delay:.0f} с")
+        await asyncio.sleep(delay)
+        day_results = await asyncio.gather(*(
+            replay_area_day(request_api, templates, area_key, *split_date_pair(date_items[date_key]), replay_config, semaphore)
+            for date_key, area_key in failed_units
+        ))
+        still_failed = []
+        for (date_key, area_key), (replayed, failed) in zip(failed_units, day_results):
+            if failed or not replayed:
+                still_failed.append((date_key, area_key))
                 continue
-            dropdown_menu.first.click()
-            page.wait_for_timeout(2000)
-            search_header = page.locator('div.searchHeader.show')
-            if search_header.count() == 0:
-                for frame in page.frames:
-                    search_header = frame.locator('div.searchHeader.show')
-                    if search_header.count() > 0:
-                        break
-            search_input = search_header.locator('input.searchInput')
-            if search_input.count() > 0:
-                search_input.first.clear()
-                page.wait_for_timeout(300)
-                for char in area:
-                    search_input.first.type(char)
-                    page.wait_for_timeout(80)
-                page.wait_for_timeout(2000)
-                scroll_region = page.locator('div.scrollRegion')
-                if scroll_region.count() == 0:
-                    for frame in page.frames:
-                        scroll_region = frame.locator('div.scrollRegion')
-                        if scroll_region.count() > 0:
-                            break
-                all_rows = scroll_region.locator('div.row')
-                target_element = None
-                for i in range(all_rows.count()):
-                    row = all_rows.nth(i)
-                    element_with_title = row.locator(f'[title="{area}"]')
-                    if element_with_title.count() > 0:
-                        target_element = element_with_title.first
-                        break
-                    all_elements = row.locator('*')
-                    for j in range(all_elements.count()):
-                        elem = all_elements.nth(j)
-                        try:
-                            if area in elem.text_content():
-                                target_element = elem
-                                break
-                        except:
-                            pass
-                    if target_element:
-                        break
-                if not target_element and all_rows.count() > 0:
-                    first_row = all_rows.first
-                    first_elem = first_row.locator('*').first
-                    if first_elem.count() > 0:
-                        target_element = first_elem
-                if target_element:
-                    expand_button = target_element.locator('div.expandButton')
-                    if expand_button.count() > 0:
-                        print(f"  [INFO] Раскрываю подрайоны...")
-                        expand_button.first.click()
-                        page.wait_for_timeout(3000)
-                    
-                    subareas = areas_structure.get(area, [])
-                    print(f"  [INFO] Подрайонов для обработки: {len(subareas)} ({', '.join(subareas[:5])}{'...' if len(subareas) > 5 else ''})")
-                    
-                    base_captured_requests = []
-                    base_handler = create_handle_response(area, base_captured_requests, page)
-                    page.on("response", base_handler)
-                    
-                    print(f"  [INFO] Подключен обработчик для перехвата базовых метрик главного района...")
-                    target_element.click()
-                    page.wait_for_timeout(3000)
-                    
-                    try:
-                        page.wait_for_load_state("networkidle", timeout=5000)
-                    except:
-                        pass
-                    
-                    page.remove_listener("response", base_handler)
-                    print(f"  [OK] Базовые метрики главного района перехвачены: {len(base_captured_requests)} запросов")
-                    
-                    if dates_to_process:
-                        first_date = dates_to_process[0]
-                        if isinstance(first_date, tuple):
-                            date_key = f"{first_date[0]}-{first_date[1]}"
-                        else:
-                            date_key = first_date
-                        
-                        if date_key not in all_dates_result:
-                            all_dates_result[date_key] = {}
-                        all_dates_result[date_key][area] = base_captured_requests.copy()
-                    
-                    for day_index, date_str in enumerate(dates_to_process):
-                        is_first_day = (day_index == 0)
-                        process_area_day(area, date_str, is_first_day, base_captured_requests)
-                        with open(output_file, "w", encoding="utf-8") as f:
-                            json.dump(all_dates_result, f, ensure_ascii=False, indent=2)
-
-                    set_date_to_today()
-                    
-                    for subarea in subareas:
-                        print(f"\n  {'='*50}")
-                        print(f"  [SUBAREA] {area} -> {subarea}")
-                        print(f"  {'='*50}")
-                        
-                        dropdown_menu.first.click()
-                        page.wait_for_timeout(2000)
-                        
-                        search_header = page.locator('div.searchHeader.show')
-                        if search_header.count() == 0:
-                            for frame in page.frames:
-                                search_header = frame.locator('div.searchHeader.show')
-                                if search_header.count() > 0:
-                                    break
-                        
-                        search_input = search_header.locator('input.searchInput')
-                        if search_input.count() > 0:
-                            search_input.first.clear()
-                            page.wait_for_timeout(300)
-                            print(f"    [INFO] Поиск подрайона: {subarea}")
-                            for char in subarea:
-                                search_input.first.type(char)
-                                page.wait_for_timeout(80)
-                            page.wait_for_timeout(2000)
-                        
-                        scroll_region_sub = page.locator('div.scrollRegion')
-                        if scroll_region_sub.count() == 0:
-                            for frame in page.frames:
-                                scroll_region_sub = frame.locator('div.scrollRegion')
-                                if scroll_region_sub.count() > 0:
-                                    break
-                        
-                        all_rows_sub = scroll_region_sub.locator('div.row')
-                        subarea_element = None
-                        
-                        for i in range(all_rows_sub.count()):
-                            row = all_rows_sub.nth(i)
-                            slicer_items = row.locator('div.slicerItemContainer')
-                            for j in range(slicer_items.count()):
-                                slicer_item = slicer_items.nth(j)
-                                try:
-                                    aria_level = slicer_item.get_attribute('aria-level')
-                                    item_title = slicer_item.get_attribute('title')
-                                    if aria_level == '2' and item_title and subarea in item_title:
-                                        subarea_element = slicer_item
-                                        print(f"    [OK] Найден подрайон: {item_title}")
-                                        break
-                                except:
-                                    pass
-                            if subarea_element:
-                                break
-                        
-                        if subarea_element:
-                            subarea_captured_requests = []
-                            subarea_handler = create_handle_response(f"{area} - {subarea}", subarea_captured_requests, page)
-                            page.on("response", subarea_handler)
-                            
-                            print(f"    [INFO] Подключен обработчик для подрайона...")
-                            subarea_element.click()
-                            page.wait_for_timeout(3000)
-                            
-                            try:
-                                page.wait_for_load_state("networkidle", timeout=5000)
-                            except:
-                                pass
-                            
-                            page.remove_listener("response", subarea_handler)
-                            print(f"    [OK] Данные подрайона перехвачены: {len(subarea_captured_requests)} запросов")
-                            
-                            subarea_key = f"{area} - {subarea}"
-                            if dates_to_process:
-                                first_date = dates_to_process[0]
-                                if isinstance(first_date, tuple):
-                                    date_key = f"{first_date[0]}-{first_date[1]}"
-                                else:
-                                    date_key = first_date
-                                
-                                if date_key not in all_dates_result:
-                                    all_dates_result[date_key] = {}
-                                all_dates_result[date_key][subarea_key] = subarea_captured_requests.copy()
-                            
-                            for day_index, date_str in enumerate(dates_to_process):
-                                is_first_day = (day_index == 0)
-                                process_area_day(subarea_key, date_str, is_first_day, subarea_captured_requests)
-                                with open(output_file, "w", encoding="utf-8") as f:
-                                    json.dump(all_dates_result, f, ensure_ascii=False, indent=2)
-                            
-                            set_date_to_today()
-                        else:
-                            print(f"    [WARNING] Не найден элемент для подрайона: {subarea}")
-                else:
-                    print(f"[WARNING] Не найден элемент для района: {area}")
-            else:
-                print(f"[WARNING] Не найден инпут поиска для района: {area}")
-        browser.close()
-        print(f"\n[INFO] Финальное сохранение данных батча...")
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(all_dates_result, f, ensure_ascii=False, indent=2)
-        total_queries = sum(sum(len(metrics) for metrics in areas_data.values())
-                           for areas_data in all_dates_result.values())
-        print(f"[OK] {output_raw_file} обновлен ({total_queries} всего запросов)")
-        print(f"[OK] Батч завершен. Трансформация будет выполнена после всех батчей.")
+            all_dates_result[date_key][area_key] = replayed
+            append_entry(journal_file, date_key, area_key, replayed)
+            log_debug(f"    [OK] {area_key} {date_key}: {len(replayed)} запросов", area_key)
+        failed_units = still_failed
+    return failed_units
+
+def report_failed_units(output_file: str, area_keys: List[str], failed_units: List[Tuple[str, str]]) -> None:
+    """Печатает итог повторов и сохраняет несобранные пары в <raw>.failed.json"""
+    save_failed_units(output_file, area_keys, failed_units)
+    if not failed_units:
+        print(f"[OK] Все пары (дата, район) собраны")
+        return
+    print(f"[ERROR] Не удалось собрать {len(failed_units)} пар (дата, район):")
+    for date_key, area_key in failed_units:
+        print(f"  - {date_key}: {area_key}")
+
+def get_dates_to_process(date_settings: Dict[str, Any]) -> List[Any]:
+    """Список дат ('DD.MM.YYYY') для everyday или один диапазон (начало, конец)"""
+    start_date_str = date_settings.get("start_date")
+    end_date_str = date_settings.get("end_date")
+    everyday = bool(date_settings.get("everyday", True))
+    if start_date_str and end_date_str:
+        print(f"[INFO] Даты из конфига: {start_date_str} - {end_date_str} (everyday: {everyday})")
+        start_date = datetime.strptime(start_date_str, "%d.%m.%Y")
+        end_date = datetime.strptime(end_date_str, "%d.%m.%Y")
+    else:
+        print(f"[INFO] Даты из окружения не найдены, использую default: -10 до -4 дней")
+        start_date = datetime.now() - timedelta(days=10)
+        end_date = datetime.now() - timedelta(days=4)
+        everyday = True
+    dates_to_process: List[Any] = []
+    if everyday:
+        current_date = start_date
+        while current_date <= end_date:
+            dates_to_process.append(current_date.strftime("%d.%m.%Y"))
+            current_date += timedelta(days=1)
+        print(f"[INFO] Режим EVERYDAY: буду обрабатывать {len(dates_to_process)} дат")
+    else:
+        dates_to_process = [
+            (start_date.strftime("%d.%m.%Y"), end_date.strftime("%d.%m.%Y"))
+        ]
+        print(f"[INFO] Режим RANGE: один снимок от {start_date_str} до {end_date_str}")
+    print(f"[INFO] Даты обработки: {dates_to_process}")
+    return dates_to_process
+
+def load_existing_result(output_file: str, dates_to_process: List[Any]) -> Dict[str, Dict[str, Any]]:
+    """Загружает raw прошлых батчей (снимок + журнал) и добавляет пустые ключи дат"""
+    journal_file = get_journal_path(output_file)
+    if os.path.exists(output_file) or os.path.exists(journal_file):
+        print(f"[INFO] Загружаю существующие данные из {output_file}...")
+        all_dates_result = load_raw_result(output_file)
+        print(f"[OK] Загружено {sum(len(areas) for areas in all_dates_result.values())} районов")
+    else:
+        print(f"[INFO] Создаю новый файл {output_file}...")
+        all_dates_result = {}
+    print(f"[INFO] Снимки пишутся в журнал {journal_file}")
+    for date_item in dates_to_process:
+        date_key = get_date_key(date_item)
+        if date_key not in all_dates_result:
+            all_dates_result[date_key] = {}
+    return all_dates_result
+
+def checkpoint(output_file: str, all_dates_result: Dict[str, Dict[str, Any]], output_raw_file: str, expectations: QueryExpectations) -> None:
+    """Граница батча: журнал сжимается в raw файл, выученные сигнатуры /query сохраняются рядом"""
+    if not compact_journal(output_file):
+        write_raw_result(all_dates_result, output_file)
+    expectations.save(get_queries_path(output_file))
+    total_queries = sum(sum(len(metrics) for metrics in areas_data.values())
+                       for areas_data in all_dates_result.values())
+    print(f"[OK] {output_raw_file} обновлен ({total_queries} всего запросов)")
+
+async def prepare_session() -> None:
+    """Проверяет сессию и при необходимости логинится, обновляя state.json (перед запуском параллельных процессов)"""
+    async with async_playwright() as pw:
+        browser = await pw.chromium.launch(headless=True)
+        await open_session(browser, DEVICE_ID, USERNAME, PASSWORD)
+        await browser.close()
+
+async def run_session(batches: Iterable[List[str]], date_settings: Dict[str, Any], output_raw_file: str, process_default_area: bool = True, resume: Optional[bool] = None) -> bool:
+    """Обрабатывает батчи районов в одной сессии браузера. Логин, загрузка дашборда и страницы
+    воркеров переиспользуются между батчами, граница батча — точка сохранения (компакция журнала).
+    В конце несобранные пары (дата, район) повторяются (настройки retry).
+    process_default_area=False: дефолтный район собирает другой процесс; resume=None — из конфига"""
+    areas_structure = parse_areas_with_subareas()
+    area_timings = load_area_timings()
+    dates_to_process = get_dates_to_process(date_settings)
+    output_file = os.path.join(os.getcwd(), output_raw_file)
+    journal_file = get_journal_path(output_file)
+    all_dates_result = load_existing_result(output_file, dates_to_process)
+    # Сигнатуры, выученные прошлыми запусками в этот raw: проверка полноты и ожидание шагов с первого шага
+    expectations = QueryExpectations.load(get_queries_path(output_file))
+    complete_pairs: Set[Tuple[str, str]] = set()
+    session_keys: List[str] = []
+    if resume is None:
+        resume = is_resume_enabled()
+    if resume:
+        complete_pairs = get_complete_pairs(all_dates_result, dates_to_process, expectations)
+        print(f"[RESUME] Уже собрано пар (дата, район): {len(complete_pairs)}")
+
+    async with async_playwright() as pw:
+        browser = await pw.chromium.launch(headless=True)
+        context, page = await open_session(browser, DEVICE_ID, USERNAME, PASSWORD)
+
+        default_area = get_default_area()
+        print(f"[INFO] Перехватываю данные дефолтного района: {default_area}")
+
+        replay_config = get_replay_config()
+        replay_enabled = replay_config.get("enabled", False)
+        replay_templates: List[Dict[str, Any]] = []
+        template_handler = create_template_handler(replay_templates)
+        if replay_enabled:
+            page.on("response", template_handler)
+
+        waiter = QueryWaiter(page, get_query_wait_config(), expectations)
+        default_base_requests = await waiter.perform(
+            "dashboard",
+            lambda: page.goto(DASHBOARD_URL, wait_until="load", timeout=60000),
+            default_area,
+            timeout_ms=60000,
+            start_ms=20000,
+        )
+        print("[OK] Dashboard открыт")
+        print(f"[OK] Dashboard загружен. Перехвачено {len(default_base_requests)} запросов для {default_area}")
+
+        if replay_enabled:
+            page.remove_listener("response", template_handler)
+
+        if replay_enabled and not replay_templates:
+            print("[WARNING] Replay: шаблоны /query не перехвачены, переключаюсь на режим кликов")
+        elif replay_enabled:
+            print(f"\n[REPLAY] Режим replay: {len(replay_templates)} шаблонов запросов")
+            # Общий лимит одновременных POST /query для всех районов и дат
+            semaphore = asyncio.Semaphore(max(1, int(replay_config.get("concurrency", 4))))
+            replay_failed = 0
+            for batch_num, batch in enumerate(batches, 1):
+                areas = select_main_areas(batch)
+                print(f"\n[BATCH {batch_num}] Replay {len(areas)} районов")
+                replay_keys = get_area_keys(areas, areas_structure)
+                if process_default_area and batch_num == 1 and default_area not in replay_keys:
+                    replay_keys.insert(0, default_area)
+                session_keys.extend(replay_keys)
+
+                for area_key in replay_keys:
+                    log_debug(f"\n[REPLAY] {area_key}", area_key)
+                    started = time.monotonic()
+                    pending_dates = [
+                        date_item for date_item in dates_to_process
+                        if (get_date_key(date_item), area_key) not in complete_pairs
+                    ]
+                    day_results = await asyncio.gather(*(
+                        replay_area_day(context.request, replay_templates, area_key, *split_date_pair(date_item), replay_config, semaphore)
+                        for date_item in pending_dates
+                    ))
+                    for date_item, (replayed, failed) in zip(pending_dates, day_results):
+                        date_key = get_date_key(date_item)
+                        replay_failed += failed
+                        all_dates_result[date_key][area_key] = replayed
+                        append_entry(journal_file, date_key, area_key, replayed)
+                        log_debug(f"    [OK] {date_key}: {len(replayed)} запросов (ошибок: {failed})", area_key)
+                    log_area(f"[AREA] {area_key}: {len(pending_dates)} дат, {time.monotonic() - started:.1f} с", area_key)
+                checkpoint(output_file, all_dates_result, output_raw_file, expectations)
+
+            flush_log()
+            print(f"[OK] Ошибок replay: {replay_failed}")
+            failed_units = get_failed_units(all_dates_result, dates_to_process, session_keys, expectations)
+            failed_units = await retry_replay_units(context.request, replay_templates, failed_units, dates_to_process, all_dates_result, journal_file, replay_config, semaphore)
+            checkpoint(output_file, all_dates_result, output_raw_file, expectations)
+            report_failed_units(output_file, session_keys, failed_units)
+            await browser.close()
+            print(f"[OK] Сессия завершена. Трансформация будет выполнена после всех батчей.")
+            return True
+
+        if process_default_area:
+            session_keys.append(default_area)
+            if dates_to_process and (get_date_key(dates_to_process[0]), default_area) not in complete_pairs:
+                store_base_requests(all_dates_result, dates_to_process, default_area, default_base_requests)
+                print(f"[OK] Данные дефолтного района {default_area} сохранены")
+
+            print(f"\n[INFO] Обработка различных дат для {default_area}...")
+            await process_dates(waiter, default_area, dates_to_process, all_dates_result, journal_file, complete_pairs)
+        else:
+            await set_date_to_today(waiter)
+
+        workers = get_workers_count()
+        dashboards = [DashboardPage(context, "WORKER 1", page, waiter)]
+        dashboards.extend(DashboardPage(context, f"WORKER {worker_id}", expectations=expectations) for worker_id in range(2, workers + 1))
+
+        for batch_num, batch in enumerate(batches, 1):
+            areas_to_process = [a for a in select_main_areas(batch) if a != default_area]
+            print(f"\n{'='*70}")
+            print(f"[BATCH {batch_num}] Обработка {len(areas_to_process)} районов")
+            print(f"{'='*70}")
+            session_keys.extend(get_area_keys(areas_to_process, areas_structure))
+
+            batch_workers = min(workers, max(1, len(areas_to_process)))
+            if batch_workers > 1:
+                # Сначала дорогие районы (подрайоны и история времени), чтобы воркеры финишировали примерно одновременно
+                costs = estimate_costs(areas_to_process, areas_structure, area_timings)
+                areas_to_process.sort(key=lambda a: costs[a], reverse=True)
+                print(f"[INFO] Параллельный режим: {batch_workers} воркеров")
+            area_queue: "asyncio.Queue[str]" = asyncio.Queue()
+            for area in areas_to_process:
+                area_queue.put_nowait(area)
+
+            await asyncio.gather(*(
+                run_worker(dashboard, area_queue, areas_structure, dates_to_process, all_dates_result, journal_file, complete_pairs)
+                for dashboard in dashboards[:batch_workers]
+            ))
+
+            print(f"\n[INFO] Сохранение данных батча {batch_num}...")
+            checkpoint(output_file, all_dates_result, output_raw_file, expectations)
+
+        failed_units = get_failed_units(all_dates_result, dates_to_process, session_keys, expectations)
+        failed_units = await retry_failed_units(dashboards[0], failed_units, default_area, areas_structure, dates_to_process, all_dates_result, journal_file)
+        checkpoint(output_file, all_dates_result, output_raw_file, expectations)
+        report_failed_units(output_file, session_keys, failed_units)
+        await browser.close()
+        print(f"[OK] Сессия завершена. Трансформация будет выполнена после всех батчей.")
+    return True
+
+async def main() -> None:
+    configure_logging(config.get("log"))
+    batch_queue = os.environ.get("PARSER_BATCH_QUEUE")
+    batches: Iterable[List[str]]
+    if batch_queue:
+        batches = claim_batches(batch_queue, os.environ.get("PARSER_WORKER_LABEL", f"pid{os.getpid()}"))
+    else:
+        areas = load_areas()
+        if not areas:
+            return
+        batches = [areas]
+
+    date_settings = {
+        "start_date": os.environ.get("PARSER_START_DATE"),
+        "end_date": os.environ.get("PARSER_END_DATE"),
+        "everyday": (os.environ.get("PARSER_EVERYDAY") or "true").lower() == "true",
+    }
+    process_default_area = (os.environ.get("PARSER_PROCESS_DEFAULT_AREA") or "true").lower() == "true"
+    resume_env = os.environ.get("PARSER_RESUME")
+    resume = resume_env.lower() == "true" if resume_env else None
+    await run_session(batches, date_settings, os.environ.get("PARSER_OUTPUT_RAW_FILE", "metrics_raw.json"), process_default_area, resume)
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
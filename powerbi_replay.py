@@ -0,0 +1,357 @@
+"""
+Прямой replay запросов Power BI /query без кликов по слайсерам.
+Перехваченные SemanticQueryDataShapeCommand запросы используются как шаблоны:
+в их Where подставляются район/подрайон и даты, после чего запрос отправляется
+напрямую через request API авторизованного контекста браузера.
+Фильтр района приводится к ключу: для подрайона — район и подрайон (Community добавляется,
+даже если в шаблоне его не было), для главного района — только район. Шаблон, в котором
+фильтр района подставить не удалось, не отправляется: иначе под новым ключом сохранились бы
+данные дефолтного района.
+Шаблоны отправляются параллельно, лимит задаётся общим семафором.
+Проверка на локальном stub /query: python replay_stub.py
+"""
+
+import asyncio
+import copy
+import json
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from log_levels import log_line
+
+DEFAULT_AREA_PROPERTY = "Area"
+DEFAULT_SUBAREA_PROPERTY = "Community"
+
+# ComparisonKind в SemanticQuery
+COMPARISON_EQUAL = 0
+COMPARISON_GREATER_THAN = 1
+COMPARISON_GREATER_THAN_OR_EQUAL = 2
+COMPARISON_LESS_THAN = 3
+COMPARISON_LESS_THAN_OR_EQUAL = 4
+
+# Заголовки, которые браузер/контекст выставляет сам
+SKIP_HEADERS = {"content-length", "host", "cookie", "connection", "accept-encoding"}
+
+
+def split_area_key(area_key: str) -> Tuple[str, Optional[str]]:
+    """Разбивает ключ 'Район - Подрайон' на (район, подрайон)"""
+    if " - " in area_key:
+        area, subarea = area_key.split(" - ", 1)
+        return area, subarea
+    return area_key, None
+
+
+def string_literal(value: str) -> Dict[str, Any]:
+    """Строковый литерал SemanticQuery: 'value' с экранированием кавычек"""
+    escaped = value.replace("'", "''")
+    return {"Literal": {"Value": f"'{escaped}'"}}
+
+
+def datetime_literal(date_obj: datetime) -> Dict[str, Any]:
+    """Литерал даты SemanticQuery: datetime'YYYY-MM-DDT00:00:00'"""
+    return {"Literal": {"Value": f"datetime'{date_obj.strftime('%Y-%m-%dT00:00:00')}'"}}
+
+
+def expression_property(expr: Dict[str, Any]) -> str:
+    """Имя колонки/уровня иерархии из выражения Where"""
+    if "Column" in expr:
+        return str(expr["Column"].get("Property", ""))
+    if "HierarchyLevel" in expr:
+        return str(expr["HierarchyLevel"].get("Level", ""))
+    return ""
+
+
+def with_property(expr: Dict[str, Any], prop: str) -> Dict[str, Any]:
+    """Копия выражения колонки/уровня иерархии той же таблицы с другим именем"""
+    new_expr = copy.deepcopy(expr)
+    if "Column" in new_expr:
+        new_expr["Column"]["Property"] = prop
+    elif "HierarchyLevel" in new_expr:
+        new_expr["HierarchyLevel"]["Level"] = prop
+    return new_expr
+
+
+def is_datetime_literal(expr: Dict[str, Any]) -> bool:
+    value = expr.get("Literal", {}).get("Value", "")
+    return isinstance(value, str) and value.startswith("datetime'")
+
+
+def template_key(request_json: Dict[str, Any]) -> str:
+    """Ключ шаблона: структура запросов без значений литералов"""
+    def strip(node: Any) -> Any:
+        if isinstance(node, dict):
+            if "Literal" in node:
+                return {"Literal": None}
+            return {k: strip(v) for k, v in node.items()}
+        if isinstance(node, list):
+            return [strip(item) for item in node]
+        return node
+
+    queries = request_json.get("queries", [])
+    structure = []
+    for query in queries:
+        for cmd in query.get("Query", {}).get("Commands", []):
+            sq = cmd.get("SemanticQueryDataShapeCommand", {}).get("Query", {})
+            structure.append({"Select": strip(sq.get("Select", [])), "Where": strip(sq.get("Where", []))})
+    return json.dumps(structure, sort_keys=True, ensure_ascii=False)
+
+
+def create_template_handler(templates: List[Dict[str, Any]]) -> Callable[[Any], Awaitable[None]]:
+    """Фабрика обработчика, который собирает уникальные /query запросы как шаблоны для replay"""
+    seen_keys = {template_key(t["request"]) for t in templates}
+
+    async def handle_response(response: Any) -> None:
+        url = response.url
+        if "/query" not in url:
+            return
+        try:
+            request = response.request
+            request_data = request.post_data
+            if not request_data:
+                return
+            request_json = json.loads(request_data)
+            key = template_key(request_json)
+            if key in seen_keys:
+                return
+            seen_keys.add(key)
+            all_headers = await request.all_headers()
+            headers = {
+                name: value for name, value in all_headers.items()
+                if not name.startswith(":") and name.lower() not in SKIP_HEADERS
+            }
+            templates.append({"url": url, "headers": headers, "request": request_json})
+            print(f"[REPLAY] Шаблон запроса #{len(templates)} сохранён")
+        except Exception as e:
+            print(f"[ERROR] {url}: {e}")
+    return handle_response
+
+
+def rewrite_condition(
+    cond: Dict[str, Any],
+    area: str,
+    subarea: Optional[str],
+    date_start: datetime,
+    date_end: datetime,
+    replay_config: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Рекурсивно подменяет район/подрайон и даты в условии Where"""
+    area_property = replay_config.get("area_property", DEFAULT_AREA_PROPERTY)
+    subarea_property = replay_config.get("subarea_property", DEFAULT_SUBAREA_PROPERTY)
+    date_property = replay_config.get("date_property")
+
+    if "In" in cond:
+        in_cond = cond["In"]
+        expressions = in_cond.get("Expressions", [])
+        properties = [expression_property(expr) for expr in expressions]
+        if area_property not in properties and subarea_property not in properties:
+            return cond
+
+        values = in_cond.get("Values", [])
+        first_row = values[0] if values else []
+        new_expressions = []
+        row = []
+        for index, (expr, prop) in enumerate(zip(expressions, properties)):
+            if prop == area_property:
+                new_expressions.append(expr)
+                row.append(string_literal(area))
+            elif prop != subarea_property:
+                new_expressions.append(expr)
+                row.append(first_row[index] if index < len(first_row) else string_literal(""))
+
+        if area_property not in properties:
+            # Шаблон фильтрует только по подрайону: фильтр по району строится из его выражения
+            new_expressions.insert(0, with_property(expressions[properties.index(subarea_property)], area_property))
+            row.insert(0, string_literal(area))
+        # Для подрайона фильтр по нему добавляется или заменяется, для главного района — убирается
+        if subarea is not None:
+            if subarea_property in properties:
+                new_expressions.append(expressions[properties.index(subarea_property)])
+            else:
+                new_expressions.append(with_property(expressions[properties.index(area_property)], subarea_property))
+            row.append(string_literal(subarea))
+
+        new_in = dict(in_cond)
+        new_in["Expressions"] = new_expressions
+        new_in["Values"] = [row]
+        return {"In": new_in}
+
+    if "Comparison" in cond:
+        comp = cond["Comparison"]
+        right = comp.get("Right", {})
+        if not is_datetime_literal(right):
+            return cond
+        if date_property and expression_property(comp.get("Left", {})) != date_property:
+            return cond
+        kind = comp.get("ComparisonKind")
+        if kind == COMPARISON_GREATER_THAN_OR_EQUAL or kind == COMPARISON_EQUAL:
+            new_date = date_start
+        elif kind == COMPARISON_GREATER_THAN:
+            new_date = date_start - timedelta(days=1)
+        elif kind == COMPARISON_LESS_THAN:
+            new_date = date_end + timedelta(days=1)
+        elif kind == COMPARISON_LESS_THAN_OR_EQUAL:
+            new_date = date_end
+        else:
+            return cond
+        new_comp = dict(comp)
+        new_comp["Right"] = datetime_literal(new_date)
+        return {"Comparison": new_comp}
+
+    if "Between" in cond:
+        between = cond["Between"]
+        if not is_datetime_literal(between.get("LowerBound", {})):
+            return cond
+        if date_property and expression_property(between.get("Expression", {})) != date_property:
+            return cond
+        new_between = dict(between)
+        new_between["LowerBound"] = datetime_literal(date_start)
+        new_between["UpperBound"] = datetime_literal(date_end)
+        return {"Between": new_between}
+
+    for logical in ("And", "Or"):
+        if logical in cond:
+            node = cond[logical]
+            return {logical: {
+                "Left": rewrite_condition(node["Left"], area, subarea, date_start, date_end, replay_config),
+                "Right": rewrite_condition(node["Right"], area, subarea, date_start, date_end, replay_config),
+            }}
+
+    if "Not" in cond:
+        inner = cond["Not"].get("Expression", {})
+        return {"Not": {"Expression": rewrite_condition(inner, area, subarea, date_start, date_end, replay_config)}}
+
+    return cond
+
+
+def rewrite_request(
+    request_json: Dict[str, Any],
+    area_key: str,
+    date_start_str: str,
+    date_end_str: str,
+    replay_config: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Возвращает копию шаблона с подставленными районом и датами во всех Where"""
+    area, subarea = split_area_key(area_key)
+    date_start = datetime.strptime(date_start_str, "%d.%m.%Y")
+    date_end = datetime.strptime(date_end_str, "%d.%m.%Y")
+
+    new_request = copy.deepcopy(request_json)
+    for query in new_request.get("queries", []):
+        for cmd in query.get("Query", {}).get("Commands", []):
+            sq = cmd.get("SemanticQueryDataShapeCommand", {}).get("Query", {})
+            for where in sq.get("Where", []):
+                if "Condition" in where:
+                    where["Condition"] = rewrite_condition(
+                        where["Condition"], area, subarea, date_start, date_end, replay_config
+                    )
+    return new_request
+
+
+def iter_conditions(cond: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Условие и все вложенные в And/Or/Not"""
+    yield cond
+    for logical in ("And", "Or"):
+        if logical in cond:
+            yield from iter_conditions(cond[logical]["Left"])
+            yield from iter_conditions(cond[logical]["Right"])
+    if "Not" in cond:
+        yield from iter_conditions(cond["Not"].get("Expression", {}))
+
+
+def has_area_filter(request_json: Dict[str, Any], area_key: str, replay_config: Dict[str, Any]) -> bool:
+    """Есть ли в запросе фильтр In ровно на район и подрайон ключа (для главного района — без подрайона)"""
+    area, subarea = split_area_key(area_key)
+    area_property = replay_config.get("area_property", DEFAULT_AREA_PROPERTY)
+    subarea_property = replay_config.get("subarea_property", DEFAULT_SUBAREA_PROPERTY)
+    expected = {area_property: string_literal(area)}
+    if subarea is not None:
+        expected[subarea_property] = string_literal(subarea)
+
+    for query in request_json.get("queries", []):
+        for cmd in query.get("Query", {}).get("Commands", []):
+            sq = cmd.get("SemanticQueryDataShapeCommand", {}).get("Query", {})
+            for where in sq.get("Where", []):
+                for cond in iter_conditions(where.get("Condition", {})):
+                    if "In" not in cond:
+                        continue
+                    properties = [expression_property(expr) for expr in cond["In"].get("Expressions", [])]
+                    if area_property not in properties:
+                        continue
+                    if subarea is None and subarea_property in properties:
+                        continue
+                    if all(
+                        prop in properties and all(row[properties.index(prop)] == literal for row in cond["In"].get("Values", []))
+                        for prop, literal in expected.items()
+                    ):
+                        return True
+    return False
+
+
+def prepare_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    """Копия заголовков шаблона с новым RequestId"""
+    new_headers = dict(headers)
+    for name in list(new_headers):
+        if name.lower() == "requestid":
+            new_headers[name] = str(uuid.uuid4())
+    return new_headers
+
+
+async def replay_template(
+    request_api: Any,
+    template: Dict[str, Any],
+    request_json: Dict[str, Any],
+    area_key: str,
+    replay_config: Dict[str, Any],
+    semaphore: asyncio.Semaphore,
+) -> Optional[Dict[str, Any]]:
+    """Отправляет один подготовленный запрос шаблона, возвращает его в raw формате или None при ошибке"""
+    url = replay_config.get("query_url") or template["url"]
+    async with semaphore:
+        try:
+            response = await request_api.post(
+                url,
+                data=json.dumps(request_json, ensure_ascii=False),
+                headers=prepare_headers(template["headers"]),
+                timeout=replay_config.get("timeout_ms", 60000),
+            )
+            if not response.ok:
+                log_line(f"      [ERROR] Replay {area_key}: HTTP {response.status}")
+                return None
+            return {
+                "request": request_json,
+                "response": await response.json()
+            }
+        except Exception as e:
+            log_line(f"      [ERROR] Replay {area_key}: {e}")
+            return None
+
+
+async def replay_area_day(
+    request_api: Any,
+    templates: List[Dict[str, Any]],
+    area_key: str,
+    date_start_str: str,
+    date_end_str: str,
+    replay_config: Dict[str, Any],
+    semaphore: asyncio.Semaphore,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Отправляет все шаблоны для района и дат, возвращает (запросы в raw формате, число ошибок).
+    Шаблоны, в которых не удалось подставить фильтр района, пропускаются с предупреждением
+    (один раз на шаблон) и ошибками не считаются"""
+    prepared = []
+    for index, template in enumerate(templates, 1):
+        request_json = rewrite_request(template["request"], area_key, date_start_str, date_end_str, replay_config)
+        if not has_area_filter(request_json, area_key, replay_config):
+            if not template.get("no_area_filter"):
+                template["no_area_filter"] = True
+                log_line(f"      [WARNING] Replay: в шаблоне #{index} нет фильтра района, шаблон пропускается")
+            continue
+        prepared.append((template, request_json))
+
+    results = await asyncio.gather(*(
+        replay_template(request_api, template, request_json, area_key, replay_config, semaphore)
+        for template, request_json in prepared
+    ))
+    captured_requests = [result for result in results if result is not None]
+    return captured_requests, len(results) - len(captured_requests)
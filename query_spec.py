@@ -0,0 +1,120 @@
+"""
+Разобранное представление запроса Power BI /query.
+Select, фильтры Where и соответствие jobId результата запросу вычисляются один раз на
+запрос и используются и ключом дедупликации парсера, и трансформером. compile_request
+кеширует разбор по самому объекту запроса: парсер сравнивает одни и те же запросы при каждом
+повторном захвате района. Трансформер видит каждый запрос один раз и создаёт RequestSpec сам.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+CACHE_SIZE = 4096
+
+_compiled: "OrderedDict[int, Tuple[Dict[str, Any], RequestSpec]]" = OrderedDict()
+
+
+def get_semantic_query(query: Dict[str, Any]) -> Dict[str, Any]:
+    cmd = query.get('Query', {}).get('Commands', [{}])[0]
+    semantic_query: Dict[str, Any] = cmd.get('SemanticQueryDataShapeCommand', {}).get('Query', {})
+    return semantic_query
+
+
+def parse_in_condition(cond: Dict[str, Any]) -> Tuple[str, List[str]]:
+    """(свойство, значения) условия In без кавычек литералов"""
+    prop = cond['In']['Expressions'][0].get('Column', {}).get('Property', '')
+    clean_vals = []
+    for val_group in cond['In'].get('Values', []):
+        for val_item in val_group:
+            if 'Literal' in val_item:
+                clean_vals.append(val_item['Literal']['Value'].strip("'"))
+    return prop, clean_vals
+
+
+class QuerySpec:
+    """Один запрос из queries: имена Select и фильтры для его результатов"""
+
+    __slots__ = ("select_names", "in_conditions", "where")
+
+    def __init__(self, sq: Dict[str, Any]) -> None:
+        self.select_names: List[str] = [s.get('Name', '') for s in sq.get('Select', [])]
+        self.in_conditions: List[Tuple[str, List[str]]] = [
+            parse_in_condition(cond)
+            for cond in (where.get('Condition', {}) for where in sq.get('Where', []))
+            if 'In' in cond
+        ]
+        self.where: Dict[str, Any] = {}
+
+
+class RequestSpec:
+    """Разобранный запрос: ключ дедупликации, общие фильтры и запросы по индексу jobId"""
+
+    __slots__ = ("queries", "filters", "_key", "_signature")
+
+    def __init__(self, request: Dict[str, Any]) -> None:
+        self.queries = [QuerySpec(get_semantic_query(query)) for query in request.get('queries', [])]
+        self.filters: Dict[str, Any] = {}
+        self._key: Optional[str] = None
+        self._signature: Optional[str] = None
+        if not self.queries:
+            return
+
+        # Общие фильтры берутся из первого запроса: In — список значений (уже разобраны в его
+        # QuerySpec, в том же порядке), Comparison — значение
+        in_conditions = iter(self.queries[0].in_conditions)
+        for where in get_semantic_query(request['queries'][0]).get('Where', []):
+            cond = where.get('Condition', {})
+            if 'In' in cond:
+                prop, clean_vals = next(in_conditions)
+                self.filters[prop] = clean_vals
+            elif 'Comparison' in cond:
+                comp = cond['Comparison']
+                prop = comp.get('Left', {}).get('Column', {}).get('Property', '')
+                self.filters[prop] = comp.get('Right', {}).get('Literal', {}).get('Value', '')
+        for query_spec in self.queries:
+            query_spec.where = {**self.filters, **dict(query_spec.in_conditions)}
+
+    @property
+    def key(self) -> Optional[str]:
+        """Ключ дедупликации парсера: первый Select и In фильтры первого запроса.
+        Считается при первом обращении — трансформеру он не нужен"""
+        if self._key is None and self.queries:
+            first = self.queries[0]
+            select_name = first.select_names[0] if first.select_names else ''
+            where_parts = sorted(f"{prop}={'|'.join(sorted(vals))}" for prop, vals in first.in_conditions)
+            self._key = select_name + '::' + '::'.join(where_parts)
+        return self._key
+
+    @property
+    def signature(self) -> Optional[str]:
+        """Структура запроса без значений фильтров: Select и свойства In фильтров каждого запроса.
+        Одинакова для одной визуализации при любом районе и дате — по ней QueryWaiter узнаёт,
+        на какие визуализации шаг уже получил ответ"""
+        if self._signature is None and self.queries:
+            self._signature = ';'.join(
+                ','.join(query_spec.select_names) + '::' + ','.join(sorted(prop for prop, _ in query_spec.in_conditions))
+                for query_spec in self.queries
+            )
+        return self._signature
+
+    def result_query(self, job_id: Any) -> Tuple[int, List[str], Dict[str, Any]]:
+        """(индекс запроса, имена Select, фильтры) для результата с этим jobId"""
+        query_idx = int(job_id) if str(job_id).isdigit() else 0
+        if query_idx < len(self.queries):
+            query_spec = self.queries[query_idx]
+            return query_idx, query_spec.select_names, query_spec.where
+        return query_idx, self.queries[0].select_names, self.filters
+
+
+def compile_request(request: Dict[str, Any]) -> RequestSpec:
+    """Разобранный запрос (тело request с queries) из кеша или разобранный заново"""
+    cached = _compiled.get(id(request))
+    # Кеш держит ссылку на запрос, поэтому его id не может достаться другому объекту
+    if cached is not None and cached[0] is request:
+        _compiled.move_to_end(id(request))
+        return cached[1]
+    spec = RequestSpec(request)
+    _compiled[id(request)] = (request, spec)
+    if len(_compiled) > CACHE_SIZE:
+        _compiled.popitem(last=False)
+    return spec
@@ -0,0 +1,209 @@
+"""
+Ожидание ответов Power BI /query вместо фиксированных пауз.
+Waiter следит за /query запросами страницы и завершает шаг, как только на действие
+пришли все ответы. Для каждого типа шага (смена даты, клик по району и т.д., отдельно для
+подрайонов) запоминается набор сигнатур запросов — визуализаций, которые на него отвечают
+(RequestSpec.signature). Следующий такой же шаг завершается сразу, когда ответ пришёл на
+каждую ожидаемую сигнатуру. Набор пополняется только шагами, после которых не было запросов
+дольше settle_ms: короткая пауза между волнами запросов не обрезает набор. Шаг без
+выученного набора или с неполученными сигнатурами завершается после такой же тишины,
+неполученные сигнатуры пишутся в лог.
+Каждый шаг ограничен таймаутом, т.к. Power BI держит long-polling соединения.
+Запрос относится к шагу, в котором он отправлен: поздние ответы на запросы прошлого шага
+не засчитываются текущему и не сохраняются, а шаг ждёт только свои запросы.
+"""
+
+import asyncio
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from log_levels import log_debug, log_line
+from query_spec import compile_request
+
+DEFAULT_TIMEOUT_MS = 15000
+DEFAULT_SETTLE_MS = 3000
+DEFAULT_START_MS = 1500
+POLL_INTERVAL = 0.05
+
+
+def request_signature(request_json: Any) -> Optional[str]:
+    """Сигнатура тела /query запроса (None — не запрос с queries)"""
+    if not isinstance(request_json, dict):
+        return None
+    return compile_request(request_json).signature
+
+
+def get_expectation_key(step: str, area_name: str) -> str:
+    """Тип шага: подрайоны ('Район - Подрайон') учатся отдельно от главных районов"""
+    return f"{step}:subarea" if " - " in area_name else step
+
+
+class QueryExpectations:
+    """Выученные наборы сигнатур по типам шагов. Общий для всех страниц процесса и
+    сохраняется рядом с raw файлом, чтобы продолжение запуска проверяло полноту пар по нему"""
+
+    def __init__(self, sets: Optional[Dict[str, Iterable[str]]] = None) -> None:
+        self.sets: Dict[str, Set[str]] = {key: set(signatures) for key, signatures in (sets or {}).items()}
+
+    def get(self, key: str) -> Set[str]:
+        return self.sets.get(key, set())
+
+    def learn(self, key: str, signatures: Iterable[str]) -> None:
+        self.sets.setdefault(key, set()).update(signatures)
+
+    @classmethod
+    def load(cls, path: str) -> "QueryExpectations":
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Не удалось прочитать {os.path.basename(path)}: {e}")
+            return cls()
+
+    def save(self, path: str) -> None:
+        """Дописывает наборы к сохранённым (файл может обновлять и другой процесс) и атомарно пишет"""
+        merged = QueryExpectations.load(path)
+        for key, signatures in self.sets.items():
+            merged.learn(key, signatures)
+        tmp_file = path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({key: sorted(signatures) for key, signatures in sorted(merged.sets.items())}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, path)
+
+
+class QueryWaiter:
+    def __init__(self, page: Any, wait_config: Optional[Dict[str, Any]] = None, expectations: Optional[QueryExpectations] = None) -> None:
+        wait_config = wait_config or {}
+        self.page = page
+        self.timeout_ms = int(wait_config.get("timeout_ms", DEFAULT_TIMEOUT_MS))
+        self.settle_ms = int(wait_config.get("settle_ms", DEFAULT_SETTLE_MS))
+        self.start_ms = int(wait_config.get("start_ms", DEFAULT_START_MS))
+        self.expectations = expectations if expectations is not None else QueryExpectations()
+        # Запрос в полёте -> шаг, в котором он отправлен
+        self.inflight: Dict[Any, int] = {}
+        self.captured: Optional[List[Dict[str, Any]]] = None
+        self.area_name = ""
+        self.step_id = 0
+        self.handled = 0
+        # Сигнатуры запросов текущего шага, на которые пришёл ответ
+        self.answered: Set[str] = set()
+        # Ожидаемые сигнатуры, не полученные последним завершённым шагом
+        self.missing: Set[str] = set()
+        self.last_event = 0.0
+
+        page.on("request", self._on_request)
+        page.on("requestfailed", self._on_request_failed)
+        page.on("response", self._on_response)
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def _on_request(self, request: Any) -> None:
+        if "/query" in request.url:
+            self.inflight[request] = self.step_id
+            self.last_event = self._now()
+
+    def _on_request_failed(self, request: Any) -> None:
+        if self.inflight.pop(request, None) == self.step_id:
+            self.last_event = self._now()
+
+    async def _on_response(self, response: Any) -> None:
+        request = response.request
+        step_id = self.inflight.get(request)
+        if step_id is None:
+            return
+        if step_id != self.step_id:
+            # Поздний ответ на запрос прошлого шага
+            self.inflight.pop(request, None)
+            return
+        captured = self.captured
+        signature = None
+        try:
+            request_data = request.post_data
+            request_json = json.loads(request_data) if request_data else None
+            signature = request_signature(request_json)
+            if captured is not None and request_json is not None:
+                response_data = await response.json()
+                if step_id != self.step_id:
+                    return
+                captured.append({
+                    "request": request_json,
+                    "response": response_data
+                })
+                log_debug(f"[API {self.area_name}] Запрос перехвачен (всего: {len(captured)})", self.area_name)
+        except Exception as e:
+            log_line(f"[ERROR] {response.url}: {e}")
+        finally:
+            if step_id == self.step_id:
+                self.handled += 1
+                if signature is not None:
+                    self.answered.add(signature)
+                self.last_event = self._now()
+            self.inflight.pop(request, None)
+
+    def pending(self) -> int:
+        """Запросы текущего шага, на которые ещё нет ответа"""
+        return sum(1 for step_id in self.inflight.values() if step_id == self.step_id)
+
+    def begin(self, area_name: Optional[str] = None) -> None:
+        """Начинает шаг; если задан area_name, ответы шага сохраняются в raw формате"""
+        self.step_id += 1
+        self.handled = 0
+        self.answered = set()
+        # Запросы, отправленные до шага, текущему шагу не засчитываются: их ответы отбрасываются
+        self.inflight.clear()
+        self.area_name = area_name or ""
+        self.captured = [] if area_name else None
+        self.last_event = self._now()
+
+    async def wait(self, step: str, timeout_ms: Optional[int] = None, start_ms: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Ждёт завершения /query ответов шага, возвращает перехваченные запросы"""
+        started = self._now()
+        deadline = started + (timeout_ms or self.timeout_ms) / 1000
+        start_limit = (start_ms or self.start_ms) / 1000
+        settle = self.settle_ms / 1000
+        key = get_expectation_key(step, self.area_name)
+        expected = self.expectations.get(key)
+        settled = False
+
+        while True:
+            now = self._now()
+            if not self.pending():
+                if expected and expected <= self.answered:
+                    break
+                if self.handled and now - self.last_event >= settle:
+                    settled = True
+                    break
+                if not self.handled and now - started >= start_limit:
+                    break
+            if now >= deadline:
+                log_line(f"      [WARNING] {step}: не дождался ответов /query (получено {self.handled}, в ожидании {self.pending()})")
+                break
+            await asyncio.sleep(POLL_INTERVAL)
+
+        # Учится только шаг, после которого запросов не было дольше settle_ms
+        if settled and not self.answered <= expected:
+            self.expectations.learn(key, self.answered)
+        self.missing = expected - self.answered
+        if self.missing and (self.handled or self.captured is not None):
+            log_line(f"      [WARNING] {step}: нет ответов на {len(self.missing)} из {len(expected)} ожидаемых запросов {self.area_name}".rstrip())
+        captured = self.captured or []
+        self.captured = None
+        self.step_id += 1
+        return captured
+
+    async def perform(
+        self,
+        step: str,
+        action: Callable[[], Awaitable[Any]],
+        area_name: Optional[str] = None,
+        timeout_ms: Optional[int] = None,
+        start_ms: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Выполняет действие и ждёт все вызванные им /query ответы"""
+        self.begin(area_name)
+        await action()
+        return await self.wait(step, timeout_ms, start_ms)
@@ -0,0 +1,306 @@
+"""
+Append-only журнал сырых данных парсера (JSONL).
+Каждая строка — один снимок пары (дата, район): {"date": ..., "area": ..., "requests": [...]}.
+Первая строка нового журнала — {"journal_id": ...}, по ней журнал узнаётся после компакции.
+Повторная запись той же пары заменяет предыдущую. Компакция накладывает журнал на
+снимок {дата: {район: [запросы]}} и атомарно переписывает его одним проходом, после
+чего журнал откладывается в <имя>.jsonl.prev (его дочитывает live трансформация).
+Оборванная при падении последняя строка просто пропускается.
+Пары, которые не удалось собрать и после повторов, хранятся рядом в <имя>.failed.json,
+выученные наборы сигнатур /query (QueryExpectations) — в <имя>.queries.json.
+
+Снимок пишется построчно: валидный JSON, где каждая пара (дата, район) занимает одну
+строку. Поэтому компакция и объединение raw файлов идут потоково: в памяти только
+индекс (дата, район) -> смещение строки, значения копируются без разбора.
+"""
+
+import json
+import os
+import tempfile
+import time
+import uuid
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_decoder = json.JSONDecoder()
+
+
+def get_journal_path(output_file: str) -> str:
+    """metrics_raw.json -> metrics_raw.jsonl"""
+    return os.path.splitext(output_file)[0] + ".jsonl"
+
+
+def get_prev_journal_path(output_file: str) -> str:
+    """metrics_raw.json -> metrics_raw.jsonl.prev (журнал до последней компакции)"""
+    return get_journal_path(output_file) + ".prev"
+
+
+def replace_file(src: str, dst: str, attempts: int = 20) -> None:
+    """os.replace с повтором: в Windows файл нельзя заменить, пока его читает другой процесс"""
+    for attempt in range(attempts):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.05)
+
+
+def get_failed_path(output_file: str) -> str:
+    """metrics_raw.json -> metrics_raw.failed.json"""
+    return os.path.splitext(output_file)[0] + ".failed.json"
+
+
+def get_queries_path(output_file: str) -> str:
+    """metrics_raw.json -> metrics_raw.queries.json (выученные сигнатуры /query по типам шагов)"""
+    return os.path.splitext(output_file)[0] + ".queries.json"
+
+
+def load_failed_units(output_file: str) -> List[Tuple[str, str]]:
+    """Несобранные пары (дата, район) из <имя>.failed.json"""
+    failed_path = get_failed_path(output_file)
+    if not os.path.exists(failed_path):
+        return []
+    with open(failed_path, "r", encoding="utf-8") as f:
+        return [(unit["date"], unit["area"]) for unit in json.load(f)]
+
+
+def save_failed_units(output_file: str, area_keys: List[str], failed_units: List[Tuple[str, str]]) -> None:
+    """Обновляет <имя>.failed.json: записи районов area_keys заменяются failed_units,
+    записи других районов (прошлых запусков parser.py в тот же файл) остаются"""
+    session_keys = set(area_keys)
+    units = [unit for unit in load_failed_units(output_file) if unit[1] not in session_keys]
+    units.extend(failed_units)
+    failed_path = get_failed_path(output_file)
+    if not units:
+        if os.path.exists(failed_path):
+            os.remove(failed_path)
+        return
+    write_json_atomic([{"date": date_key, "area": area_key} for date_key, area_key in units], failed_path)
+
+
+def append_entry(journal_path: str, date_key: str, area_key: str, requests: List[Dict[str, Any]]) -> None:
+    """Дописывает снимок (дата, район) одной строкой"""
+    line = json.dumps({"date": date_key, "area": area_key, "requests": requests}, ensure_ascii=False)
+    with open(journal_path, "a+b") as f:
+        if f.tell() == 0:
+            f.write((json.dumps({"journal_id": uuid.uuid4().hex}) + "\n").encode("utf-8"))
+        # После падения посреди записи последняя строка может быть оборвана
+        else:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+        f.write((line + "\n").encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_entries(journal_path: str) -> Iterator[Tuple[str, str, List[Dict[str, Any]]]]:
+    """Читает записи журнала по порядку, пропуская повреждённые строки"""
+    with open(journal_path, "r", encoding="utf-8") as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"[WARNING] {os.path.basename(journal_path)}: пропущена повреждённая строка {line_num}")
+                continue
+            if "date" in entry:
+                yield entry["date"], entry["area"], entry["requests"]
+
+
+def apply_journal(result: Dict[str, Dict[str, Any]], journal_path: str) -> int:
+    """Накладывает журнал на результат, возвращает число применённых записей"""
+    if not os.path.exists(journal_path):
+        return 0
+    applied = 0
+    for date_key, area_key, requests in read_entries(journal_path):
+        result.setdefault(date_key, {})[area_key] = requests
+        applied += 1
+    return applied
+
+
+def load_raw_result(output_file: str) -> Dict[str, Dict[str, Any]]:
+    """Текущее состояние: последний компактный снимок + журнал после него"""
+    result: Dict[str, Dict[str, Any]] = {}
+    if os.path.exists(output_file):
+        with open(output_file, "r", encoding="utf-8") as f:
+            result = json.load(f)
+    applied = apply_journal(result, get_journal_path(output_file))
+    if applied:
+        print(f"[INFO] Из журнала применено {applied} записей")
+    return result
+
+
+def write_json_atomic(data: Any, output_file: str) -> None:
+    """Пишет JSON во временный файл и заменяет им целевой"""
+    tmp_file = output_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    replace_file(tmp_file, output_file)
+
+
+def write_raw_lines(f: IO[str], dates: Iterable[Tuple[str, Iterable[Tuple[str, str]]]]) -> None:
+    """Пишет {дата: {район: [...]}} по строке на пару; значение — готовый однострочный JSON запросов"""
+    f.write("{")
+    first_date = True
+    for date_key, areas in dates:
+        f.write(("\n" if first_date else ",\n") + f"  {json.dumps(date_key, ensure_ascii=False)}: {{")
+        first_area = True
+        for area_key, requests_json in areas:
+            f.write(("\n" if first_area else ",\n") + f"    {json.dumps(area_key, ensure_ascii=False)}: {requests_json}")
+            first_area = False
+        f.write("}" if first_area else "\n  }")
+        first_date = False
+    f.write("}\n" if first_date else "\n}\n")
+
+
+def write_raw_result(result: Dict[str, Dict[str, Any]], output_file: str) -> None:
+    """Атомарно пишет результат в построчном формате"""
+    tmp_file = output_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        write_raw_lines(f, (
+            (date_key, ((area_key, json.dumps(requests, ensure_ascii=False)) for area_key, requests in areas.items()))
+            for date_key, areas in result.items()
+        ))
+    replace_file(tmp_file, output_file)
+
+
+def split_key_line(line: str) -> Tuple[str, str]:
+    """'"ключ": значение,' -> (ключ, значение)"""
+    text = line.strip()
+    key, end = _decoder.raw_decode(text)
+    return key, text[end:].lstrip()[1:].strip().rstrip(",")
+
+
+def iter_raw_lines(raw_file: str) -> Iterator[Tuple[str, Optional[str], int, str]]:
+    """(дата, район, смещение строки, JSON запросов) построчного снимка; для строки самой даты
+    район None. ValueError — файл не в построчном формате (например, старый json.dump с indent=2)"""
+    with open(raw_file, "rb") as f:
+        offset = 0
+        date_key: Optional[str] = None
+        for raw_line in f:
+            line_offset = offset
+            offset += len(raw_line)
+            line = raw_line.decode("utf-8")
+            if line.startswith('    "'):
+                area_key, value = split_key_line(line)
+                if date_key is None or not (value.startswith("[") and value.endswith("]")):
+                    raise ValueError(f"{os.path.basename(raw_file)}: не построчный формат")
+                yield date_key, area_key, line_offset, value
+            elif line.startswith('  "'):
+                date_key = split_key_line(line)[0]
+                yield date_key, None, line_offset, ""
+            elif line.strip() not in ("{", "}", "},", "{}", ""):
+                raise ValueError(f"{os.path.basename(raw_file)}: не построчный формат")
+
+
+def scan_raw_file(raw_file: str) -> Iterator[Tuple[str, Optional[str], int]]:
+    """(дата, район, смещение строки) построчного снимка, см. iter_raw_lines"""
+    for date_key, area_key, offset, _ in iter_raw_lines(raw_file):
+        yield date_key, area_key, offset
+
+
+def scan_journal(journal_path: str) -> Iterator[Tuple[str, str, int]]:
+    """(дата, район, смещение строки) записей журнала, повреждённые строки пропускаются"""
+    with open(journal_path, "rb") as f:
+        offset = 0
+        for line_num, raw_line in enumerate(f, 1):
+            line_offset = offset
+            offset += len(raw_line)
+            if not raw_line.strip():
+                continue
+            try:
+                entry = json.loads(raw_line)
+            except json.JSONDecodeError:
+                print(f"[WARNING] {os.path.basename(journal_path)}: пропущена повреждённая строка {line_num}")
+                continue
+            if "date" in entry:
+                yield entry["date"], entry["area"], line_offset
+
+
+def index_raw_file(raw_file: str, temp_files: List[str]) -> Tuple[str, List[Tuple[str, Optional[str], int]]]:
+    """(файл для чтения значений, индекс снимка). Входной файл не меняется: для файла старого
+    формата построчная копия пишется во временный файл рядом, его путь добавляется в temp_files
+    (удаляет вызывающий)"""
+    try:
+        return raw_file, list(scan_raw_file(raw_file))
+    except ValueError:
+        print(f"[INFO] {os.path.basename(raw_file)}: старый формат, читаю через построчную копию")
+        fd, temp_file = tempfile.mkstemp(prefix=".lines-", suffix=".json", dir=os.path.dirname(os.path.abspath(raw_file)))
+        os.close(fd)
+        temp_files.append(temp_file)
+        with open(raw_file, "r", encoding="utf-8") as f:
+            write_raw_result(json.load(f), temp_file)
+        return temp_file, list(scan_raw_file(temp_file))
+
+
+def merge_raw_streams(raw_files: List[str], output_file: str) -> Dict[str, List[str]]:
+    """Потоково объединяет raw файлы (снимок + журнал каждого) в output_file построчного формата.
+    Более поздний источник заменяет пару (дата, район) из более раннего, как dict.update.
+    В памяти только индекс пар. Входные файлы только читаются. Возвращает {дата: [районы]}"""
+    sources: List[Tuple[str, bool]] = []
+    index: Dict[str, Dict[str, Tuple[int, int]]] = {}
+    temp_files: List[str] = []
+    handles: List[IO[bytes]] = []
+    tmp_file = output_file + ".tmp"
+    try:
+        for raw_file in raw_files:
+            if os.path.exists(raw_file):
+                source_num = len(sources)
+                read_path, raw_index = index_raw_file(raw_file, temp_files)
+                sources.append((read_path, False))
+                for date_key, area_key, offset in raw_index:
+                    areas = index.setdefault(date_key, {})
+                    if area_key is not None:
+                        areas[area_key] = (source_num, offset)
+            journal_path = get_journal_path(raw_file)
+            if os.path.exists(journal_path):
+                source_num = len(sources)
+                sources.append((journal_path, True))
+                for date_key, area_key, offset in scan_journal(journal_path):
+                    index.setdefault(date_key, {})[area_key] = (source_num, offset)
+
+        handles = [open(path, "rb") for path, _ in sources]
+
+        def read_value(source_num: int, offset: int) -> str:
+            f = handles[source_num]
+            f.seek(offset)
+            line = f.readline().decode("utf-8")
+            if sources[source_num][1]:
+                return json.dumps(json.loads(line)["requests"], ensure_ascii=False)
+            return split_key_line(line)[1]
+
+        with open(tmp_file, "w", encoding="utf-8") as out:
+            write_raw_lines(out, (
+                (date_key, ((area_key, read_value(*location)) for area_key, location in areas.items()))
+                for date_key, areas in index.items()
+            ))
+    finally:
+        for handle in handles:
+            handle.close()
+        for temp_file in temp_files:
+            os.remove(temp_file)
+    replace_file(tmp_file, output_file)
+    return {date_key: list(areas) for date_key, areas in index.items()}
+
+
+def compact_journal(output_file: str) -> bool:
+    """Сливает журнал в output_file {дата: {район: [...]}} и удаляет журнал"""
+    journal_path = get_journal_path(output_file)
+    if not os.path.exists(journal_path):
+        return False
+    merge_raw_streams([output_file], output_file)
+    replace_file(journal_path, get_prev_journal_path(output_file))
+    print(f"[OK] Журнал {os.path.basename(journal_path)} сжат в {os.path.basename(output_file)}")
+    return True
+
+
+def remove_raw_output(output_file: str) -> None:
+    """Удаляет снимок, журнал, список несобранных пар и выученные сигнатуры предыдущего запуска"""
+    for path in (output_file, get_journal_path(output_file), get_prev_journal_path(output_file), get_failed_path(output_file), get_queries_path(output_file)):
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"[INFO] Удалил старый файл: {os.path.basename(path)}")
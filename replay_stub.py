@@ -0,0 +1,198 @@
+"""
+Локальный stub Power BI /query для проверки replay (powerbi_replay.py) без дашборда.
+Сервер отвечает на POST /query эхом фильтров In (колонка -> значения) из Where запроса.
+Проверка прогоняет шаблоны типичных форм (только район, район и подрайон, только подрайон,
+без фильтра района) через replay_area_day для главного района и подрайона и сверяет,
+что сервер получил фильтр именно этого ключа, а шаблон без фильтра района не отправлен.
+Запросы идут через request API playwright, как в парсере; без playwright — через urllib.
+Запуск:
+    python replay_stub.py              # проверка, код выхода 1 при расхождениях
+    python replay_stub.py serve 8765   # только сервер: "replay": {"query_url": "http://127.0.0.1:8765/query"}
+"""
+
+import asyncio
+import json
+import sys
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from powerbi_replay import (
+    expression_property,
+    iter_conditions,
+    replay_area_day,
+    string_literal,
+)
+
+AREA = "Dubai Marina"
+SUBAREA = "Marina Promenade"
+TEMPLATE_AREA = "Business Bay"
+
+
+def echo_filters(request_json: Dict[str, Any]) -> Dict[str, List[Any]]:
+    """{колонка: значения} всех фильтров In запроса"""
+    filters: Dict[str, List[Any]] = {}
+    for query in request_json.get("queries", []):
+        for cmd in query.get("Query", {}).get("Commands", []):
+            sq = cmd.get("SemanticQueryDataShapeCommand", {}).get("Query", {})
+            for where in sq.get("Where", []):
+                for cond in iter_conditions(where.get("Condition", {})):
+                    if "In" not in cond:
+                        continue
+                    properties = [expression_property(expr) for expr in cond["In"].get("Expressions", [])]
+                    for row in cond["In"].get("Values", []):
+                        for prop, literal in zip(properties, row):
+                            filters.setdefault(prop, []).append(literal["Literal"]["Value"])
+    return filters
+
+
+class StubQueryHandler(BaseHTTPRequestHandler):
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            request_json = json.loads(body)
+        except ValueError:
+            self.send_error(400)
+            return
+        payload = json.dumps({"results": [{"result": {"data": {"filters": echo_filters(request_json)}}}]})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(payload.encode("utf-8"))
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def start_server(port: int = 0) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubQueryHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class UrllibResponse:
+    def __init__(self, status: int, body: bytes) -> None:
+        self.status = status
+        self.ok = 200 <= status < 300
+        self.body = body
+
+    async def json(self) -> Any:
+        return json.loads(self.body)
+
+
+class UrllibRequestApi:
+    """Замена APIRequestContext playwright для проверки без браузера: post() в потоке"""
+
+    async def post(self, url: str, data: str, headers: Dict[str, str], timeout: float) -> UrllibResponse:
+        return await asyncio.to_thread(self.post_sync, url, data, headers, timeout)
+
+    def post_sync(self, url: str, data: str, headers: Dict[str, str], timeout: float) -> UrllibResponse:
+        request = urllib.request.Request(url, data=data.encode("utf-8"), headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=timeout / 1000) as response:
+                return UrllibResponse(response.status, response.read())
+        except urllib.error.HTTPError as e:
+            return UrllibResponse(e.code, e.read())
+
+
+def column(prop: str) -> Dict[str, Any]:
+    return {"Column": {"Expression": {"SourceRef": {"Source": "a"}}, "Property": prop}}
+
+
+def in_condition(values: Dict[str, str]) -> Dict[str, Any]:
+    return {"In": {
+        "Expressions": [column(prop) for prop in values],
+        "Values": [[string_literal(value) for value in values.values()]],
+    }}
+
+
+def make_template(conditions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    date_condition = {"Comparison": {
+        "ComparisonKind": 2,
+        "Left": column("Date"),
+        "Right": {"Literal": {"Value": "datetime'2025-01-01T00:00:00'"}},
+    }}
+    where = [{"Condition": cond} for cond in conditions + [date_condition]]
+    request = {"queries": [{"Query": {"Commands": [{"SemanticQueryDataShapeCommand": {"Query": {"Where": where}}}]}}]}
+    return {"url": "", "headers": {"Content-Type": "application/json"}, "request": request}
+
+
+def sample_templates() -> Dict[str, Dict[str, Any]]:
+    return {
+        "только район": make_template([in_condition({"Area": TEMPLATE_AREA})]),
+        "район и подрайон": make_template([in_condition({"Area": TEMPLATE_AREA, "Community": "Bay Square"})]),
+        "только подрайон": make_template([in_condition({"Community": "Bay Square"})]),
+        "район и тип": make_template([in_condition({"Area": TEMPLATE_AREA, "Type": "Apartment"})]),
+        "без района": make_template([in_condition({"Type": "Apartment"})]),
+    }
+
+
+def expected_filters(name: str, subarea: Optional[str]) -> Dict[str, List[str]]:
+    expected = {"Area": [string_literal(AREA)["Literal"]["Value"]]}
+    if subarea is not None:
+        expected["Community"] = [string_literal(subarea)["Literal"]["Value"]]
+    if name == "район и тип":
+        expected["Type"] = ["'Apartment'"]
+    return expected
+
+
+async def run_check(request_api: Any, query_url: str) -> int:
+    replay_config = {"query_url": query_url, "timeout_ms": 10000}
+    semaphore = asyncio.Semaphore(4)
+    errors = 0
+    for area_key, subarea in ((AREA, None), (f"{AREA} - {SUBAREA}", SUBAREA)):
+        templates = sample_templates()
+        replayed, failed = await replay_area_day(
+            request_api, list(templates.values()), area_key, "02.01.2025", "02.01.2025", replay_config, semaphore
+        )
+        sent = [name for name in templates if not templates[name].get("no_area_filter")]
+        if failed or len(replayed) != len(sent) or "без района" in sent:
+            print(f"[ERROR] {area_key}: отправлено {len(replayed)} из {len(sent)}, ошибок {failed}")
+            errors += 1
+        for name, item in zip(sent, replayed):
+            filters = item["response"]["results"][0]["result"]["data"]["filters"]
+            expected = expected_filters(name, subarea)
+            if filters != expected:
+                print(f"[ERROR] {area_key} / {name}: фильтры {filters}, ожидалось {expected}")
+                errors += 1
+            else:
+                print(f"[OK] {area_key} / {name}: {filters}")
+    return errors
+
+
+async def check() -> int:
+    server = start_server()
+    query_url = f"http://127.0.0.1:{server.server_address[1]}/query"
+    try:
+        try:
+            from playwright.async_api import async_playwright
+        except ImportError:
+            print("[INFO] playwright не установлен, запросы через urllib")
+            return await run_check(UrllibRequestApi(), query_url)
+        async with async_playwright() as pw:
+            request_api = await pw.request.new_context()
+            try:
+                return await run_check(request_api, query_url)
+            finally:
+                await request_api.dispose()
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else 8765
+        stub = start_server(port)
+        print(f"[START] Stub /query: http://127.0.0.1:{port}/query (Ctrl+C для остановки)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            stub.shutdown()
+        sys.exit(0)
+    errors = asyncio.run(check())
+    if errors:
+        print(f"\n[ERROR] Расхождений: {errors}")
+        sys.exit(1)
+    print("\n[SUCCESS] Replay подставляет фильтр района во все шаблоны")
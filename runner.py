@@ -3,13 +3,22 @@
 Запускает parser.py для каждого файла районов, объединяет результаты и делает трансформацию
 """
 
+import asyncio
+import importlib.util
 import json
 import os
+import shutil
 import subprocess
 import sys
+import threading
+import time
 from datetime import datetime, timedelta
-from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from live_transform import LiveTransformProcess
+from log_levels import configure_logging, get_log_env
+from raw_journal import get_journal_path, load_failed_units, merge_raw_streams, remove_raw_output
+from scheduler import build_batches, estimate_costs, get_batches_count, load_area_hierarchy, load_area_timings, write_batch_queue
+from tidy_output import check_tidy_formats
 
 def load_config() -> Dict[str, Any]:
     """Загружает конфиг"""
@@ -21,7 +30,8 @@ def load_config() -> Dict[str, Any]:
         return config
 
 def load_areas_and_create_batches(config: Dict[str, Any]) -> Optional[List[List[str]]]:
-    """Загружает районы из одного файла и разбивает на батчи"""
+    """Загружает районы и делит их на батчи примерно равной ожидаемой стоимости.
+    Стоимость — район и его подрайоны либо историческое время обработки (area_timings.jsonl)"""
     areas_file = config["areas_file"]
     batch_size = config["batch_size"]
     
@@ -29,24 +39,171 @@ def load_areas_and_create_batches(config: Dict[str, Any]) -> Optional[List[List[
         print(f"[ERROR] Файл {areas_file} не найден")
         return None
     
-    with open(areas_file, "r", encoding="utf-8") as f:
-        areas = [line.strip() for line in f if line.strip()]
+    areas_structure = load_area_hierarchy(areas_file)
     
-    if not areas:
+    if not areas_structure:
         print(f"[ERROR] Файл {areas_file} пуст")
         return None
     
-    print(f"[OK] Загружено {len(areas)} районов из {areas_file}")
+    total_subareas = sum(len(subareas) for subareas in areas_structure.values())
+    print(f"[OK] Загружено {len(areas_structure)} районов и {total_subareas} подрайонов из {areas_file}")
     
-    batches = []
-    for i in range(0, len(areas), batch_size):
-        batch = areas[i:i+batch_size]
-        batches.append(batch)
+    areas = list(areas_structure)
+    timings = load_area_timings()
+    if timings:
+        print(f"[INFO] История времени обработки есть для {len(set(timings) & set(areas))} районов")
+    costs = estimate_costs(areas, areas_structure, timings)
+    batches = build_batches(areas, costs, get_batches_count(areas_structure, batch_size))
     
-    print(f"[OK] Разбито на {len(batches)} батчей по {batch_size} районов")
+    print(f"[OK] Разбито на {len(batches)} батчей (~{batch_size} районов с подрайонами в батче)")
+    for batch_num, batch in enumerate(batches, 1):
+        batch_cost = sum(costs[area] for area in batch)
+        print(f"  [BATCH {batch_num}] {len(batch)} районов, стоимость {batch_cost:.1f}")
     return batches if batches else None
 
-def run_parser_for_batch(areas_batch: List[str], output_raw_file: str, batch_num: int, total_batches: int, date_settings: Dict[str, Any]) -> bool:
+def get_python_executable() -> str:
+    venv_python = os.path.join(os.getcwd(), "venv", "Scripts", "python.exe")
+    if not os.path.exists(venv_python):
+        venv_python = "python"
+    return venv_python
+
+def get_parser_env(output_raw_file: str, date_settings: Dict[str, Any], resume: bool = False) -> Dict[str, str]:
+    """Окружение процесса parser.py: даты и raw файл передаются через переменные PARSER_*.
+    resume=True — пропускать уже собранные пары независимо от конфига (повтор упавшего батча)"""
+    env = os.environ.copy()
+    env["PARSER_START_DATE"] = date_settings["start_date"]
+    env["PARSER_END_DATE"] = date_settings["end_date"]
+    env["PARSER_EVERYDAY"] = str(date_settings["everyday"]).lower()
+    env["PARSER_OUTPUT_RAW_FILE"] = output_raw_file
+    if resume:
+        env["PARSER_RESUME"] = "true"
+    return env
+
+def retry_with_backoff(run: Callable[[], bool], label: str, retry_config: Dict[str, Any]) -> bool:
+    """Повторяет упавший запуск с паузой base_delay_s, удваивающейся с каждой попыткой"""
+    attempts = int(retry_config.get("attempts", 3))
+    base_delay = float(retry_config.get("base_delay_s", 5))
+    for attempt in range(attempts):
+        delay = base_delay * 2 ** attempt
+        print(f"\n[RETRY] {label}: попытка {attempt + 1}/{attempts} через {delay:.0f} с")
+        time.sleep(delay)
+        if run():
+            return True
+    print(f"[ERROR] {label}: не удалось после {attempts} попыток")
+    return False
+
+def get_worker_raw_file(output_raw_file: str, worker_num: int) -> str:
+    """metrics_raw.json -> metrics_raw.w1.json"""
+    base, ext = os.path.splitext(output_raw_file)
+    return f"{base}.w{worker_num}{ext}"
+
+def stream_output(process: "subprocess.Popen[str]", prefix: str) -> None:
+    """Печатает вывод процесса-воркера построчно с префиксом"""
+    assert process.stdout is not None
+    for line in process.stdout:
+        print(f"[{prefix}] {line}", end="", flush=True)
+
+def start_worker(worker_num: int, raw_file: str, queue_dir: str, date_settings: Dict[str, Any], resume: bool = False) -> Tuple[subprocess.Popen[str], threading.Thread]:
+    """Запускает процесс parser.py, забирающий батчи из очереди, и поток вывода с префиксом WN"""
+    env = get_parser_env(raw_file, date_settings, resume)
+    env["PARSER_BATCH_QUEUE"] = queue_dir
+    env["PARSER_WORKER_LABEL"] = f"W{worker_num}"
+    env["PARSER_PROCESS_DEFAULT_AREA"] = "true" if worker_num == 1 else "false"
+    env["PYTHONUNBUFFERED"] = "1"
+    env["PYTHONIOENCODING"] = "utf-8"
+    process = subprocess.Popen(
+        [get_python_executable(), "parser.py"],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    thread = threading.Thread(target=stream_output, args=(process, f"W{worker_num}"), daemon=True)
+    thread.start()
+    return process, thread
+
+def wait_worker(worker_num: int, process: "subprocess.Popen[str]", thread: threading.Thread) -> bool:
+    returncode = process.wait()
+    thread.join()
+    if returncode != 0:
+        print(f"[ERROR] Воркер W{worker_num} завершился с ошибкой (код {returncode})")
+        return False
+    print(f"[OK] Воркер W{worker_num} завершен успешно")
+    return True
+
+def requeue_worker_batches(queue_dir: str, worker_num: int) -> int:
+    """Возвращает в очередь батчи, забранные упавшим воркером (собранные пары при повторе пропускаются)"""
+    prefix = f"claimed_W{worker_num}_"
+    names = [name for name in os.listdir(queue_dir) if name.startswith(prefix)]
+    for name in names:
+        os.rename(os.path.join(queue_dir, name), os.path.join(queue_dir, name[len(prefix):]))
+    return len(names)
+
+def load_parser_module() -> Any:
+    """parser.py, загруженный по пути: в Python 3.9 имя parser занято модулем стандартной
+    библиотеки, и `import parser` мог бы вернуть его"""
+    module_name = "reidin_parser"
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    parser_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parser.py")
+    spec = importlib.util.spec_from_file_location(module_name, parser_path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Не удалось загрузить {parser_path}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
+
+def run_batches_parallel(batches: List[List[str]], output_raw_file: str, date_settings: Dict[str, Any], processes: int, retry_config: Dict[str, Any]) -> List[str]:
+    """Запускает K процессов parser.py параллельно. Батчи лежат в общей очереди (PARSER_BATCH_QUEUE),
+    освободившийся процесс забирает следующий; каждый процесс пишет в свой raw файл.
+    Батчи упавшего воркера возвращаются в очередь и повторяются в режиме resume"""
+    print(f"\n{'='*70}")
+    print(f"[PARALLEL] {len(batches)} батчей на {processes} процессах (динамическая очередь)")
+    print(f"[DATES] {date_settings['start_date']} - {date_settings['end_date']} (everyday: {date_settings['everyday']})")
+    print(f"{'='*70}")
+
+    # Одна проверка/обновление state.json до старта, чтобы воркеры не логинились одновременно
+    try:
+        asyncio.run(load_parser_module().prepare_session())
+    except Exception as e:
+        print(f"[WARNING] Не удалось подготовить сессию заранее: {e}")
+
+    queue_dir = os.path.join(os.getcwd(), "batch_queue")
+    if os.path.exists(queue_dir):
+        shutil.rmtree(queue_dir)
+    write_batch_queue(queue_dir, batches)
+
+    workers = []
+    raw_files = []
+    for worker_num in range(1, processes + 1):
+        raw_file = get_worker_raw_file(output_raw_file, worker_num)
+        raw_files.append(raw_file)
+        print(f"[W{worker_num}] -> {raw_file}")
+        process, thread = start_worker(worker_num, raw_file, queue_dir, date_settings)
+        workers.append((worker_num, process, thread))
+
+    failed_workers = [worker_num for worker_num, process, thread in workers if not wait_worker(worker_num, process, thread)]
+    for worker_num in failed_workers:
+        raw_file = raw_files[worker_num - 1]
+        requeued = requeue_worker_batches(queue_dir, worker_num)
+        print(f"[QUEUE] Батчей воркера W{worker_num} возвращено в очередь: {requeued}")
+
+        def rerun_worker() -> bool:
+            return wait_worker(worker_num, *start_worker(worker_num, raw_file, queue_dir, date_settings, resume=True))
+
+        retry_with_backoff(rerun_worker, f"Воркер W{worker_num}", retry_config)
+    shutil.rmtree(queue_dir, ignore_errors=True)
+    return raw_files
+
+def run_parser_for_batch(areas_batch: List[str], output_raw_file: str, batch_num: int, total_batches: int, date_settings: Dict[str, Any], resume: bool = False) -> bool:
     """Запускает parser.py для батча районов"""
     batch_areas_count = len(areas_batch)
     print(f"\n{'='*70}")
@@ -60,15 +217,8 @@ def run_parser_for_batch(areas_batch: List[str], output_raw_file: str, batch_num
             f.write(area + "\n")
     
     try:
-        venv_python = os.path.join(os.getcwd(), "venv", "Scripts", "python.exe")
-        if not os.path.exists(venv_python):
-            venv_python = "python"
-        env = os.environ.copy()
-        env["PARSER_START_DATE"] = date_settings["start_date"]
-        env["PARSER_END_DATE"] = date_settings["end_date"]
-        env["PARSER_EVERYDAY"] = str(date_settings["everyday"]).lower()
-        env["PARSER_OUTPUT_RAW_FILE"] = output_raw_file
-        result = subprocess.run([venv_python, "parser.py"], env=env)
+        env = get_parser_env(output_raw_file, date_settings, resume)
+        result = subprocess.run([get_python_executable(), "parser.py"], env=env)
         if result.returncode != 0:
             print(f"[ERROR] Парсер завершился с ошибкой (код {result.returncode})")
             return False
@@ -78,38 +228,81 @@ def run_parser_for_batch(areas_batch: List[str], output_raw_file: str, batch_num
         print(f"[ERROR] Ошибка при запуске парсера: {e}")
         return False
 
-def merge_raw_files(total_batches: int, output_raw_file: str, output_merged_file: str) -> bool:
-    """Объединяет все батчи в один файл"""
+def run_batches_in_process(batches: List[List[str]], output_raw_file: str, date_settings: Dict[str, Any], resume: Optional[bool] = None) -> bool:
+    """Запускает все батчи в текущем процессе на одной сессии браузера (parser.run_session)"""
+    print(f"\n{'='*70}")
+    print(f"[SESSION] {len(batches)} батчей в одной сессии браузера")
+    print(f"[OUTPUT] Raw file: {output_raw_file}")
+    print(f"[DATES] {date_settings['start_date']} - {date_settings['end_date']} (everyday: {date_settings['everyday']})")
+    print(f"{'='*70}")
+    try:
+        success: bool = asyncio.run(load_parser_module().run_session(batches, date_settings, output_raw_file, resume=resume))
+        return success
+    except Exception as e:
+        print(f"[ERROR] Сессия парсера завершилась с ошибкой: {e}")
+        return False
+
+def prepare_raw_output(output_raw_path: str, raw_paths: List[str], date_settings: Dict[str, Any], resume: bool) -> None:
+    """Удаляет raw прошлого запуска (общий и файлы воркеров); в режиме resume оставляет их, если запуск был с теми же датами"""
+    run_file = os.path.splitext(output_raw_path)[0] + ".run.json"
+    run_info = {
+        "start_date": date_settings["start_date"],
+        "end_date": date_settings["end_date"],
+        "everyday": bool(date_settings["everyday"]),
+    }
+    if resume and os.path.exists(run_file):
+        with open(run_file, "r", encoding="utf-8") as f:
+            previous_run = json.load(f)
+        if previous_run == run_info:
+            print(f"[RESUME] Продолжаю прошлый запуск: собранные пары (дата, район) будут пропущены")
+            return
+        print(f"[RESUME] Прошлый запуск был с другими датами, начинаю заново")
+    for raw_path in raw_paths:
+        remove_raw_output(raw_path)
+    with open(run_file, "w", encoding="utf-8") as f:
+        json.dump(run_info, f, ensure_ascii=False, indent=2)
+
+def report_failed_units(raw_files: List[str]) -> None:
+    """Итоговый список пар (дата, район), которые parser.py не собрал и после повторов"""
+    failed_units = []
+    for raw_file in raw_files:
+        failed_units.extend(load_failed_units(os.path.join(os.getcwd(), raw_file)))
+    if not failed_units:
+        print(f"\n[OK] Все пары (дата, район) собраны")
+        return
+    print(f"\n[ERROR] Не собрано пар (дата, район): {len(failed_units)}")
+    failed_by_area: Dict[str, List[str]] = {}
+    for date_key, area_key in failed_units:
+        failed_by_area.setdefault(area_key, []).append(date_key)
+    for area_key, date_keys in failed_by_area.items():
+        print(f"  - {area_key}: {', '.join(date_keys)}")
+
+def merge_raw_files(raw_files: List[str], output_merged_file: str) -> Optional[Dict[str, List[str]]]:
+    """Потоково объединяет raw файлы (общий или по одному на воркер) вместе с их журналами в один файл.
+    Возвращает {дата: [районы]} объединённого файла"""
     print(f"\n{'='*70}")
     print(f"[MERGE] Объединяю результаты...")
-    print(f"[INPUT] {output_raw_file} (один для каждого батча)")
+    print(f"[INPUT] {', '.join(raw_files)}")
     print(f"[OUTPUT] {output_merged_file}")
     print(f"{'='*70}")
-    merged_data: Dict[str, Dict[str, Any]] = {}
-    raw_file = output_raw_file
-    if not os.path.exists(raw_file):
-        print(f"[WARNING] Файл {raw_file} не найден")
-        return False
-    print(f"[INFO] Загружаю {raw_file}...")
-    with open(raw_file, "r", encoding="utf-8") as f:
-        batch_data = json.load(f)
-    for date_str, areas_dict in batch_data.items():
-        if date_str not in merged_data:
-            merged_data[date_str] = {}
-        merged_data[date_str].update(areas_dict)
-        print(f"  [{date_str}] Загружено {len(areas_dict)} районов")
-    with open(output_merged_file, "w", encoding="utf-8") as f:
-        json.dump(merged_data, f, ensure_ascii=False, indent=2)
-    total_dates = len(merged_data)
-    total_areas = sum(len(date_data) for date_data in merged_data.values())
+    raw_paths = [os.path.join(os.getcwd(), raw_file) for raw_file in raw_files]
+    available = [path for path in raw_paths if os.path.exists(path) or os.path.exists(get_journal_path(path))]
+    for raw_path in raw_paths:
+        if raw_path not in available:
+            print(f"[WARNING] Файл {raw_path} не найден")
+    if not available:
+        return None
+    merged_index = merge_raw_streams(available, os.path.join(os.getcwd(), output_merged_file))
+    for date_str, areas in merged_index.items():
+        print(f"  [{date_str}] {len(areas)} районов")
     print(f"\n[OK] Объединение завершено!")
-    print(f"  Дат: {total_dates}")
-    print(f"  Всего уникальных районов: {len(set(area for date_data in merged_data.values() for area in date_data.keys()))}")
+    print(f"  Дат: {len(merged_index)}")
+    print(f"  Всего уникальных районов: {len(set(area for areas in merged_index.values() for area in areas))}")
     print(f"  Файл: {output_merged_file}")
-    return True
+    return merged_index
 
-def run_transform(output_final_file: str) -> bool:
-    """Запускает скрипт трансформации"""
+def run_transform(input_file: str, output_final_file: str, processes: int = 1, tidy_formats: Optional[List[str]] = None) -> bool:
+    """Запускает скрипт трансформации (processes > 1 — в пуле процессов, tidy_formats — плоский итог)"""
     print(f"\n{'='*70}")
     print(f"[TRANSFORM] Запуск трансформации...")
     print(f"[OUTPUT] {output_final_file}")
@@ -120,7 +313,10 @@ def run_transform(output_final_file: str) -> bool:
             venv_python = "python"
         
         env = os.environ.copy()
+        env["TRANSFORM_INPUT_FILE"] = input_file
         env["TRANSFORM_OUTPUT_FILE"] = output_final_file
+        env["TRANSFORM_PROCESSES"] = str(processes)
+        env["TRANSFORM_TIDY_FORMATS"] = ",".join(tidy_formats or [])
         
         result = subprocess.run([venv_python, "transform_to_structure.py"], env=env)
         if result.returncode != 0:
@@ -140,6 +336,16 @@ def main() -> None:
     
     print(f"\n[INFO] Загружаю config.json...")
     config = load_config()
+    # Уровень логирования наследуют parser.py и transform_to_structure.py через окружение
+    os.environ.update(get_log_env(config.get("log")))
+    configure_logging()
+
+    # Плоский итог пишется только в конце запуска: ошибка настройки видна до парсинга, а не после
+    tidy_errors = check_tidy_formats(config.get("tidy_output", []))
+    if tidy_errors:
+        for error in tidy_errors:
+            print(f"[ERROR] {error}")
+        sys.exit(1)
     
     auto_mode = config["auto"]
     
@@ -181,24 +387,59 @@ def main() -> None:
     
     total_batches = len(batches)
     
+    processes = max(1, min(int(config.get("processes", 1)), total_batches))
+    if processes > 1:
+        raw_files = [get_worker_raw_file(output_raw_file, worker_num) for worker_num in range(1, processes + 1)]
+    else:
+        raw_files = [output_raw_file]
+    
     output_raw_path = os.path.join(os.getcwd(), output_raw_file)
-    if os.path.exists(output_raw_path):
-        os.remove(output_raw_path)
-        print(f"[INFO] Удалил старый файл: {output_raw_file}")
+    raw_paths = [os.path.join(os.getcwd(), raw_file) for raw_file in dict.fromkeys([output_raw_file] + raw_files)]
+    prepare_raw_output(output_raw_path, raw_paths, date_settings, config.get("resume", False))
     
-    for batch_num, batch_areas in enumerate(batches, 1):
-        run_parser_for_batch(batch_areas, output_raw_file, batch_num, total_batches, date_settings)
+    # Пары трансформируются по мере записи в журналы, итог готов сразу после объединения
+    live_transform = None
+    if config.get("live_transform", True):
+        live_transform = LiveTransformProcess(
+            [os.path.join(os.getcwd(), raw_file) for raw_file in raw_files],
+            os.path.join(os.getcwd(), output_final_file),
+            config.get("tidy_output", []),
+        )
+        live_transform.start()
     
-    merge_raw_files(total_batches, output_raw_file, output_merged_file)
+    retry_config = config.get("retry", {})
+    if processes > 1:
+        run_batches_parallel(batches, output_raw_file, date_settings, processes, retry_config)
+    elif config.get("in_process", True):
+        if not run_batches_in_process(batches, output_raw_file, date_settings):
+            retry_with_backoff(
+                lambda: run_batches_in_process(batches, output_raw_file, date_settings, resume=True),
+                "Сессия парсера",
+                retry_config,
+            )
+    else:
+        failed_batches = [
+            (batch_num, batch_areas) for batch_num, batch_areas in enumerate(batches, 1)
+            if not run_parser_for_batch(batch_areas, output_raw_file, batch_num, total_batches, date_settings)
+        ]
+        for batch_num, batch_areas in failed_batches:
+            retry_with_backoff(
+                lambda: run_parser_for_batch(batch_areas, output_raw_file, batch_num, total_batches, date_settings, resume=True),
+                f"Батч {batch_num}",
+                retry_config,
+            )
+    
+    report_failed_units(raw_files)
     
-    if os.path.exists(output_merged_file):
-        with open(output_merged_file, "r", encoding="utf-8") as f:
-            merged = json.load(f)
-        with open(output_raw_file, "w", encoding="utf-8") as f:
-            json.dump(merged, f, ensure_ascii=False, indent=2)
-        print(f"[OK] Скопировал {output_merged_file} в {output_raw_file}")
+    # Журналы батчей, упавших до финальной компакции, входят в объединение напрямую
+    merged_index = merge_raw_files(raw_files, output_merged_file)
     
-    transform_success = run_transform(output_final_file)
+    if live_transform is not None and live_transform.finish(merged_index):
+        transform_success = True
+    else:
+        transform_success = run_transform(
+            output_merged_file, output_final_file, int(config.get("transform_processes", 1)), config.get("tidy_output", [])
+        )
     
     print(f"\n{'='*70}")
     print(f"[FINISH] Завершено!")
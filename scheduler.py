@@ -0,0 +1,131 @@
+"""
+Планировщик батчей районов по ожидаемой стоимости.
+Стоимость района = сам район + его подрайоны (каждый обрабатывается отдельно), либо
+историческое время обработки из area_timings.jsonl, если оно известно. Батчи строятся
+жадно (LPT: самый дорогой район — в самый лёгкий батч), а процессы-воркеры забирают
+батчи из общей очереди по мере освобождения.
+"""
+
+import json
+import math
+import os
+from typing import Dict, Iterator, List, Optional
+
+TIMINGS_FILE = "area_timings.jsonl"
+TIMING_SMOOTHING = 0.5
+
+
+def load_area_hierarchy(areas_file: str) -> Dict[str, List[str]]:
+    """{район: [подрайоны]} из файла районов (подрайон — строка 'Район - Подрайон' после своего района)"""
+    areas_structure: Dict[str, List[str]] = {}
+    if not os.path.exists(areas_file):
+        return areas_structure
+    current_area = None
+    with open(areas_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if " - " in line:
+                area_part, subarea_part = line.split(" - ", 1)
+                if current_area and area_part == current_area:
+                    areas_structure[current_area].append(subarea_part)
+            else:
+                current_area = line
+                if current_area not in areas_structure:
+                    areas_structure[current_area] = []
+    return areas_structure
+
+
+def record_area_timing(area: str, seconds: float, dates_count: int) -> None:
+    """Дописывает время обработки района (вместе с подрайонами) в историю"""
+    line = json.dumps({"area": area, "seconds": round(seconds, 1), "dates": dates_count}, ensure_ascii=False)
+    with open(TIMINGS_FILE, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def load_area_timings() -> Dict[str, float]:
+    """Сглаженное время обработки района в секундах на одну дату"""
+    timings: Dict[str, float] = {}
+    if not os.path.exists(TIMINGS_FILE):
+        return timings
+    with open(TIMINGS_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                per_date = float(entry["seconds"]) / max(1, int(entry.get("dates", 1)))
+            except (ValueError, KeyError, TypeError):
+                continue
+            area = entry["area"]
+            if area in timings:
+                timings[area] = TIMING_SMOOTHING * per_date + (1 - TIMING_SMOOTHING) * timings[area]
+            else:
+                timings[area] = per_date
+    return timings
+
+
+def estimate_costs(
+    areas: List[str],
+    areas_structure: Dict[str, List[str]],
+    timings: Optional[Dict[str, float]] = None,
+) -> Dict[str, float]:
+    """Ожидаемая стоимость районов. Районы без истории оцениваются по числу подрайонов,
+    переведённому в секунды средним временем на единицу у районов с историей"""
+    timings = timings or {}
+    units = {area: 1 + len(areas_structure.get(area, [])) for area in areas}
+    known = [area for area in areas if area in timings]
+    seconds_per_unit = 1.0
+    if known:
+        seconds_per_unit = sum(timings[area] for area in known) / sum(units[area] for area in known)
+    return {area: timings.get(area, units[area] * seconds_per_unit) for area in areas}
+
+
+def build_batches(areas: List[str], costs: Dict[str, float], batches_count: int) -> List[List[str]]:
+    """Делит районы на batches_count батчей примерно равной стоимости (LPT).
+    Батчи возвращаются от самого дорогого к самому дешёвому"""
+    batches_count = max(1, min(batches_count, len(areas)))
+    batches: List[List[str]] = [[] for _ in range(batches_count)]
+    loads = [0.0] * batches_count
+    for area in sorted(areas, key=lambda a: costs.get(a, 1.0), reverse=True):
+        lightest = loads.index(min(loads))
+        batches[lightest].append(area)
+        loads[lightest] += costs.get(area, 1.0)
+    order = sorted(range(batches_count), key=lambda i: loads[i], reverse=True)
+    return [batches[i] for i in order if batches[i]]
+
+
+def get_batches_count(areas_structure: Dict[str, List[str]], batch_size: int) -> int:
+    """Число батчей как при нарезке файла по batch_size строк (район + подрайоны)"""
+    total_lines = sum(1 + len(subareas) for subareas in areas_structure.values())
+    return max(1, math.ceil(total_lines / max(1, batch_size)))
+
+
+def write_batch_queue(queue_dir: str, batches: List[List[str]]) -> None:
+    """Кладёт батчи в очередь-папку: по файлу на батч, порядок имён = порядок выдачи"""
+    os.makedirs(queue_dir, exist_ok=True)
+    for index, batch in enumerate(batches, 1):
+        with open(os.path.join(queue_dir, f"{index:04d}.json"), "w", encoding="utf-8") as f:
+            json.dump(batch, f, ensure_ascii=False)
+
+
+def claim_batches(queue_dir: str, worker_label: str) -> Iterator[List[str]]:
+    """Выдаёт батчи из общей очереди, пока она не опустеет. Файл батча забирается
+    атомарным переименованием, поэтому каждый батч достаётся ровно одному процессу"""
+    while True:
+        pending = sorted(
+            name for name in os.listdir(queue_dir)
+            if name.endswith(".json") and not name.startswith("claimed_")
+        )
+        if not pending:
+            return
+        for name in pending:
+            claimed_path = os.path.join(queue_dir, f"claimed_{worker_label}_{name}")
+            try:
+                os.rename(os.path.join(queue_dir, name), claimed_path)
+            except OSError:
+                continue
+            with open(claimed_path, "r", encoding="utf-8") as f:
+                batch: List[str] = json.load(f)
+            print(f"[QUEUE] {worker_label} забрал батч {name} ({len(batch)} районов)")
+            yield batch
+            break
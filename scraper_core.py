@@ -0,0 +1,452 @@
+"""
+Асинхронное ядро для всех парсеров Reidin (playwright async API).
+Общие шаги: логин, ожидание Power BI, поиск элементов по странице и фреймам,
+работа со слайсерами и экспорт визуализаций. Поиск по фреймам идёт параллельно,
+поэтому один процесс может вести несколько страниц без потоков.
+"""
+
+import asyncio
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+BASE_URL = "https://insight.reidin.com/"
+LOGIN_URL = "https://insight.reidin.com/auth/login"
+STATE_FILE = "state.json"
+LOGIN_FORM_SELECTOR = '#input-emaillogin-desktop'
+
+SELECT_ALL_TITLES = ("Выбрать все", "Select all")
+SELECT_ALL_SELECTOR = 'div[title="Выбрать все"], div[title="Select all"]'
+POPUP_SELECTOR = 'div.slicer-dropdown-popup.focused'
+MORE_OPTIONS_SELECTOR = 'button[aria-label="Дополнительные параметры"], button[aria-label="More options"]'
+EXPORT_DATA_SELECTOR = 'button[title="Экспортировать данные"], button[title="Export data"]'
+EXPORT_BUTTON_SELECTOR = 'button[aria-label="Экспортировать"], button[aria-label="Export"]'
+SLICER_ITEM_SELECTOR = 'div.scrollRegion div.slicerItemContainer'
+QUERY_TIMEOUT_MS = 15000
+
+
+def load_config() -> Dict[str, Any]:
+    config_file = os.path.join(os.getcwd(), "config.json")
+    if not os.path.exists(config_file):
+        print("[ERROR] config.json не найден")
+        return {}
+    with open(config_file, "r", encoding="utf-8") as f:
+        config: Dict[str, Any] = json.load(f)
+    return config
+
+
+def dropdown_selector(label: str, partial: bool = False) -> str:
+    """Селектор выпадающего слайсера по aria-label"""
+    op = "*=" if partial else "="
+    return f'div.slicer-dropdown-menu[aria-label{op}"{label}"]'
+
+
+async def find_locator(page: Any, selector: str) -> Optional[Any]:
+    """Ищет элемент на странице, затем во всех фреймах (count() по фреймам выполняются параллельно)"""
+    locator = page.locator(selector)
+    if await locator.count() > 0:
+        return locator
+    frame_locators = [frame.locator(selector) for frame in page.frames]
+    counts = await asyncio.gather(*(loc.count() for loc in frame_locators), return_exceptions=True)
+    for loc, count in zip(frame_locators, counts):
+        if isinstance(count, int) and count > 0:
+            return loc
+    return None
+
+
+async def wait_for_locator(page: Any, selector: str, timeout: int = 10000) -> Optional[Any]:
+    """Ждёт появления элемента на странице или в любом фрейме (None по таймауту)"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout / 1000
+    while True:
+        locator = await find_locator(page, selector)
+        if locator is not None or loop.time() >= deadline:
+            return locator
+        await asyncio.sleep(0.1)
+
+
+async def wait_for_state(locator: Any, state: str = "visible", timeout: int = 10000) -> bool:
+    """Ждёт состояния элемента (visible/hidden/attached), False по таймауту"""
+    try:
+        await locator.wait_for(state=state, timeout=timeout)
+        return True
+    except Exception:
+        return False
+
+
+def is_query_response(response: Any) -> bool:
+    return "/query" in response.url
+
+
+async def click_and_wait_query(page: Any, locator: Any, timeout: int = QUERY_TIMEOUT_MS) -> bool:
+    """Кликает и ждёт ответ Power BI /query, вызванный кликом.
+    False — ответа не было (например, значение уже выбрано); ошибка самого клика не глотается"""
+    clicked = False
+    try:
+        async with page.expect_response(is_query_response, timeout=timeout):
+            await locator.click()
+            clicked = True
+    except Exception:
+        if not clicked:
+            raise
+        return False
+    return True
+
+
+async def settle(page: Any, idle_timeout: int = 5000) -> None:
+    """Ожидание networkidle после смены фильтра (визуализации догружают данные)"""
+    try:
+        await page.wait_for_load_state("networkidle", timeout=idle_timeout)
+    except Exception:
+        pass
+
+
+async def close_popup(page: Any, popup: Optional[Any] = None, timeout: int = 5000) -> None:
+    """Escape и ожидание, пока открытый popup слайсера скроется"""
+    if popup is None:
+        popup = await get_visible_popup(page)
+    await page.keyboard.press("Escape")
+    if popup is not None:
+        await wait_for_state(popup, "hidden", timeout)
+
+
+async def login(page: Any, context: Any, device_id: str, username: str, password: str) -> None:
+    """Логин на insight.reidin.com с установкой deviceId, сохраняет state.json"""
+    await page.goto(LOGIN_URL, wait_until="load", timeout=60000)
+    print("[OK] Страница логина открыта")
+
+    await page.evaluate(f"localStorage.setItem('deviceId', '{device_id}');")
+    print("[OK] device_id установлен")
+
+    await page.fill(LOGIN_FORM_SELECTOR, username)
+    await page.fill('#input-passwordlogin-desktop', password)
+
+    await page.locator('xpath=//input[@id="input-emaillogin-desktop"]/ancestor::form[1]//button[@type="submit"]').click()
+
+    try:
+        await page.wait_for_load_state("networkidle", timeout=60000)
+    except Exception:
+        print("[WARNING] Timeout после логина, продолжаю...")
+        try:
+            await page.wait_for_url(lambda url: "/auth/login" not in url, timeout=10000)
+        except Exception:
+            print("[WARNING] Страница логина не закрылась")
+
+    await context.storage_state(path=STATE_FILE)
+    print("[OK] Авторизация успешна. state.json сохранён.")
+
+
+async def is_session_valid(page: Any) -> bool:
+    """Открывает сайт и проверяет, что не произошёл редирект на форму логина"""
+    try:
+        await page.goto(BASE_URL, wait_until="load", timeout=60000)
+        try:
+            await page.wait_for_load_state("networkidle", timeout=5000)
+        except Exception:
+            pass
+        if "/auth/login" in page.url:
+            return False
+        login_forms: int = await page.locator(LOGIN_FORM_SELECTOR).count()
+        return login_forms == 0
+    except Exception as e:
+        print(f"[WARNING] Не удалось проверить сессию: {e}")
+        return False
+
+
+async def open_session(browser: Any, device_id: str, username: str, password: str) -> Tuple[Any, Any]:
+    """Контекст и страница с сессией из state.json; логин выполняется, только если сессия отклонена"""
+    if os.path.exists(STATE_FILE):
+        try:
+            context = await browser.new_context(storage_state=STATE_FILE)
+        except Exception as e:
+            print(f"[WARNING] Не удалось загрузить state.json: {e}")
+        else:
+            page = await context.new_page()
+            if await is_session_valid(page):
+                print("[OK] Сессия из state.json действительна, логин пропущен")
+                return context, page
+            print("[INFO] Сессия из state.json отклонена, выполняю логин...")
+            await context.close()
+
+    context = await browser.new_context()
+    page = await context.new_page()
+    await login(page, context, device_id, username, password)
+    return context, page
+
+
+async def wait_for_powerbi(page: Any, max_wait: int = 30) -> bool:
+    """Ждёт появления слайсеров Power BI в любом фрейме"""
+    print("[>>] Жду загрузки элементов Power BI...")
+    slicers = await wait_for_locator(page, 'div.slicer-dropdown-menu', timeout=max_wait * 1000)
+    if slicers is not None and await wait_for_state(slicers.first, "visible"):
+        print("[OK] Элементы загружены")
+        return True
+    print(f"[WARNING] Элементы не загрузились за {max_wait} секунд, но продолжаю...")
+    return False
+
+
+async def open_export_dashboard(page: Any, url: str) -> None:
+    """Открывает дашборд экспорта и ждёт готовности слайсеров"""
+    try:
+        await page.goto(url, timeout=60000)
+    except Exception:
+        print("[WARNING] Timeout при загрузке dashboard, продолжаю...")
+
+    print("[OK] Dashboard открыт")
+
+    try:
+        await page.wait_for_load_state("networkidle", timeout=10000)
+    except Exception:
+        print("[WARNING] Timeout ожидания networkidle, продолжаю...")
+
+    await wait_for_powerbi(page)
+    await settle(page)
+    print("[OK] Dashboard готов к работе")
+
+
+async def get_visible_popup(page: Any) -> Optional[Any]:
+    """Открытый (display: block) popup слайсера"""
+    all_popups = await find_locator(page, POPUP_SELECTOR)
+    if all_popups is None:
+        return None
+    for i in range(await all_popups.count()):
+        popup = all_popups.nth(i)
+        display_style = await popup.evaluate('el => window.getComputedStyle(el).display')
+        if display_style == 'block':
+            return popup
+    return None
+
+
+async def get_controlled_popup(page: Any, dropdown: Any) -> Optional[Any]:
+    """Popup слайсера по aria-controls, иначе первый сфокусированный popup"""
+    popup_id = await dropdown.first.get_attribute('aria-controls')
+    if popup_id:
+        popup = await find_locator(page, f'#{popup_id}')
+        if popup is not None:
+            return popup.first
+    all_popups = await find_locator(page, POPUP_SELECTOR)
+    if all_popups is not None:
+        return all_popups.first
+    return None
+
+
+async def list_popup_titles(popup: Optional[Any]) -> List[str]:
+    """Заголовки элементов popup слайсера без 'Выбрать все'"""
+    titles: List[str] = []
+    if popup is None:
+        return titles
+    scroll_region = popup.locator('div.scrollRegion')
+    if await scroll_region.count() == 0:
+        return titles
+    all_rows = scroll_region.locator('div.row')
+    for i in range(await all_rows.count()):
+        slicer_item = all_rows.nth(i).locator('div.slicerItemContainer')
+        if await slicer_item.count() > 0:
+            title = await slicer_item.first.get_attribute('title')
+            if title and title not in SELECT_ALL_TITLES:
+                titles.append(title)
+    return titles
+
+
+async def click_popup_item(page: Any, popup: Optional[Any], title: str, label: str) -> bool:
+    """Кликает по элементу слайсера с заданным title"""
+    if popup is not None:
+        scroll_region = popup.locator('div.scrollRegion')
+    else:
+        scroll_region = await find_locator(page, 'div.scrollRegion')
+        if scroll_region is None:
+            return False
+    all_rows = scroll_region.locator('div.row')
+    for i in range(await all_rows.count()):
+        slicer_item = all_rows.nth(i).locator('div.slicerItemContainer')
+        if await slicer_item.count() > 0:
+            if await slicer_item.first.get_attribute('title') == title:
+                print(f"[>>] Кликаю по {label}: {title}")
+                await click_and_wait_query(page, slicer_item.first)
+                return True
+    return False
+
+
+async def reset_popup_selection(page: Any, popup: Any) -> None:
+    """Двойной клик по 'Выбрать все' снимает все выделения в popup"""
+    select_all = popup.locator('div.slicerItemContainer[title="Выбрать все"], div.slicerItemContainer[title="Select all"]')
+    if await select_all.count() == 0:
+        return
+    print("[>>] Снимаю все выделения...")
+    try:
+        await click_and_wait_query(page, select_all.first)
+        await click_and_wait_query(page, select_all.first)
+    except Exception as e:
+        print(f"[WARN] Не удалось снять выделения: {e}")
+
+
+async def open_dropdown(page: Any, selector: str, timeout: int = 10000) -> Optional[Any]:
+    """Находит слайсер, открывает его и ждёт отрисовки элементов popup"""
+    dropdown = await find_locator(page, selector)
+    if dropdown is None:
+        return None
+    await dropdown.first.click()
+    popup = await get_controlled_popup(page, dropdown)
+    if popup is None or not await wait_for_state(popup.locator(SLICER_ITEM_SELECTOR).first, "visible", timeout):
+        print("[WARNING] Элементы слайсера не появились")
+    return dropdown
+
+
+async def list_dropdown_values(page: Any, selector: str, timeout: int = 10000) -> Optional[List[str]]:
+    """Список значений слайсера (None, если слайсер не найден)"""
+    if await open_dropdown(page, selector, timeout) is None:
+        return None
+    popup = await get_visible_popup(page)
+    values = await list_popup_titles(popup)
+    await close_popup(page, popup)
+    return values
+
+
+async def select_dropdown_value(page: Any, selector: str, title: str, label: str, reset: bool = False, timeout: int = 10000) -> bool:
+    """Выбирает одно значение в слайсере и ждёт ответа /query и обновления визуализаций.
+    reset=True: popup по aria-controls и снятие всех выделений перед кликом"""
+    dropdown = await open_dropdown(page, selector, timeout)
+    if dropdown is None:
+        print(f"[ERROR] Слайсер для {label} не найден")
+        return False
+
+    if reset:
+        popup = await get_controlled_popup(page, dropdown)
+        if popup is None:
+            print(f"[ERROR] Popup для {label} не найден")
+            await close_popup(page)
+            return False
+        await reset_popup_selection(page, popup)
+    else:
+        popup = await get_visible_popup(page)
+
+    if not await click_popup_item(page, popup, title, label):
+        print(f"[ERROR] Не удалось кликнуть по {label}: {title}")
+        await close_popup(page, popup)
+        return False
+
+    await close_popup(page, popup)
+    await settle(page)
+    return True
+
+
+async def select_all_in_dropdown(page: Any, selector: str, name: str) -> bool:
+    """Открывает слайсер, нажимает 'Выбрать все' и закрывает его"""
+    print(f"\n[>>] Ищу {name} dropdown...")
+    dropdown = await find_locator(page, selector)
+    if dropdown is None:
+        print(f"[ERROR] {name} dropdown не найден")
+        return False
+
+    print(f"[>>] Кликаю по {name} dropdown...")
+    await dropdown.first.click()
+    print("[OK] Клик выполнен")
+
+    print("\n[>>] Ищу кнопку 'Выбрать все'...")
+    select_all = await wait_for_locator(page, SELECT_ALL_SELECTOR)
+    if select_all is None:
+        print("[ERROR] Кнопка 'Выбрать все' не найдена")
+        return False
+
+    print("[>>] Кликаю 'Выбрать все'...")
+    await click_and_wait_query(page, select_all.first)
+    print("[OK] Клик выполнен")
+
+    print(f"\n[>>] Закрываю {name} dropdown...")
+    await close_popup(page)
+    print("[OK] Dropdown закрыт")
+    return True
+
+
+async def set_start_date(page: Any, date_str: str) -> bool:
+    """Устанавливает поле 'Дата начала' слайсера дат"""
+    print(f"\n[>>] Устанавливаю дату начала: {date_str}...")
+    date_start_input = await find_locator(page, 'input[aria-label^="Дата начала"]')
+    if date_start_input is None:
+        print("[WARNING] Поле 'Дата начала' не найдено")
+        return False
+    await date_start_input.first.fill(date_str)
+    try:
+        async with page.expect_response(is_query_response, timeout=QUERY_TIMEOUT_MS):
+            await date_start_input.first.press("Enter")
+    except Exception:
+        print("[WARNING] Нет ответа /query после смены даты, продолжаю...")
+    print(f"[OK] Дата начала установлена: {date_str}")
+    await settle(page)
+    return True
+
+
+async def download_visual(
+    page: Any,
+    viz_selector: str,
+    viz_name: str,
+    js_click: bool = False,
+    download_timeout: int = 30000,
+) -> Optional[Any]:
+    """Экспорт данных визуализации: клик по визуалу → '...' → 'Экспортировать данные' → 'Экспортировать'.
+    Возвращает объект скачивания playwright или None"""
+    print(f"[>>] Ищу визуализацию '{viz_name}'...")
+    table_viz = await find_locator(page, viz_selector)
+    if table_viz is None:
+        print(f"[ERROR] '{viz_name}' не найден")
+        return None
+
+    print(f"[>>] Кликаю по '{viz_name}'...")
+    await table_viz.first.click()
+    print("[OK] Клик выполнен")
+
+    print("[>>] Ищу кнопку 'Дополнительные параметры'...")
+    more_options = await wait_for_locator(page, MORE_OPTIONS_SELECTOR)
+    if more_options is None:
+        print("[ERROR] Кнопка 'Дополнительные параметры' не найдена")
+        return None
+
+    if js_click:
+        print("[>>] Кликаю 'Дополнительные параметры' (через JavaScript)...")
+        await more_options.first.evaluate("element => element.click()")
+    else:
+        print("[>>] Кликаю 'Дополнительные параметры'...")
+        await more_options.first.click()
+    print("[OK] Клик выполнен")
+
+    print("[>>] Ищу кнопку 'Экспортировать данные'...")
+    export_data = await wait_for_locator(page, EXPORT_DATA_SELECTOR)
+    if export_data is None:
+        print("[ERROR] Кнопка 'Экспортировать данные' не найдена")
+        return None
+
+    print("[>>] Кликаю 'Экспортировать данные'...")
+    await export_data.first.click()
+    print("[OK] Клик выполнен")
+
+    print("[>>] Ищу кнопку 'Экспортировать'...")
+    export_button = await wait_for_locator(page, EXPORT_BUTTON_SELECTOR)
+    if export_button is None:
+        print("[ERROR] Кнопка 'Экспортировать' не найдена")
+        return None
+
+    print("[>>] Кликаю 'Экспортировать' и ожидаю скачивания...")
+    async with page.expect_download(timeout=download_timeout) as download_info:
+        await export_button.first.click()
+
+    return await download_info.value
+
+
+async def export_visual_bytes(
+    page: Any,
+    viz_selector: str,
+    viz_name: str,
+    js_click: bool = False,
+    download_timeout: int = 30000,
+) -> Optional[bytes]:
+    """Экспорт визуализации в память: содержимое скачанного XLSX без копии в рабочей папке.
+    Playwright всегда кладёт скачивание во временный файл, он читается и сразу удаляется"""
+    download = await download_visual(page, viz_selector, viz_name, js_click, download_timeout)
+    if download is None:
+        return None
+    with open(await download.path(), "rb") as f:
+        data = f.read()
+    await download.delete()
+    print(f"[OK] Файл скачан в память: {download.suggested_filename} ({len(data)} байт)")
+
+    return data
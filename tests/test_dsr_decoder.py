@@ -0,0 +1,75 @@
+from dsr_decoder import decode_dataset, decode_secondary_labels
+
+
+def test_repeat_and_null_masks():
+    ds = {"PH": [{"DM0": [
+        {"S": [{"N": "G0"}, {"N": "M0"}, {"N": "M1"}], "C": ["Marina", 10, 1.5]},
+        # R: G0 повторяет предыдущую строку, C — только M0 и M1
+        {"R": 1, "C": [20, 2.5]},
+        # Ø: M1 пустая, R: G0 повторяется
+        {"R": 1, "Ø": 4, "C": [30]},
+        {"C": ["Bay", 40, 4.5]},
+    ]}]}
+    table = decode_dataset(ds)["DM0"]
+    assert table.columns == {
+        "G0": ["Marina", "Marina", "Marina", "Bay"],
+        "M0": [10, 20, 30, 40],
+        "M1": [1.5, 2.5, None, 4.5],
+    }
+    assert table.rows_count == 4
+
+
+def test_value_dicts_beyond_d0():
+    ds = {
+        "ValueDicts": {"D0": ["Apartment", "Villa"], "D1": ["Dubai Marina", "Business Bay", "JVC"]},
+        "PH": [{"DM0": [
+            {"S": [{"N": "G0", "DN": "D0"}, {"N": "G1", "DN": "D1"}, {"N": "M0"}], "C": [1, 2, 100]},
+            {"R": 1, "C": [0, 200]},
+            {"Ø": 2, "C": [0, 300]},
+        ]}],
+    }
+    table = decode_dataset(ds)["DM0"]
+    assert table.columns["G0"] == ["Villa", "Villa", "Apartment"]
+    assert table.columns["G1"] == ["JVC", "Dubai Marina", None]
+    assert table.columns["M0"] == [100, 200, 300]
+
+
+def test_multiple_ph_are_concatenated():
+    ds = {"PH": [
+        {"DM0": [{"S": [{"N": "G0"}, {"N": "M0"}], "C": ["2024", 1]}]},
+        {"DM0": [{"C": ["2025", 2]}, {"R": 1, "C": [3]}]},
+        {"DM1": [{"S": [{"N": "M0"}], "C": [99]}]},
+    ], "IC": True}
+    tables = decode_dataset(ds)
+    assert tables["DM0"].columns == {"G0": ["2024", "2025", "2025"], "M0": [1, 2, 3]}
+    assert tables["DM1"].columns == {"M0": [99]}
+    assert all(table.complete for table in tables.values())
+
+
+def test_incomplete_dataset():
+    rows = [{"S": [{"N": "G0"}], "C": ["a"]}]
+    assert decode_dataset({"PH": [{"DM0": rows}], "IC": False})["DM0"].complete is False
+    # Без IC неполнота определяется по токену продолжения RT
+    assert decode_dataset({"PH": [{"DM0": rows}], "RT": [["'a'"]]})["DM0"].complete is False
+    assert decode_dataset({"PH": [{"DM0": rows}]})["DM0"].complete is True
+    # IC в строке — управляющий ключ, не колонка
+    table = decode_dataset({"PH": [{"DM0": [{"S": [{"N": "G0"}], "C": ["a"], "IC": True}]}]})["DM0"]
+    assert table.columns == {"G0": ["a"]}
+
+
+def test_secondary_axis_cells_and_labels():
+    ds = {
+        "SH": [{"DM1": [{"S": [{"N": "G1"}], "C": ["1 BR"]}, {"C": ["2 BR"]}, {"Ø": 1}]}],
+        "PH": [{"DM0": [
+            {"S": [{"N": "G0"}], "C": ["Marina"], "X": [
+                {"S": [{"N": "M0"}], "C": [5]},
+                {"C": [6]},
+                {"I": 2, "Ø": 1},
+            ]},
+            {"C": ["Bay"], "X": [{"I": 1, "C": [7]}]},
+        ]}],
+    }
+    table = decode_dataset(ds)["DM0"]
+    assert table.columns == {"G0": ["Marina", "Bay"]}
+    assert table.cells == {"row": [0, 0, 0, 1], "I": [0, 1, 2, 1], "M0": [5, 6, None, 7]}
+    assert decode_secondary_labels(ds) == ["1 BR", "2 BR", ""]
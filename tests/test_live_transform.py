@@ -0,0 +1,21 @@
+import live_transform
+from live_transform import LiveTransform
+from raw_journal import append_entry, get_journal_path, merge_raw_streams
+
+
+def test_pair_in_several_raw_files_follows_merge_precedence(tmp_path, monkeypatch):
+    monkeypatch.setattr(live_transform, "transform_area", lambda area_key, requests, log=None: {"source": requests[0]["source"]})
+    w1 = str(tmp_path / "metrics_raw.w1.json")
+    w2 = str(tmp_path / "metrics_raw.w2.json")
+    live = LiveTransform([w1, w2], str(tmp_path / "final.json"))
+
+    append_entry(get_journal_path(w2), "01.01.2025", "Marina", [{"source": "w2"}])
+    live.poll()
+    # Более поздняя запись в более ранний файл не заменяет пару: при объединении побеждает w2
+    append_entry(get_journal_path(w1), "01.01.2025", "Marina", [{"source": "w1"}])
+    append_entry(get_journal_path(w1), "01.01.2025", "Bay", [{"source": "w1"}])
+    live.poll()
+
+    merged_index = merge_raw_streams([w1, w2], str(tmp_path / "merged.json"))
+    assert live.finish(merged_index)
+    assert live.result == {"01.01.2025": {"Marina": {"source": "w2"}, "Bay": {"source": "w1"}}}
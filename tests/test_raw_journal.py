@@ -0,0 +1,116 @@
+import json
+import os
+
+from raw_journal import (
+    append_entry,
+    compact_journal,
+    get_journal_path,
+    get_prev_journal_path,
+    load_raw_result,
+    merge_raw_streams,
+)
+
+
+def read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_append_entry_round_trip_later_entry_wins(tmp_path):
+    output_file = str(tmp_path / "metrics_raw.json")
+    journal_path = get_journal_path(output_file)
+
+    append_entry(journal_path, "01.01.2025", "Marina", [{"n": 1}])
+    append_entry(journal_path, "01.01.2025", "Bay", [{"n": 2}])
+    append_entry(journal_path, "01.01.2025", "Marina", [{"n": 3}])
+    append_entry(journal_path, "02.01.2025", "Дубай Марина", [])
+
+    assert load_raw_result(output_file) == {
+        "01.01.2025": {"Marina": [{"n": 3}], "Bay": [{"n": 2}]},
+        "02.01.2025": {"Дубай Марина": []},
+    }
+
+
+def test_truncated_last_line_is_skipped_and_append_continues(tmp_path):
+    output_file = str(tmp_path / "metrics_raw.json")
+    journal_path = get_journal_path(output_file)
+    append_entry(journal_path, "01.01.2025", "Marina", [{"n": 1}])
+    # Падение посреди записи: строка оборвана без перевода строки
+    with open(journal_path, "ab") as f:
+        f.write(b'{"date": "01.01.2025", "area": "Bay", "requ')
+
+    assert load_raw_result(output_file) == {"01.01.2025": {"Marina": [{"n": 1}]}}
+
+    append_entry(journal_path, "01.01.2025", "Bay", [{"n": 2}])
+    assert load_raw_result(output_file) == {"01.01.2025": {"Marina": [{"n": 1}], "Bay": [{"n": 2}]}}
+
+
+def test_compact_journal_over_snapshot(tmp_path):
+    output_file = str(tmp_path / "metrics_raw.json")
+    journal_path = get_journal_path(output_file)
+    append_entry(journal_path, "01.01.2025", "Marina", [{"n": 1}])
+    append_entry(journal_path, "01.01.2025", "Bay", [{"n": 2}])
+    assert compact_journal(output_file)
+    assert not (tmp_path / "metrics_raw.jsonl").exists()
+    assert os.path.exists(get_prev_journal_path(output_file))
+
+    # Второй журнал поверх снимка: повтор пары заменяет значение из снимка, оборванная строка пропускается
+    append_entry(journal_path, "01.01.2025", "Marina", [{"n": 3}])
+    append_entry(journal_path, "02.01.2025", "Marina", [{"n": 4}])
+    with open(journal_path, "ab") as f:
+        f.write(b'{"date": "02.01.2025", "area": "Bay"')
+    expected = {
+        "01.01.2025": {"Marina": [{"n": 3}], "Bay": [{"n": 2}]},
+        "02.01.2025": {"Marina": [{"n": 4}]},
+    }
+    assert load_raw_result(output_file) == expected
+
+    assert compact_journal(output_file)
+    assert read_json(output_file) == expected
+    assert load_raw_result(output_file) == expected
+    assert not compact_journal(output_file)
+
+
+def test_merge_later_source_wins_for_duplicate_pairs(tmp_path):
+    w1 = str(tmp_path / "metrics_raw.w1.json")
+    w2 = str(tmp_path / "metrics_raw.w2.json")
+    append_entry(get_journal_path(w1), "01.01.2025", "Marina", [{"source": "w1"}])
+    append_entry(get_journal_path(w1), "01.01.2025", "Bay", [{"source": "w1"}])
+    compact_journal(w1)
+    # Журнал w1 после компакции заменяет свой снимок
+    append_entry(get_journal_path(w1), "01.01.2025", "Bay", [{"source": "w1 journal"}])
+    append_entry(get_journal_path(w2), "01.01.2025", "Marina", [{"source": "w2"}])
+    append_entry(get_journal_path(w2), "02.01.2025", "Marina", [{"source": "w2"}])
+    output_file = str(tmp_path / "metrics_merged.json")
+
+    merged = merge_raw_streams([w1, w2], output_file)
+
+    expected = {
+        "01.01.2025": {"Marina": [{"source": "w2"}], "Bay": [{"source": "w1 journal"}]},
+        "02.01.2025": {"Marina": [{"source": "w2"}]},
+    }
+    assert read_json(output_file) == expected
+    assert {date_key: sorted(areas) for date_key, areas in merged.items()} == {
+        "01.01.2025": ["Bay", "Marina"],
+        "02.01.2025": ["Marina"],
+    }
+    # Объединённый файл — построчный снимок: его можно снова объединять
+    again_file = str(tmp_path / "again.json")
+    merge_raw_streams([output_file], again_file)
+    assert read_json(again_file) == expected
+
+
+def test_merge_leaves_old_format_input_unchanged(tmp_path):
+    old_file = tmp_path / "metrics_raw.w1.json"
+    old_data = {"01.01.2025": {"Marina": [{"request": {"n": 1}}]}, "02.01.2025": {}}
+    old_file.write_text(json.dumps(old_data, ensure_ascii=False, indent=2), encoding="utf-8")
+    before = old_file.read_bytes()
+    output_file = tmp_path / "metrics_merged.json"
+
+    merged = merge_raw_streams([str(old_file)], str(output_file))
+
+    assert old_file.read_bytes() == before
+    assert read_json(output_file) == old_data
+    assert merged == {"01.01.2025": ["Marina"], "02.01.2025": []}
+    # Временная построчная копия удалена
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["metrics_merged.json", "metrics_raw.w1.json"]
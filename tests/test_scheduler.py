@@ -0,0 +1,56 @@
+import threading
+
+from scheduler import build_batches, claim_batches, write_batch_queue
+
+
+def batch_costs(batches, costs):
+    return [sum(costs[area] for area in batch) for batch in batches]
+
+
+def test_build_batches_balances_cost():
+    costs = {"A": 7.0, "B": 6.0, "C": 5.0, "D": 4.0, "E": 3.0, "F": 2.0, "G": 1.0}
+
+    batches = build_batches(list(costs), costs, 2)
+
+    assert sorted(area for batch in batches for area in batch) == sorted(costs)
+    assert batch_costs(batches, costs) == [14.0, 14.0]
+    # Самый дорогой район идет первым в свой батч
+    assert batches[0][0] == "A"
+
+
+def test_build_batches_orders_from_most_expensive():
+    costs = {"Big": 10.0, "Mid": 4.0, "Small": 3.0, "Tiny": 1.0}
+
+    batches = build_batches(list(costs), costs, 3)
+
+    assert batches == [["Big"], ["Mid"], ["Small", "Tiny"]]
+    assert batch_costs(batches, costs) == sorted(batch_costs(batches, costs), reverse=True)
+
+
+def test_build_batches_never_returns_empty_batches():
+    costs = {"A": 1.0, "B": 1.0}
+
+    assert build_batches(list(costs), costs, 5) == [["A"], ["B"]]
+
+
+def test_claim_batches_gives_each_batch_to_one_worker(tmp_path):
+    queue_dir = str(tmp_path / "batch_queue")
+    batches = [[f"Area {i}"] for i in range(200)]
+    write_batch_queue(queue_dir, batches)
+    workers_count = 8
+    start = threading.Barrier(workers_count)
+    claimed = {}
+
+    def worker(label):
+        start.wait()
+        claimed[label] = list(claim_batches(queue_dir, label))
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(workers_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    all_claimed = [batch for worker_batches in claimed.values() for batch in worker_batches]
+    assert sorted(all_claimed) == sorted(batches)
+    assert len(all_claimed) == len(batches)
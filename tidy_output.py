@@ -0,0 +1,170 @@
+"""
+Плоский (tidy) итог трансформации рядом с вложенным JSON.
+Каждое значение метрики — строка (date, area, subarea, metric, sub_key, value):
+area и subarea — части ключа 'Район - Подрайон' (subarea пустой у самого района),
+sub_key — путь вложенных ключей метрики через "/" (пустой у скалярных метрик),
+value — число; пустые значения (None) не пишутся.
+Форматы:
+- sqlite — таблица metrics с индексами по (date, area) и (metric), стандартная библиотека;
+- parquet — через pyarrow (requirements.txt); runner.py не запускается, если parquet
+  включён, а pyarrow не установлен, при ручной трансформации формат пропускается с ошибкой.
+Файлы пишутся рядом с итоговым JSON под тем же именем (01.12.2025.sqlite,
+01.12.2025.parquet) по мере готовности районов, пачками по BATCH_ROWS строк.
+"""
+
+import os
+import sqlite3
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from raw_journal import replace_file
+
+TIDY_COLUMNS = ("date", "area", "subarea", "metric", "sub_key", "value")
+BATCH_ROWS = 50000
+
+TidyRow = Tuple[str, str, str, str, str, float]
+
+
+def split_area_key(area_key: str) -> Tuple[str, str]:
+    """'Район - Подрайон' -> (район, подрайон); для района подрайон пустой"""
+    area, _, subarea = area_key.partition(" - ")
+    return area, subarea
+
+
+def iter_metric_values(value: Any, sub_key: str = "") -> Iterator[Tuple[str, float]]:
+    """(путь вложенных ключей, число) для всех непустых значений метрики"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from iter_metric_values(item, f"{sub_key}/{key}" if sub_key else str(key))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield sub_key, float(value)
+
+
+def tidy_rows(date_key: str, area_key: str, area_data: Dict[str, Any]) -> Iterator[TidyRow]:
+    area, subarea = split_area_key(area_key)
+    for metric, value in area_data.items():
+        for sub_key, number in iter_metric_values(value):
+            yield date_key, area, subarea, metric, sub_key, number
+
+
+def get_tidy_path(output_file: str, tidy_format: str) -> str:
+    return os.path.splitext(output_file)[0] + "." + tidy_format
+
+
+class SqliteTidyWriter:
+    """Таблица metrics во временном файле; индексы строятся один раз в конце"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.conn = sqlite3.connect(self.tmp_path)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(
+            "CREATE TABLE metrics (date TEXT, area TEXT, subarea TEXT, metric TEXT, sub_key TEXT, value REAL)"
+        )
+
+    def write(self, rows: List[TidyRow]) -> None:
+        self.conn.executemany("INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def close(self) -> None:
+        self.conn.execute("CREATE INDEX metrics_date_area ON metrics (date, area, subarea)")
+        self.conn.execute("CREATE INDEX metrics_metric ON metrics (metric, sub_key)")
+        self.conn.commit()
+        self.conn.close()
+        replace_file(self.tmp_path, self.path)
+
+
+class ParquetTidyWriter:
+    """Parquet файл через pyarrow, одна группа строк на пачку"""
+
+    def __init__(self, path: str) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.schema = pa.schema([(name, pa.string()) for name in TIDY_COLUMNS[:-1]] + [("value", pa.float64())])
+        self.writer = pq.ParquetWriter(self.tmp_path, self.schema)
+
+    def write(self, rows: List[TidyRow]) -> None:
+        columns = list(zip(*rows))
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema,
+        ))
+
+    def close(self) -> None:
+        self.writer.close()
+        replace_file(self.tmp_path, self.path)
+
+
+WRITERS = {"sqlite": SqliteTidyWriter, "parquet": ParquetTidyWriter}
+
+
+class TidyOutput:
+    """Копит строки районов и пишет их пачками во все включённые форматы"""
+
+    def __init__(self, output_file: str, formats: Iterable[str]) -> None:
+        self.writers: Dict[str, Any] = {}
+        self.rows: List[TidyRow] = []
+        self.total_rows = 0
+        for tidy_format in formats:
+            if tidy_format not in WRITERS:
+                print(f"[WARNING] Неизвестный формат плоского итога {tidy_format!r}, пропускаю")
+                continue
+            path = get_tidy_path(output_file, tidy_format)
+            try:
+                self.writers[path] = WRITERS[tidy_format](path)
+            except ImportError as e:
+                print(f"[ERROR] Формат {tidy_format} недоступен ({e}), пропускаю")
+
+    def add(self, date_key: str, area_key: str, area_data: Dict[str, Any]) -> None:
+        if not self.writers:
+            return
+        self.rows.extend(tidy_rows(date_key, area_key, area_data))
+        if len(self.rows) >= BATCH_ROWS:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.rows:
+            for writer in self.writers.values():
+                writer.write(self.rows)
+            self.total_rows += len(self.rows)
+            self.rows = []
+
+    def close(self) -> None:
+        self.flush()
+        for path, writer in self.writers.items():
+            writer.close()
+            print(f"[OK] {path} создан ({self.total_rows} строк)")
+
+
+def check_tidy_formats(formats: Iterable[str]) -> List[str]:
+    """Ошибки настройки плоского итога: неизвестный формат или не установлена его библиотека"""
+    errors = []
+    for tidy_format in formats:
+        if tidy_format not in WRITERS:
+            errors.append(f"Неизвестный формат плоского итога {tidy_format!r} (доступны: {', '.join(WRITERS)})")
+        elif tidy_format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                errors.append("Формат parquet в tidy_output требует pyarrow: pip install pyarrow")
+    return errors
+
+
+def parse_tidy_formats(value: Optional[str]) -> List[str]:
+    """TRANSFORM_TIDY_FORMATS: форматы через запятую ('sqlite,parquet')"""
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def write_tidy_outputs(output_file: str, formats: Iterable[str], dates: Dict[str, Dict[str, Any]]) -> None:
+    """Плоский итог для уже готового {дата: {район: {метрики}}}"""
+    tidy_output = TidyOutput(output_file, formats)
+    for date_key, areas in dates.items():
+        for area_key, area_data in areas.items():
+            tidy_output.add(date_key, area_key, area_data)
+    tidy_output.close()
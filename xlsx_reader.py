@@ -0,0 +1,173 @@
+"""
+Чтение XLSX экспортов Power BI для convert_*.py: две строки заголовка визуала, затем таблица.
+Бэкенды (переменная окружения XLSX_READER, по умолчанию auto):
+- calamine — pandas.read_excel(engine="calamine"), если установлен python-calamine (самый быстрый);
+- openpyxl — потоковое чтение в read-only режиме: строки идут сразу значениями, без объектов
+  ячеек и разбора текста pandas, из строки берутся только нужные колонки;
+- pandas — прежний pandas.read_excel с движком по умолчанию.
+auto — calamine, если он установлен, иначе openpyxl.
+Все бэкенды дают тот же DataFrame, что pandas.read_excel(skiprows=2): пустые ячейки, ошибки
+и строки-пропуски ("N/A", "null", ...) — NaN, полностью пустые строки пропускаются, колонки
+дат — datetime.
+Источник — путь к файлу или поток байтов (io.BytesIO) скачанного в память экспорта.
+Сравнить бэкенды на своих файлах: python xlsx_reader.py export1.xlsx export2.xlsx
+"""
+
+import os
+import sys
+import time
+from typing import IO, Any, Callable, Dict, List, Optional, Union
+
+import pandas as pd
+
+SKIP_ROWS = 2
+# Ошибки Excel и строки, которые pandas.read_excel по умолчанию читает как NaN
+NA_STRINGS = {
+    "#NULL!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#N/A", "#N/A N/A", "#NA",
+    "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL",
+    "NaN", "None", "n/a", "nan", "null", "",
+}
+
+# Путь к файлу или поток байтов (экспорт, скачанный в память)
+Source = Union[str, IO[bytes]]
+
+
+def has_calamine() -> bool:
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def read_pandas(xlsx_file: Source, columns: Optional[List[str]], engine: Optional[str] = None) -> pd.DataFrame:
+    usecols = (lambda name: name in columns) if columns is not None else None
+    return pd.read_excel(xlsx_file, skiprows=SKIP_ROWS, usecols=usecols, engine=engine)
+
+
+def read_calamine(xlsx_file: Source, columns: Optional[List[str]]) -> pd.DataFrame:
+    return read_pandas(xlsx_file, columns, engine="calamine")
+
+
+def is_empty(value: Any) -> bool:
+    return value is None or value == ""
+
+
+def header_names(header: List[Any]) -> List[Any]:
+    """Имена колонок как у pandas: пустые — 'Unnamed: N', повторы — 'имя.1', 'имя.2'"""
+    names: List[Any] = []
+    seen: Dict[Any, int] = {}
+    for index, name in enumerate(header):
+        if is_empty(name):
+            name = f"Unnamed: {index}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        names.append(name)
+    return names
+
+
+def trim_row(row: Any) -> List[Any]:
+    """Строка без пустых ячеек в конце"""
+    values = list(row)
+    while values and is_empty(values[-1]):
+        values.pop()
+    return values
+
+
+def clean_value(value: Any) -> Any:
+    if value is None or (isinstance(value, str) and value in NA_STRINGS):
+        return float("nan")
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def read_openpyxl(xlsx_file: Source, columns: Optional[List[str]]) -> pd.DataFrame:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(xlsx_file, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+        for _ in range(SKIP_ROWS):
+            next(rows, None)
+        header = trim_row(next(rows, ()))
+        # Нужные колонки известны по заголовку, из остальных строк берутся только они
+        indices = None if columns is None else [
+            index for index, name in enumerate(header_names(header)) if name in columns
+        ]
+        data: List[List[Any]] = []
+        blank_rows = 0
+        width = len(header)
+        for row in rows:
+            row = trim_row(row)
+            if not row:
+                # Пустые строки внутри таблицы остаются строками NaN, в конце файла — отбрасываются
+                blank_rows += 1
+                continue
+            data.extend([] for _ in range(blank_rows))
+            blank_rows = 0
+            width = max(width, len(row))
+            data.append(row if indices is None else [row[index] if index < len(row) else None for index in indices])
+    finally:
+        workbook.close()
+
+    names = header_names(header + [None] * (width - len(header)))
+    if indices is None:
+        indices = list(range(width))
+    else:
+        width = len(indices)
+    records = [[clean_value(value) for value in row] + [float("nan")] * (width - len(row)) for row in data]
+    return pd.DataFrame(records, columns=[names[index] for index in indices])
+
+
+BACKENDS: Dict[str, Callable[[Source, Optional[List[str]]], pd.DataFrame]] = {
+    "calamine": read_calamine,
+    "openpyxl": read_openpyxl,
+    "pandas": read_pandas,
+}
+
+
+def get_backend_name(backend: Optional[str] = None) -> str:
+    backend = backend or os.environ.get("XLSX_READER") or "auto"
+    if backend == "auto":
+        return "calamine" if has_calamine() else "openpyxl"
+    if backend not in BACKENDS:
+        print(f"[WARNING] Неизвестный XLSX_READER {backend!r}, использую pandas")
+        return "pandas"
+    if backend == "calamine" and not has_calamine():
+        print(f"[WARNING] python-calamine не установлен, использую openpyxl")
+        return "openpyxl"
+    return backend
+
+
+def read_export(xlsx_file: Source, columns: Optional[List[str]] = None, backend: Optional[str] = None) -> pd.DataFrame:
+    """Таблица экспорта как pandas.read_excel(skiprows=2); columns — читать только эти колонки.
+    xlsx_file — путь или поток байтов (io.BytesIO)"""
+    return BACKENDS[get_backend_name(backend)](xlsx_file, columns)
+
+
+def benchmark_backends(xlsx_files: List[str]) -> None:
+    """Время чтения каждым доступным бэкендом и совпадение результата с pandas"""
+    for xlsx_file in xlsx_files:
+        print(f"\n[BENCH] {os.path.basename(xlsx_file)}")
+        expected = read_pandas(xlsx_file, None)
+        for name, reader in BACKENDS.items():
+            if name == "calamine" and not has_calamine():
+                print(f"  {name:9} не установлен")
+                continue
+            started = time.perf_counter()
+            df = reader(xlsx_file, None)
+            elapsed = time.perf_counter() - started
+            same = df.astype(object).equals(expected.astype(object)) and df.columns.tolist() == expected.columns.tolist()
+            print(f"  {name:9} {elapsed:7.2f} с, строк: {len(df)}, совпадает с pandas: {'да' if same else 'НЕТ'}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("[INFO] Использование: python xlsx_reader.py export1.xlsx [export2.xlsx ...]")
+        sys.exit(1)
+    benchmark_backends(sys.argv[1:])